@@ -0,0 +1,93 @@
+"""
+Serial vs micro-batched YOLO inference under concurrent load.
+
+Run from the backend folder (needs best.pt, or best.onnx with SOLIX_CV_BACKEND=onnx):
+    python benchmarks/bench_batch_inference.py --image some_roof.jpg --users 10 25 50
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.batch_inference import BatchInferenceServer
+from services.inference_backends import load_backend
+
+SETTINGS = {"augment": True, "imgsz": 1024, "conf": 0.15}
+
+
+def load_image(path):
+    if path:
+        return cv2.imread(path)
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, (256, 256, 3), dtype=np.uint8)
+
+
+def run_load(call, image, users, requests_per_user):
+    latencies = []
+    lock = threading.Lock()
+
+    def user():
+        for _ in range(requests_per_user):
+            t0 = time.perf_counter()
+            call(image)
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(users) as pool:
+        for _ in range(users):
+            pool.submit(user)
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / wall,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", default=None, help="Roof image (default: random noise)")
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 25, 50])
+    parser.add_argument("--requests", type=int, default=4, help="Requests per user")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--wait-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    backend = load_backend()
+    image = load_image(args.image)
+    backend.predict([image], **SETTINGS)  # Warm-up
+
+    # Current behaviour: one forward pass per request, one at a time
+    model_lock = threading.Lock()
+
+    def serial(img):
+        with model_lock:
+            return backend.predict([img], **SETTINGS)[0]
+
+    batcher = BatchInferenceServer(backend.predict, max_batch=args.batch, max_wait_ms=args.wait_ms)
+
+    def batched(img):
+        return batcher.predict(img, **SETTINGS)
+
+    print(f"{'users':>6} {'mode':>8} {'img/s':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for users in args.users:
+        for name, call in (("serial", serial), ("batched", batched)):
+            stats = run_load(call, image, users, args.requests)
+            print(f"{users:>6} {name:>8} {stats['throughput']:>8.2f} "
+                  f"{stats['p50_ms']:>9.0f} {stats['p95_ms']:>9.0f}")
+    if batcher.batches:
+        print(f"Average batch size: {batcher.images / batcher.batches:.1f}")
+
+
+if __name__ == "__main__":
+    main()
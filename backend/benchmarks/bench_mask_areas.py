@@ -0,0 +1,71 @@
+"""
+Per-object mask resize loop (old) vs the vectorized SolarVision.measure_objects.
+
+Run from the backend folder (no model needed):
+    python benchmarks/bench_mask_areas.py
+"""
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.cv_engine import SolarVision
+from services.inference_backends import Detections
+
+IMAGE_SHAPE = (256, 256, 3)  # One zoom-19 tile
+M_PER_PX = 0.3               # The old fixed 0.09 m^2 per pixel
+MASK_SIZES = [256, 1024]     # Proto resolution / imgsz (what both backends return)
+INSTANCES = [1, 10, 100]
+
+
+def make_detections(n, size, rng):
+    masks = np.zeros((n, size, size), dtype=bool)
+    boxes = np.zeros((n, 4))
+    for i in range(n):
+        x, y = rng.integers(0, size * 3 // 4, 2)
+        w, h = rng.integers(size // 16, size // 4, 2)
+        masks[i, y:y + h, x:x + w] = True
+        boxes[i] = np.array([x, y, x + w, y + h]) * IMAGE_SHAPE[0] / size
+    scores = np.sort(rng.uniform(0.15, 1.0, n))[::-1]
+    return Detections(masks, boxes, scores, np.zeros(n, int), {0: "roof"}, IMAGE_SHAPE[:2], None)
+
+
+def old_measure(detections, image_shape):
+    objects = []
+    for i, mask in enumerate(detections.masks):
+        mask_resized = cv2.resize(mask.astype(np.float32), (image_shape[1], image_shape[0]), interpolation=cv2.INTER_NEAREST)
+        pixel_area = np.sum(mask_resized)
+        objects.append({"id": i, "pixel_area": float(pixel_area), "estimated_m2": float(pixel_area) * M_PER_PX ** 2})
+    return objects
+
+
+def best_of(fn, repeats=20):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return result, best * 1000
+
+
+def main():
+    vision = SolarVision.__new__(SolarVision)  # measure_objects needs no model
+    rng = np.random.default_rng(0)
+    print(f"{'mask':>6} {'objects':>8} {'old ms':>8} {'new ms':>8} {'speedup':>8} {'old m2':>9} {'union m2':>9}")
+    for size in MASK_SIZES:
+        for n in INSTANCES:
+            detections = make_detections(n, size, rng)
+            old, old_ms = best_of(lambda: old_measure(detections, IMAGE_SHAPE))
+            new, new_ms = best_of(lambda: vision.measure_objects(detections, IMAGE_SHAPE, M_PER_PX))
+            old_total = sum(o["estimated_m2"] for o in old)
+            new_total = sum(o["estimated_m2"] for o in new)
+            print(f"{size:>6} {n:>8} {old_ms:>8.2f} {new_ms:>8.2f} {old_ms / new_ms:>7.1f}x "
+                  f"{old_total:>9.1f} {new_total:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Cost of the services/metrics.py instrumentation, on (SOLIX_METRICS=1) and off.
+
+An /api/analyze/full request goes through ~20 timers / counters, so the
+per-request cost is about 20x the per-call numbers below.
+
+Run from the backend folder:
+    python benchmarks/bench_metrics_overhead.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import metrics
+
+CALLS = 200_000
+CALLS_PER_REQUEST = 20
+
+
+def per_call_ns(fn):
+    best = float("inf")
+    for _ in range(5):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best / CALLS * 1e9
+
+
+def bare():
+    for _ in range(CALLS):
+        pass
+
+
+def timer():
+    for _ in range(CALLS):
+        with metrics.stage("bench"):
+            pass
+
+
+def counter():
+    for _ in range(CALLS):
+        metrics.CACHE_EVENTS.inc(cache="bench", result="hit")
+
+
+def main():
+    baseline = per_call_ns(bare)
+    print(f"{'metrics':>8} {'stage() ns':>11} {'inc() ns':>9} {'per request us':>15}")
+    for enabled in (False, True):
+        metrics.ENABLED = enabled  # Read on every call, so flipping it here is enough
+        stage_ns = per_call_ns(timer) - baseline
+        inc_ns = per_call_ns(counter) - baseline
+        request_us = CALLS_PER_REQUEST * max(stage_ns, inc_ns) / 1000
+        print(f"{'on' if enabled else 'off':>8} {stage_ns:>11.0f} {inc_ns:>9.0f} {request_us:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
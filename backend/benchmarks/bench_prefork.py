@@ -0,0 +1,143 @@
+"""
+Memory per worker and throughput scaling of serve.py (pre-fork workers).
+
+For each worker count: starts serve.py, waits for /health/ready, records
+the memory of the master and every worker, then sends roof analyses
+(uploaded image, no satellite / NASA calls needed once the irradiance
+grid exists) from concurrent clients and reports requests per second.
+
+Memory columns (from /proc via psutil):
+    RSS  resident pages, counting shared ones in full (overstates the total)
+    PSS  shared pages split between the processes sharing them (sums correctly)
+    USS  pages only this process has: what one more worker actually costs
+
+Run from the backend folder (needs best.pt, or best.onnx with SOLIX_CV_BACKEND=onnx):
+    python benchmarks/bench_prefork.py --workers 1 2 4 8 16 --image some_roof.jpg
+    python benchmarks/bench_prefork.py --workers 4 --no-preload   # Every worker loads its own models
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import httpx
+import numpy as np
+import psutil
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READY_TIMEOUT = 300
+
+
+def load_image(path):
+    if path:
+        image = cv2.imread(path)
+    else:
+        image = np.random.default_rng(0).integers(0, 255, (512, 512, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode(".jpg", image)
+    return encoded.tobytes()
+
+
+def start_server(port, workers, no_preload):
+    command = [sys.executable, "serve.py", "--port", str(port), "--workers", str(workers)]
+    if no_preload:
+        command.append("--no-preload")
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {server.returncode}")
+        try:
+            # Every worker answers /health/ready, so a few hits cover them all
+            if all(httpx.get(f"http://127.0.0.1:{port}/health/ready", timeout=2).status_code == 200
+                   for _ in range(workers * 2)):
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.kill()
+    raise RuntimeError("Server not ready in time")
+
+
+def memory(server):
+    """MB per process: (master, [workers]) as {rss, pss, uss} dicts."""
+    def info(process):
+        m = process.memory_full_info()
+        return {"rss": m.rss / 2**20, "pss": m.pss / 2**20, "uss": m.uss / 2**20}
+    master = psutil.Process(server.pid)
+    return info(master), [info(child) for child in master.children()]
+
+
+def run_load(port, image, clients, requests_per_client, profile):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    url = f"http://127.0.0.1:{port}/api/analyze/full"
+    form = {"district": "Colombo", "lat": "6.9271", "lon": "79.8612", "profile": profile}
+
+    def client():
+        nonlocal errors
+        with httpx.Client(timeout=300) as http:
+            for _ in range(requests_per_client):
+                t0 = time.perf_counter()
+                response = http.post(url, data=form, files={"file": ("roof.jpg", image, "image/jpeg")})
+                with lock:
+                    if response.status_code == 200:
+                        latencies.append(time.perf_counter() - t0)
+                    else:
+                        errors += 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        for _ in range(clients):
+            pool.submit(client)
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / wall,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else float("nan"),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--image", default=None, help="Roof image (default: random noise)")
+    parser.add_argument("--clients", type=int, default=0, help="Concurrent clients (default: 2 per worker)")
+    parser.add_argument("--requests", type=int, default=10, help="Requests per client")
+    parser.add_argument("--profile", default="fast")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--no-preload", action="store_true")
+    args = parser.parse_args()
+
+    image = load_image(args.image)
+    print(f"{os.cpu_count()} cores, preload={'off' if args.no_preload else 'on'}, profile={args.profile}")
+    print(f"{'workers':>7} {'master PSS':>10} {'worker RSS':>10} {'worker PSS':>10} {'worker USS':>10} "
+          f"{'total PSS':>9} {'req/s':>7} {'p50 ms':>7} {'errors':>6}")
+
+    for workers in args.workers:
+        server = start_server(args.port, workers, args.no_preload)
+        try:
+            clients = args.clients or 2 * workers
+            run_load(args.port, image, workers, 2, args.profile)  # First requests on each worker allocate buffers
+            result = run_load(args.port, image, clients, args.requests, args.profile)
+            master, children = memory(server)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+        def mean(key):
+            return sum(child[key] for child in children) / len(children)
+        total = master["pss"] + sum(child["pss"] for child in children)
+        print(f"{workers:>7} {master['pss']:>10.0f} {mean('rss'):>10.0f} {mean('pss'):>10.0f} {mean('uss'):>10.0f} "
+              f"{total:>9.0f} {result['throughput']:>7.2f} {result['p50_ms']:>7.0f} {result['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
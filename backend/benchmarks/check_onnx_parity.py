@@ -0,0 +1,94 @@
+"""
+Accuracy parity + latency: ONNX Runtime backend vs the PyTorch (ultralytics) path.
+
+Run from the backend folder after `python export_onnx.py [--int8]`:
+    python benchmarks/check_onnx_parity.py --images path/to/roof_images [--int8]
+
+Exits with status 1 if any image differs by more than the tolerances.
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.cv_engine import SolarVision
+from services.inference_backends import OnnxBackend, UltralyticsBackend
+
+AREA_TOLERANCE = 0.05   # 5% relative difference in total roof area
+MIN_UNION_IOU = 0.90    # Overlap of the combined roof masks
+M_PER_PX = 0.3          # Same scale for both; only the ratio matters
+
+
+def union_mask(detections, shape):
+    if len(detections) == 0:
+        return np.zeros(shape, dtype=bool)
+    union = detections.masks.any(axis=0).astype(np.uint8)
+    return cv2.resize(union, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST) > 0
+
+
+def timed_predict(backend, img, settings, runs):
+    backend.predict([img], **settings)  # Warm-up
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        detections = backend.predict([img], **settings)[0]
+    return detections, (time.perf_counter() - t0) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", required=True, help="Folder of roof images")
+    parser.add_argument("--int8", action="store_true", help="Check best.int8.onnx instead")
+    parser.add_argument("--imgsz", type=int, default=1024)
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per image")
+    args = parser.parse_args()
+
+    # ONNX first: its cold start must not benefit from torch already being imported
+    t0 = time.perf_counter()
+    onnx = OnnxBackend(int8=args.int8)
+    onnx_cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    torch_backend = UltralyticsBackend()
+    torch_cold = time.perf_counter() - t0
+    print(f"Cold start: ultralytics {torch_cold:.2f}s | onnx {onnx_cold:.2f}s")
+
+    vision_torch = SolarVision(backend=torch_backend)
+    vision_onnx = SolarVision(backend=onnx)
+    settings = {"imgsz": args.imgsz, "augment": False, "conf": 0.15}
+
+    files = sorted(f for f in os.listdir(args.images) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    failures = 0
+    torch_ms, onnx_ms = [], []
+    for name in files:
+        img = cv2.imread(os.path.join(args.images, name))
+        det_torch, ms_torch = timed_predict(torch_backend, img, settings, args.runs)
+        det_onnx, ms_onnx = timed_predict(onnx, img, settings, args.runs)
+        torch_ms.append(ms_torch)
+        onnx_ms.append(ms_onnx)
+
+        area_torch = sum(o["estimated_m2"] for o in vision_torch.measure_objects(det_torch, img.shape, M_PER_PX))
+        area_onnx = sum(o["estimated_m2"] for o in vision_onnx.measure_objects(det_onnx, img.shape, M_PER_PX))
+        rel_diff = abs(area_onnx - area_torch) / max(area_torch, 1e-6) if area_torch or area_onnx else 0.0
+
+        a, b = union_mask(det_torch, img.shape[:2]), union_mask(det_onnx, img.shape[:2])
+        union = np.logical_or(a, b).sum()
+        iou = np.logical_and(a, b).sum() / union if union else 1.0
+
+        ok = rel_diff <= AREA_TOLERANCE and iou >= MIN_UNION_IOU
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {name}: {len(det_torch)} vs {len(det_onnx)} objects | "
+              f"area {area_torch:.1f} vs {area_onnx:.1f} m2 ({rel_diff:.1%}) | IoU {iou:.3f} | "
+              f"{ms_torch:.0f} ms vs {ms_onnx:.0f} ms")
+
+    if files:
+        print(f"Mean latency: ultralytics {np.mean(torch_ms):.0f} ms | onnx {np.mean(onnx_ms):.0f} ms")
+    print(f"{len(files) - failures}/{len(files)} images within tolerance")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
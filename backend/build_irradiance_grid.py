@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from services.irradiance_store import GRID_PATH, grid_axes, parse_nasa_climatology, save_grid
+from services.solar_engine import NASA_POWER_URL
+
+# --- SETTINGS ---
+# Set NASA_POWER_URL to a local stand-in (nasa_standin.py) to build the grid without internet.
+MAX_PARALLEL_REQUESTS = 4  # Be polite to the NASA POWER API
+
+
+def fetch_point(session, lat, lon, url=NASA_POWER_URL):
+    params = {
+        "parameters": "ALLSKY_SFC_SW_DWN",
+        "community": "RE",
+        "longitude": float(lon),
+        "latitude": float(lat),
+        "format": "JSON"
+    }
+    for attempt in range(3):
+        try:
+            response = session.get(url, params=params, timeout=30)
+            response.raise_for_status()
+            return parse_nasa_climatology(response.json())
+        except Exception as e:
+            print(f"   ⚠️ ({lat}, {lon}) attempt {attempt + 1} failed: {e}")
+            time.sleep(2 ** attempt)
+    return None
+
+
+def build_grid(path=GRID_PATH, url=NASA_POWER_URL):
+    """Fetches every grid point and saves the grid; False (nothing saved) if no point could be fetched."""
+    print("🚀 STARTING: Building offline irradiance grid for Sri Lanka...")
+    lats, lons = grid_axes()
+    values = np.full((len(lats), len(lons), 13), np.nan, dtype=np.float32)
+    points = [(i, j) for i in range(len(lats)) for j in range(len(lons))]
+    print(f"📡 Fetching {len(points)} grid points from {url}")
+
+    with requests.Session() as session, ThreadPoolExecutor(MAX_PARALLEL_REQUESTS) as pool:
+        results = pool.map(lambda p: fetch_point(session, lats[p[0]], lons[p[1]], url), points)
+        for (i, j), result in zip(points, results):
+            if result is not None:
+                values[i, j] = result
+
+    missing = int(np.isnan(values[..., -1]).sum())
+    if missing == len(points):
+        print("❌ No grid point could be fetched (offline?). Grid not saved.")
+        return False
+    if missing:
+        print(f"   ⚠️ {missing} points missing (they fall back to the live API + cache).")
+
+    save_grid(path, lats, lons, values)
+    print(f"✅ SUCCESS! Grid saved at 'backend/{path}' ({values.nbytes // 1024} KB)")
+    return True
+
+
+if __name__ == "__main__":
+    build_grid()
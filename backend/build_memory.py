@@ -1,5 +1,9 @@
+import argparse
+import hashlib
+import json
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
@@ -23,56 +27,178 @@ URLS_TO_SCRAPE = [
 
 DATA_FOLDER = "knowledge_base"
 DB_PATH = "chroma_db"
+# What is in the store: source -> content hash + chunk ids (lets a rebuild touch only what changed)
+MANIFEST_PATH = os.path.join(DB_PATH, "solix_manifest.json")
 
-def build_database():
-    print("🚀 STARTING: Building AI Memory (Local CPU Mode)...")
-    
-    documents = []
-
-    # --- PART A: LOAD PDFs ---
-    if os.path.exists(DATA_FOLDER):
-        pdf_files = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.pdf')]
-        print(f"📂 Found {len(pdf_files)} PDF files.")
-        for pdf in pdf_files:
-            try:
-                loader = PyPDFLoader(os.path.join(DATA_FOLDER, pdf))
-                documents.extend(loader.load())
-            except Exception as e:
-                print(f"   ❌ Skipped {pdf}: {e}")
-    
-    # --- PART B: LOAD URLs ---
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+EMBED_BATCH = int(os.getenv("SOLIX_EMBED_BATCH", "64"))
+PDF_WORKERS = int(os.getenv("SOLIX_INGEST_WORKERS", str(os.cpu_count() or 2)))  # PDF parsing processes
+SCRAPE_WORKERS = 8
+
+# Chunk ids depend on these: changing any of them means a full rebuild
+STORE_SETTINGS = {"embedding_model": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _split(documents):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return splitter.split_documents(documents)
+
+def chunk_ids(source, chunks):
+    """Content-addressed ids: the same text from the same source always gets the same id."""
+    ids, seen = [], {}
+    for chunk in chunks:
+        base = _sha256(f"{source}\0{chunk.page_content}".encode("utf-8"))[:32]
+        # Repeated text (page headers etc.) within one source still needs unique ids
+        seen[base] = seen.get(base, -1) + 1
+        ids.append(base if seen[base] == 0 else f"{base}-{seen[base]}")
+    return ids
+
+def _load_pdf(path):
+    """Runs in a worker process: parsing + splitting is the CPU-heavy part."""
+    return _split(PyPDFLoader(path).load())
+
+def _scrape(url):
+    try:
+        return url, WebBaseLoader(url).load()
+    except Exception as e:
+        print(f"   ❌ Skipped {url}: {e}")
+        return url, None
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable manifest: {e}")
+        return None
+
+def save_manifest(manifest):
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def collect_pdfs(known):
+    """
+    PDF sources as {source: (hash, chunks or None)}. Unchanged files (same
+    content hash as in the manifest) are not parsed at all: chunks = None.
+    """
+    if not os.path.exists(DATA_FOLDER):
+        return {}
+    pdf_files = sorted(f for f in os.listdir(DATA_FOLDER) if f.endswith('.pdf'))
+    print(f"📂 Found {len(pdf_files)} PDF files.")
+
+    sources, to_parse = {}, {}
+    for pdf in pdf_files:
+        path = os.path.join(DATA_FOLDER, pdf)
+        with open(path, "rb") as f:
+            digest = _sha256(f.read())
+        source = f"pdf:{pdf}"
+        if known.get(source, {}).get("hash") == digest:
+            sources[source] = (digest, None)
+        else:
+            to_parse[source] = (digest, path)
+
+    if to_parse:
+        print(f"   - Parsing {len(to_parse)} new/changed PDFs on {PDF_WORKERS} processes...")
+        with ProcessPoolExecutor(max_workers=min(PDF_WORKERS, len(to_parse))) as pool:
+            futures = {source: pool.submit(_load_pdf, path) for source, (_, path) in to_parse.items()}
+            for source, future in futures.items():
+                try:
+                    sources[source] = (to_parse[source][0], future.result())
+                except Exception as e:
+                    print(f"   ❌ Skipped {source[4:]}: {e}")
+                    if source in known:
+                        sources[source] = (known[source]["hash"], None)  # Keep the old version
+    return sources
+
+def collect_urls(known):
+    """Same as collect_pdfs for the websites (scraped concurrently, hashed after scraping)."""
     print(f"🌐 Scraping {len(URLS_TO_SCRAPE)} websites...")
-    for url in URLS_TO_SCRAPE:
-        try:
-            loader = WebBaseLoader(url)
-            documents.extend(loader.load())
-        except Exception as e:
-            print(f"   ❌ Skipped {url}")
-
-    if not documents:
+    sources = {}
+    with ThreadPoolExecutor(max_workers=SCRAPE_WORKERS) as pool:
+        for url, documents in pool.map(_scrape, URLS_TO_SCRAPE):
+            source = f"url:{url}"
+            if documents is None:
+                if source in known:
+                    sources[source] = (known[source]["hash"], None)  # Offline right now: keep what we had
+                continue
+            digest = _sha256("\0".join(d.page_content for d in documents).encode("utf-8"))
+            if known.get(source, {}).get("hash") == digest:
+                sources[source] = (digest, None)
+            else:
+                sources[source] = (digest, _split(documents))
+    return sources
+
+
+def build_database(full=False):
+    print("🚀 STARTING: Building AI Memory (Local CPU Mode)...")
+    started = time.perf_counter()
+
+    manifest = None if full else load_manifest()
+    if manifest is not None and manifest.get("settings") != STORE_SETTINGS:
+        print("⚙️ Embedding / chunk settings changed: rebuilding everything.")
+        manifest = None
+    known = manifest["sources"] if manifest else {}
+
+    sources = {**collect_pdfs(known), **collect_urls(known)}
+    if not sources:
         print("❌ No documents found.")
         return
 
-    # --- PART C: SPLIT TEXT ---
-    print("✂️  Splitting text...")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_documents(documents)
-    print(f"   - Created {len(chunks)} chunks.")
+    # --- Work out what changed ---
+    to_add = []     # (id, chunk)
+    to_delete = []  # ids
+    new_sources = {}
+    for source, (digest, chunks) in sources.items():
+        if chunks is None:
+            new_sources[source] = known[source]  # Unchanged
+            continue
+        ids = chunk_ids(source, chunks)
+        old_ids = set(known.get(source, {}).get("chunks", []))
+        to_add.extend((chunk_id, chunk) for chunk_id, chunk in zip(ids, chunks) if chunk_id not in old_ids)
+        to_delete.extend(old_ids - set(ids))
+        new_sources[source] = {"hash": digest, "chunks": ids}
+    for source in known.keys() - sources.keys():
+        print(f"   - Removed source: {source}")
+        to_delete.extend(known[source]["chunks"])
+    print(f"✂️  {len(to_add)} chunks to embed, {len(to_delete)} to delete, "
+          f"{sum(len(s['chunks']) for s in new_sources.values())} in the store after this run.")
 
-    # --- PART D: SAVE WITH LOCAL EMBEDDINGS ---
-    print("💾 Generating Embeddings on CPU (No API Limits)...")
-    
+    # --- PART D: UPDATE THE STORE WITH LOCAL EMBEDDINGS ---
     # Using a standard, efficient local model
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    
-    # Initialize DB and save all at once (Local is fast!)
-    vector_db = Chroma.from_documents(
-        documents=chunks, 
-        embedding=embeddings, 
-        persist_directory=DB_PATH
-    )
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    vector_db = Chroma(persist_directory=DB_PATH, embedding_function=embeddings)
+    if manifest is None:
+        # Full rebuild (or a store from before the manifest, whose ids we don't know)
+        vector_db.delete_collection()
+        vector_db = Chroma(persist_directory=DB_PATH, embedding_function=embeddings)
+
+    if to_delete:
+        vector_db.delete(ids=to_delete)
+    if to_add:
+        print(f"💾 Generating Embeddings on CPU in batches of {EMBED_BATCH}...")
+    for start in range(0, len(to_add), EMBED_BATCH):
+        batch = to_add[start:start + EMBED_BATCH]
+        vector_db.add_texts(
+            texts=[chunk.page_content for _, chunk in batch],
+            metadatas=[chunk.metadata for _, chunk in batch],
+            ids=[chunk_id for chunk_id, _ in batch]
+        )
 
-    print("✅ SUCCESS! AI Memory built at 'backend/chroma_db'")
+    save_manifest({"settings": STORE_SETTINGS, "sources": new_sources})
+    print(f"✅ SUCCESS! AI Memory updated at 'backend/chroma_db' in {time.perf_counter() - started:.1f}s")
 
 if __name__ == "__main__":
-    build_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build / update the chatbot knowledge base.")
+    parser.add_argument("--full", action="store_true", help="Re-embed everything instead of only what changed")
+    build_database(full=parser.parse_args().full)
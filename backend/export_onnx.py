@@ -0,0 +1,33 @@
+import argparse
+import os
+import shutil
+
+# --- SETTINGS ---
+WEIGHTS = "best.pt"
+ONNX_PATH = "best.onnx"
+INT8_PATH = "best.int8.onnx"
+
+
+def export_onnx(int8=False):
+    print("🚀 Exporting best.pt to ONNX for the CPU backend...")
+    from ultralytics import YOLO
+
+    # dynamic=True -> any imgsz (640 fast / 1024 accurate) and batch size
+    exported = YOLO(WEIGHTS).export(format="onnx", dynamic=True, simplify=True)
+    if os.path.abspath(exported) != os.path.abspath(ONNX_PATH):
+        shutil.move(exported, ONNX_PATH)
+    print(f"✅ Saved {ONNX_PATH}")
+
+    if int8:
+        # Dynamic INT8 quantisation: no calibration data needed.
+        # Check accuracy with benchmarks/check_onnx_parity.py before using it.
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print("⚙️ Quantising weights to INT8...")
+        quantize_dynamic(ONNX_PATH, INT8_PATH, weight_type=QuantType.QUInt8)
+        print(f"✅ Saved {INT8_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--int8", action="store_true", help="Also write an INT8-quantised model")
+    export_onnx(parser.parse_args().int8)
@@ -2,19 +2,103 @@
 #from weasyprint import HTML
 #import base64
 #from datetime import datetime
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response, UploadFile, File, Form, HTTPException, Path
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from services.cv_engine import SolarVision
+from services.cv_engine import SolarVision, PROFILE_NAMES, DEFAULT_PROFILE
 from services.solar_engine import SolarCalculator
-from services.pdf_engine import generate_solar_pdf
-from services.image_fetcher import fetch_satellite_image
-from services.rag_engine import SolarRAG
-import base64
+from services.image_fetcher import fetch_satellite_image_async, fetch_satellite_mosaic_async
+from services.georef import DEFAULT_ZOOM, tile_georef, upload_georef
+from services.image_artifact import ImageArtifact, ImageCache, IMAGE_CACHE_TTL
+from services.report_store import ReportStore, ReportQueue, report_key, REPORT_TTL
+from services.shared_state import shared_dir, shared_path, try_lock, unlock
+from services.pipeline import StagedExecutor
+from services.lifecycle import EngineManager
+from services.roi_batch import parse_sites, results_to_columns, results_to_csv, json_safe
+from services.site_batch import parse_site_list, batch_key, BatchJournal, stream_sites
+from services.result_store import ResultStore, QUICK_RADIUS_M
+from services import metrics
+from services.metrics import stage, timed
+from services.scenarios import AnalysisCache, ANALYSIS_CACHE_TTL, run_sweep, PHASES, SCENARIO_MAX, DEFAULT_SCENARIO_FIELDS
+from services.solar_engine import ROI_FIELDS, SERIES_FIELDS
+from datetime import date
+from urllib.parse import quote
+import asyncio
+import functools
+import httpx
+import json
+import numpy as np
 import os
+import re
+import tempfile
+import threading
+import time
+import weakref
 
-app = FastAPI()
+# Satellite view size in tiles (1 = single tile, 3 = 3x3 mosaic around the point)
+MOSAIC_GRID = int(os.getenv("SOLIX_MOSAIC_GRID", "1"))
+MOSAIC_MAX = 5  # grid^2 tile downloads per analysis: 25 at most
+
+# Blocking stages (YOLO, PDF) run here instead of on the event loop
+executor = StagedExecutor()
+
+# Annotated images, served by URL instead of inline base64 in the JSON
+# (shared_dir: also on disk when serve.py runs several workers, None otherwise)
+image_cache = ImageCache(shared=shared_dir("images", IMAGE_CACHE_TTL))
+
+# Roof area + irradiance per analysis, so /api/scenarios can re-run the financials
+analysis_cache = AnalysisCache(shared=shared_dir("analyses", ANALYSIS_CACHE_TTL))
+
+# Image + YOLO + irradiance per location (geohash) and model, so repeat clicks skip all three
+result_store = ResultStore(lock_dir=shared_path("result_locks"))
+
+# Rendered PDFs, keyed by a hash of their content (identical analyses share one file)
+report_store = ReportStore()
+REPORT_ID_PATTERN = r"^[0-9a-f]{32}$"
+# Max sites per /api/reports/batch call (a multi-page PDF is built in memory)
+BATCH_REPORT_MAX = int(os.getenv("SOLIX_BATCH_REPORT_MAX", "500"))
+# Max sites per /api/roi/batch call
+ROI_BATCH_MAX = int(os.getenv("SOLIX_ROI_BATCH_MAX", "100000"))
+# /api/analyze/batch jobs streaming right now (the same batch twice would analyse every site twice)
+active_batches = set()
+# No offline irradiance grid on disk: build it once in the background (NASA lookups until it's there)
+BUILD_IRRADIANCE_GRID = os.getenv("SOLIX_BUILD_IRRADIANCE_GRID", "1") == "1"
+
+def build_missing_grid():
+    from build_irradiance_grid import build_grid  # One-off: only imported when the grid is missing
+    grid_path = solar_engine.store.grid_path
+    lock_path = f"{grid_path}.lock"
+    os.makedirs(os.path.dirname(grid_path) or ".", exist_ok=True)
+    lock = try_lock(lock_path)
+    if lock is None:
+        return  # Another serve.py worker is building it (the others pick the file up when it's there)
+    try:
+        if not os.path.exists(grid_path) and build_grid(grid_path):
+            solar_engine.store.reload_grid()
+    except Exception as e:
+        print(f"⚠️ Could not build the irradiance grid: {e}")
+    finally:
+        unlock(lock, lock_path)
+
+@asynccontextmanager
+async def lifespan(app):
+    # One pooled async HTTP client for NASA + Esri calls
+    app.state.http = httpx.AsyncClient()
+    # YOLO + RAG load after this (in the background by default), not at import
+    engines.start()
+    metrics.registry.start()
+    if BUILD_IRRADIANCE_GRID and solar_engine.store.values is None:
+        threading.Thread(target=build_missing_grid, name="solix-irradiance-grid", daemon=True).start()
+    yield
+    metrics.registry.stop()
+    await app.state.http.aclose()
+    executor.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -27,34 +111,290 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latency per route on /metrics (+ the SOLIX_PROFILE_SAMPLE profiling hook)
+if metrics.ENABLED or metrics.PROFILE_SAMPLE > 0:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # --- 1. INITIALIZE ENGINES ---
-vision_engine = SolarVision()
-solar_engine = SolarCalculator()
+solar_engine = SolarCalculator()  # Cheap (irradiance grid), loaded right away
+
+def load_pdf_engine():
+    import services.pdf_engine as pdf_engine  # fpdf + fontTools: ~0.25s of import time
+    return pdf_engine
+
+def load_rag():
+    from services.rag_engine import SolarRAG  # LangChain + HuggingFace imports take seconds
+    return SolarRAG()
+
+# Heavy engines: loaded per SOLIX_ENGINE_LOADING (background / lazy / eager), see /health/ready
+engines = EngineManager()
+def load_vision():
+    engine = SolarVision()
+    result_store.purge_models(engine.model_version)  # New best.pt: results of the old model are stale
+    return engine
 
-# Initialize RAG Engine
-try:
-    rag_engine = SolarRAG()
-    print("✅ RAG Engine Loaded Successfully")
-except Exception as e:
-    print(f"❌ Failed to load RAG Engine: {e}")
-    rag_engine = None
+engines.register("vision", load_vision, warmup=lambda engine: engine.warm_up())
+engines.register("rag", load_rag, warmup=lambda engine: engine.warm_up(), required=False)
+# Compiling the report template once here keeps it off the first report
+engines.register("pdf", load_pdf_engine, warmup=lambda engine: engine.get_template(1.0), required=False)
 
 # --- 2. DATA MODELS ---
 class ChatRequest(BaseModel):
     message: str
     history: list = []
 
-# --- 3. ENDPOINTS ---
+class BatchReportItem(BaseModel):
+    # Same figures as the single-site report (int | float keeps "650" from printing as "650.0")
+    district: str
+    roof_area: int | float
+    system_size: int | float
+    generation: int | float
+    tariff_rate: int | float
+    earnings: int | float
+    payback: int | float
+    name: str | None = None       # Customer / site name, used for the file name
+    image_id: str | None = None   # annotated_image_url id from a previous analysis
+
+class BatchReportRequest(BaseModel):
+    reports: list[BatchReportItem]
+    format: str = "zip"  # "zip" = one PDF per site, "pdf" = one multi-page PDF
+
+class ScenarioRequest(BaseModel):
+    # One list per axis; every combination is evaluated (defaults = /api/analyze/full defaults)
+    analysis_id: str
+    loan_rate: list[float] = [11.5]
+    loan_years: list[int] = [5]
+    phase: list[str] = ["Single"]
+    bill: list[float] = [0]
+    fields: list[str] = list(DEFAULT_SCENARIO_FIELDS)
+
+# --- 3. HELPERS ---
+async def fetch_site(http_client, district, lat, lon, mosaic, zoom, upload=None):
+    """
+    Image bytes, their georef (m/px depends on zoom + latitude), the
+    irradiance (annual, [JAN..DEC]) and where it came from (see
+    SolarCalculator.lookup_climatology_async) for one site. The image and
+    NASA lookups are independent, so they run together.
+    """
+    if upload:
+        image_step = upload.read()
+        georef = upload_georef(lat, zoom)
+    else:
+        print(f"Fetching satellite image for {lat}, {lon}...")
+        if mosaic > 1:
+            # Roof may cross tile edges -> stitch the neighbourhood around the point
+            image_step = fetch_satellite_mosaic_async(lat, lon, zoom=zoom, grid=mosaic, client=http_client)
+        else:
+            image_step = fetch_satellite_image_async(lat, lon, zoom=zoom, client=http_client)
+        image_step = timed("tile_fetch", image_step)
+        georef = tile_georef(lat, lon, zoom, grid=mosaic)
+
+    image_data, (climatology, irradiance_source) = await asyncio.gather(
+        image_step,
+        solar_engine.lookup_climatology_async(lat, lon, district, client=http_client)
+    )
+    monthly_irradiance = [float(v) for v in climatology[:12]]  # Drives the hourly battery simulation
+    return image_data, georef, float(climatology[-1]), monthly_irradiance, irradiance_source
+
+def roof_area(cv_results):
+    """(area m2, is_estimated, reason): the detected roof area, or the 60 m2 fallback and why."""
+    detected_area = sum([obj['estimated_m2'] for obj in cv_results['objects']])
+
+    # Logic: If area is 0, we fallback to 60m2 BUT we tell the user why.
+    if detected_area > 0:
+        return detected_area, False, "Based on precise satellite analysis."
+    # If the CV Engine rejected the image (Cloudy/Blurry), say so. Otherwise generic.
+    warning_msg = cv_results.get("warning", None)
+    return 60.0, True, warning_msg if warning_msg else "Could not detect roof (Obstacles/Unclear). Used default average."
+
+def render_report(path, pdf_data, image):
+    with stage("pdf_render"):
+        engines.get("pdf").generate_solar_pdf(pdf_data, image, output_path=path)
+
+def detect_roof(vision_engine, image_data, georef, profile):
+    """Runs on the "cv" pool: detection + the annotated image's JPEG (its pixels are dropped right away)."""
+    cv_results = vision_engine.analyze_image(image_data, profile=profile, georef=georef)
+    image = cv_results.pop("annotated_image")
+    image.jpeg()
+    image.compact()
+    return cv_results, image
+
+def site_record(cv_results, irradiance, monthly_irradiance, irradiance_source):
+    """What result_store keeps per location: everything but the financials."""
+    total_area_m2, is_estimated, _ = roof_area(cv_results)
+    return {
+        "cv_results": cv_results,
+        "irradiance": irradiance,
+        "monthly_irradiance": monthly_irradiance,
+        "irradiance_source": irradiance_source,
+        "roof_area_m2": total_area_m2,
+        "is_estimated": is_estimated,
+    }
+
+def finish_sites(group, journal, image_url):
+    """
+    /api/analyze/batch last stage: the financials for every site in `group`
+    in one calculate_roi_batch call, then one result per site (also journaled).
+    group: [(index, site, (cv_results, image_id, irradiance, monthly_irradiance, source))]
+    """
+    areas = [roof_area(cv_results) for _, _, (cv_results, *_) in group]
+    columns = {
+        "roof_area_m2": [area for area, _, _ in areas],
+        "annual_irradiance": [detected[2] for _, _, detected in group],
+        "monthly_irradiance": [detected[3] for _, _, detected in group],
+        "monthly_bill": [site["bill"] for _, site, _ in group],
+        "loan_rate": [site["loan_rate"] for _, site, _ in group],
+        "loan_years": [site["loan_years"] for _, site, _ in group],
+        "connection_type": [site["phase"] for _, site, _ in group],
+        "lat": [site["lat"] for _, site, _ in group],
+    }
+    with stage("roi_batch"):
+        results = solar_engine.calculate_roi_batch(**{name: np.asarray(values) for name, values in columns.items()})
+    fields = {}
+    for field in ROI_FIELDS + SERIES_FIELDS:
+        column = np.asarray(results[field])
+        fields[field] = json_safe(np.broadcast_to(column, (len(group),) + column.shape[1:]))
+
+    finished = []
+    for k, (index, site, (cv_results, image_id, irradiance, monthly_irradiance, source)) in enumerate(group):
+        total_area_m2, is_estimated, estimation_reason = areas[k]
+        analysis_id = analysis_cache.put({
+            "district": site["district"],
+            "roof_area_m2": total_area_m2,
+            "irradiance": irradiance,
+            "monthly_irradiance": monthly_irradiance,
+            "lat": site["lat"],
+            "is_estimated": is_estimated,
+        })
+        result = {
+            "index": index,
+            "status": "success",
+            **site,
+            "roof_analysis": {
+                **cv_results,
+                "image_id": image_id,
+                "annotated_image_url": image_url(image_id),
+                "total_area_m2": round(total_area_m2, 2),
+                "is_estimated": is_estimated,
+                "estimation_reason": estimation_reason,
+                "source": source,
+            },
+            "financial_report": {field: values[k] for field, values in fields.items()},
+            "analysis_id": analysis_id,
+        }
+        journal.append(result)
+        finished.append(result)
+    return finished
+
+def publish_results(pdf_data, image):
+    """Caches the annotated image and queues its PDF. Returns (image_id, report_id)."""
+    image_id = image_cache.put(image)  # Encodes the JPEG once, reused by the PDF
+    # The date is printed on the report, so it is part of the content
+    report_id = report_key({**pdf_data, "date": date.today().isoformat()}, image.jpeg())
+    report_queue.submit(report_id, pdf_data, image)
+    return image_id, report_id
+
+# PDFs render on the "pdf" pool after the response, or on first download (SOLIX_PDF_MODE)
+report_queue = ReportQueue(report_store, render_report, submit=functools.partial(executor.submit, "pdf"),
+                           shared=shared_dir("report_jobs", REPORT_TTL))
+
+# --- 4. ENDPOINTS ---
+
+@app.get("/health/live")
+async def health_live():
+    """The process is up and serving (engines may still be loading)."""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def health_ready():
+    """200 once every required engine is loaded and warmed up, 503 before; with per-engine timings."""
+    status = engines.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text format: stage timers, request latency, cache / fallback / token counters."""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (SOLIX_METRICS=0).")
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/api/chat")
 async def chat_endpoint(request: ChatRequest):
+    rag_engine = await engines.aget("rag")
     if not rag_engine:
         return {"reply": "System Error: The AI Knowledge base is not loaded."}
-    answer = rag_engine.get_answer(request.message)
+    answer = await asyncio.to_thread(rag_engine.get_answer, request.message)
     return {"reply": answer}
 
+def _sse(data, event=None):
+    # One Server-Sent Event; JSON keeps newlines inside tokens intact
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+async def _chat_events(answer_stream):
+    """SSE frames for a streamed answer. The answer is produced by a task started right away."""
+    queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for chunk in answer_stream:
+                await queue.put(("token", chunk))
+            await queue.put(("done", None))
+        except Exception as e:
+            await queue.put(("error", str(e)))
+
+    # Retrieval starts now, not when the response body is first pulled
+    task = asyncio.create_task(produce())
+
+    async def frames():
+        try:
+            yield ": stream open\n\n"  # Flushes the headers so the client can start reading
+            while True:
+                kind, value = await queue.get()
+                if kind == "token":
+                    yield _sse({"token": value})
+                elif kind == "done":
+                    yield _sse({}, event="done")
+                    return
+                else:
+                    yield _sse({"error": f"⚠️ Error: {value}"}, event="error")
+                    return
+        finally:
+            task.cancel()  # Client went away: stop the LLM call too
+
+    return frames()
+
+async def _single_reply(text):
+    yield text
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    /api/chat as Server-Sent Events: "data: {"token": ...}" frames while the
+    answer is generated, then "event: done" (or "event: error").
+    """
+    rag_engine = await engines.aget("rag")
+    if not rag_engine:
+        answer_stream = _single_reply("System Error: The AI Knowledge base is not loaded.")
+    else:
+        answer_stream = rag_engine.astream_answer(request.message)
+    return StreamingResponse(
+        await _chat_events(answer_stream),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # No proxy buffering
+    )
+
+@app.get("/api/chat/cache")
+async def chat_cache_stats():
+    """Hit / miss counters of the RAG answer + retrieval caches."""
+    rag_engine = engines.loaded("rag")
+    if not rag_engine:
+        return {}
+    return rag_engine.cache_stats()
+
 @app.post("/api/analyze/full")
 async def analyze_full_project(
+    request: Request,
     district: str = Form(...),
     lat: float = Form(...),
     lon: float = Form(...),
@@ -62,61 +402,78 @@ async def analyze_full_project(
     loan_rate: float = Form(11.5),
     loan_years: int = Form(5),
     phase: str = Form("Single"),
+    mosaic: int = Form(MOSAIC_GRID),
+    zoom: int = Form(DEFAULT_ZOOM),
+    profile: str = Form(DEFAULT_PROFILE),
     file: UploadFile = File(None)
 ):
     # --- SAFETY CHECK 1: Validate Coordinates ---
     # Prevents calculating NASA data for the middle of the ocean
     if lat == 0 or lon == 0:
         raise HTTPException(status_code=400, detail="Invalid GPS Coordinates. Please select a location on the map.")
+    if profile not in PROFILE_NAMES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{profile}'. Use one of: {', '.join(PROFILE_NAMES)}")
+    if not 1 <= zoom <= 23:
+        raise HTTPException(status_code=400, detail="Zoom must be between 1 and 23.")
+    if not 1 <= mosaic <= MOSAIC_MAX:
+        raise HTTPException(status_code=400, detail=f"Mosaic must be between 1 and {MOSAIC_MAX}.")
+
+    vision_engine = await engines.aget("vision")
+    if vision_engine is None:
+        raise HTTPException(status_code=503, detail="Roof detection is unavailable right now. Please try again later.")
+
+    async def analyze_site():
+        # A. GET THE IMAGE + NASA IRRADIANCE
+        image_data, georef, irradiance, monthly_irradiance, irradiance_source = await fetch_site(
+            request.app.state.http, district, lat, lon, mosaic, zoom, upload=file
+        )
+        if image_data is None or len(image_data) == 0:
+            return None
+        # B. CV Analysis (With new Warning Handling)
+        cv_results, image = await executor.run("cv", detect_roof, vision_engine, image_data, georef, profile)
+        return site_record(cv_results, irradiance, monthly_irradiance, irradiance_source), image.jpeg()
 
-    # A. GET THE IMAGE
     if file:
-        image_data = await file.read()
+        analyzed = await analyze_site()
+        site, source = ({**analyzed[0], "image": analyzed[1]} if analyzed else None), "upload"
     else:
-        print(f"Fetching satellite image for {lat}, {lon}...")
-        image_data = fetch_satellite_image(lat, lon)
-        if not image_data:
-            return {"status": "error", "message": "Could not fetch satellite image for this location."}
+        # The same spot (geohash cell) with the same model + settings reuses a stored
+        # result; identical requests arriving together share one computation
+        key = result_store.key(lat, lon, vision_engine.model_version, profile=profile, zoom=zoom, mosaic=mosaic)
+        site, source = await result_store.get_or_compute(key, lat, lon, analyze_site)
+    if site is None:
+        return {"status": "error", "message": "Could not fetch satellite image for this location."}
 
-    # B. CV Analysis (With new Warning Handling)
-    cv_results = vision_engine.analyze_image(image_data)
-    
-    # Check if CV Engine rejected the image (Cloudy/Blurry)
-    warning_msg = cv_results.get("warning", None)
-
-    # Save image for PDF
-    os.makedirs("static", exist_ok=True)
-    temp_img_path = "static/temp_roof.jpg"
-    with open(temp_img_path, "wb") as f:
-        f.write(base64.b64decode(cv_results['annotated_image']))
+    cv_results = site["cv_results"]
+    irradiance, monthly_irradiance = site["irradiance"], site["monthly_irradiance"]
+    annotated_image = ImageArtifact(jpeg=site["image"])
 
     # C. Solar & Financial Math
-    detected_area = sum([obj['estimated_m2'] for obj in cv_results['objects']])
-    
-    # Logic: If area is 0, we fallback to 60m2 BUT we tell the user why.
-    if detected_area > 0:
-        total_area_m2 = detected_area
-        is_estimated = False
-        estimation_reason = "Based on precise satellite analysis."
-    else:
-        total_area_m2 = 60.0 # Default average roof size
-        is_estimated = True
-        # If we have a specific warning (Cloudy), use it. Otherwise generic.
-        estimation_reason = warning_msg if warning_msg else "Could not detect roof (Obstacles/Unclear). Used default average."
+    total_area_m2, is_estimated, estimation_reason = roof_area(cv_results)
 
-    # Use the NASA Engine
-    irradiance = solar_engine.get_solar_data(lat, lon, district)
+    with stage("roi"):
+        financials = solar_engine.calculate_roi(
+            total_area_m2,
+            irradiance,
+            monthly_bill=bill,
+            loan_rate=loan_rate,
+            loan_years=loan_years,
+            connection_type=phase,
+            monthly_irradiance=monthly_irradiance,
+            lat=lat
+        )
     
-    financials = solar_engine.calculate_roi(
-        total_area_m2, 
-        irradiance, 
-        monthly_bill=bill, 
-        loan_rate=loan_rate, 
-        loan_years=loan_years,
-        connection_type=phase
-    )
-    
-    # D. Generate PDF
+    # Kept for /api/scenarios (loan / bill / phase what-ifs without re-analysing)
+    analysis_id = analysis_cache.put({
+        "district": district,
+        "roof_area_m2": total_area_m2,
+        "irradiance": irradiance,
+        "monthly_irradiance": monthly_irradiance,
+        "lat": lat,
+        "is_estimated": is_estimated,
+    })
+
+    # D. PDF Report (queued)
     pdf_data = {
         "district": district,
         "roof_area": round(total_area_m2, 2),
@@ -132,20 +489,315 @@ async def analyze_full_project(
         "note": estimation_reason # Add the reason to the PDF data
     }
     
-    pdf_filename = f"Solar_Report_{district}.pdf"
-    generate_solar_pdf(pdf_data, temp_img_path, pdf_filename)
+    # Rendering happens in the background (or on first download), not here
+    image_id, report_id = await asyncio.to_thread(publish_results, pdf_data, annotated_image)
 
     # E. Construct Final Response
     final_roof_analysis = {
         **cv_results,
+        "annotated_image_url": str(request.url_for("get_image", image_id=image_id)),
         "total_area_m2": round(total_area_m2, 2),
         "is_estimated": is_estimated,
-        "estimation_reason": estimation_reason # Pass this to Frontend
+        "estimation_reason": estimation_reason, # Pass this to Frontend
+        "source": source  # cache | coalesced | computed | upload
     }
 
     return {
         "status": "success",
         "roof_analysis": final_roof_analysis,
         "financial_report": financials,
-        "pdf_url": f"http://127.0.0.1:8000/static/{pdf_filename}"
-    }
\ No newline at end of file
+        "analysis_id": analysis_id,
+        "report_id": report_id,
+        "pdf_url": f"{request.url_for('download_report', report_id=report_id)}?district={quote(district)}"
+    }
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(
+    request: Request,
+    profile: str = DEFAULT_PROFILE,
+    zoom: int = DEFAULT_ZOOM,
+    mosaic: int = MOSAIC_GRID
+):
+    """
+    /api/analyze/full for a list of sites (CSV, JSON or NDJSON body with
+    district, lat, lon, bill, loan_rate, loan_years, phase per site).
+
+    Streams NDJSON: a first line {"batch_id", "count", "resumed"}, then one
+    line per site as soon as it is done ("index" = its position in the
+    input), not in input order. Tile + irradiance fetches, YOLO (micro-batched)
+    and the financials (vectorized per group) overlap across sites.
+    Sending the same sites again resumes: finished sites are replayed from
+    the batch journal and only the rest are analysed.
+    """
+    if profile not in PROFILE_NAMES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{profile}'. Use one of: {', '.join(PROFILE_NAMES)}")
+    if not 1 <= zoom <= 23:
+        raise HTTPException(status_code=400, detail="Zoom must be between 1 and 23.")
+    if not 1 <= mosaic <= MOSAIC_MAX:
+        raise HTTPException(status_code=400, detail=f"Mosaic must be between 1 and {MOSAIC_MAX}.")
+    try:
+        sites = parse_site_list(await request.body(), request.headers.get("content-type", ""), PHASES)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    batch_id = batch_key(sites, {"profile": profile, "zoom": zoom, "mosaic": mosaic})
+    vision_engine = await engines.aget("vision")
+    if vision_engine is None:
+        raise HTTPException(status_code=503, detail="Roof detection is unavailable right now. Please try again later.")
+
+    # Claimed before responding, so the same batch sent twice at once gets a 409
+    # (the journal's lock file also covers the other serve.py workers)
+    journal = BatchJournal(batch_id)
+    if batch_id in active_batches or not journal.lock():
+        raise HTTPException(status_code=409, detail="This batch is already running.")
+    active_batches.add(batch_id)
+
+    def release():
+        active_batches.discard(batch_id)
+        journal.unlock()
+
+    try:
+        await asyncio.to_thread(journal.sweep)
+        done = await asyncio.to_thread(journal.load)
+    except BaseException:
+        release()
+        raise
+    pending = [(index, site) for index, site in enumerate(sites) if index not in done]
+    http_client = request.app.state.http
+
+    async def fetch(site):
+        key = result_store.key(site["lat"], site["lon"], vision_engine.model_version,
+                               profile=profile, zoom=zoom, mosaic=mosaic)
+        stored = await asyncio.to_thread(result_store.get, key)
+        if stored is not None:
+            return key, stored, None  # Analysed before: no fetch, no YOLO
+        fetched = await fetch_site(http_client, site["district"], site["lat"], site["lon"], mosaic, zoom)
+        if fetched[0] is None or len(fetched[0]) == 0:
+            raise ValueError("Could not fetch satellite image for this location.")
+        return key, None, fetched
+
+    async def detect(site, fetched):
+        key, stored, fetched = fetched
+        if stored is not None:
+            image, record, source = ImageArtifact(jpeg=stored["image"]), stored, "cache"
+        else:
+            image_data, georef, irradiance, monthly_irradiance, irradiance_source = fetched
+            cv_results, image = await executor.run("cv", detect_roof, vision_engine, image_data, georef, profile)
+            record, source = site_record(cv_results, irradiance, monthly_irradiance, irradiance_source), "computed"
+            await asyncio.to_thread(result_store.put, key, site["lat"], site["lon"], record, image.jpeg())
+        image_id = await asyncio.to_thread(image_cache.put, image)
+        return record["cv_results"], image_id, record["irradiance"], record["monthly_irradiance"], source
+
+    def image_url(image_id):
+        return str(request.url_for("get_image", image_id=image_id))
+
+    async def lines():
+        try:
+            yield json.dumps({"batch_id": batch_id, "count": len(sites), "resumed": len(done)}) + "\n"
+            for index in sorted(done):
+                yield json.dumps(done[index]) + "\n"
+            finish = functools.partial(finish_sites, journal=journal, image_url=image_url)
+            async for result in stream_sites(pending, fetch, detect, finish):
+                yield json.dumps(result) + "\n"
+        finally:
+            release()
+
+    stream = lines()
+    weakref.finalize(stream, release)  # Also released if the client leaves before the first line
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+@app.get("/api/estimate/quick")
+async def quick_estimate(
+    lat: float,
+    lon: float,
+    district: str = "",
+    bill: float = 0,
+    loan_rate: float = 11.5,
+    loan_years: int = 5,
+    phase: str = "Single",
+    radius_m: float = QUICK_RADIUS_M
+):
+    """
+    Instant preview while /api/analyze/full runs: the roof area is a prior
+    from past analyses near this point (distance-weighted, spatial index
+    lookup, no image / YOLO / NASA), financials from the local irradiance data.
+    Falls back to the 60 m2 default when nothing was analysed nearby.
+    """
+    if lat == 0 or lon == 0:
+        raise HTTPException(status_code=400, detail="Invalid GPS Coordinates. Please select a location on the map.")
+    if phase not in PHASES:
+        raise HTTPException(status_code=400, detail=f"Phase must be one of: {', '.join(PHASES)}")
+    if loan_rate <= 0:
+        raise HTTPException(status_code=400, detail="loan_rate must be greater than 0.")
+    if not 0 < radius_m <= 5000:
+        raise HTTPException(status_code=400, detail="radius_m must be between 0 and 5000.")
+
+    vision_engine = engines.loaded("vision")
+    started = time.perf_counter()
+    neighbours = await asyncio.to_thread(
+        result_store.nearby, lat, lon, radius_m, model=vision_engine.model_version if vision_engine else None
+    )
+    lookup_us = round((time.perf_counter() - started) * 1e6)
+
+    # Detected roofs only (estimated ones are the default), closer ones count more
+    detected = [n for n in neighbours if not n["is_estimated"]]
+    if detected:
+        weights = [1 / max(n["distance_m"], 1.0) for n in detected]
+        roof_area_m2 = sum(w * n["roof_area_m2"] for w, n in zip(weights, detected)) / sum(weights)
+    else:
+        roof_area_m2 = 60.0
+
+    # Grid / cached irradiance only: no NASA call on this path
+    climatology = solar_engine.store.lookup(lat, lon)
+    if climatology is None:
+        climatology = np.full(13, solar_engine.district_sun_hours.get(district, 4.5))
+    financials = solar_engine.calculate_roi(
+        roof_area_m2, float(climatology[-1]), monthly_bill=bill, loan_rate=loan_rate, loan_years=loan_years,
+        connection_type=phase, monthly_irradiance=[float(v) for v in climatology[:12]], lat=lat
+    )
+    return {
+        "status": "success",
+        "estimate": {
+            "roof_area_m2": round(roof_area_m2, 2),
+            "is_estimated": True,
+            "neighbours": len(detected),
+            "nearest_m": round(neighbours[0]["distance_m"], 1) if neighbours else None,
+            "radius_m": radius_m,
+            "lookup_us": lookup_us,
+        },
+        "financial_report": financials,
+    }
+
+@app.get("/api/images/{image_id}.jpg", name="get_image")
+async def get_image(image_id: str):
+    artifact = image_cache.get(image_id)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Image expired or not found. Please run the analysis again.")
+    # Ids are never reused, so browsers may cache the image for its lifetime
+    return Response(
+        content=artifact.jpeg(),
+        media_type="image/jpeg",
+        headers={"Cache-Control": f"public, max-age={image_cache.ttl_seconds}, immutable"}
+    )
+
+@app.get("/api/reports/{report_id}.pdf", name="download_report")
+async def download_report(report_id: str = Path(pattern=REPORT_ID_PATTERN), district: str = "Report"):
+    path = report_store.get(report_id)
+    if path is None:
+        # Not rendered yet (lazy mode / still queued): render it now
+        try:
+            path = await executor.run("pdf", report_queue.ensure, report_id)
+        except Exception:
+            raise HTTPException(status_code=500, detail="Could not generate the PDF report. Please try again.")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Report expired or not found. Please run the analysis again.")
+    # Streamed from disk in chunks; shown in the browser, saved under the district name
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename=f"Solar_Report_{district}.pdf",
+        content_disposition_type="inline"
+    )
+
+@app.get("/api/reports/{report_id}/status")
+async def report_status(report_id: str = Path(pattern=REPORT_ID_PATTERN)):
+    status = report_queue.status(report_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown report.")
+    return {"report_id": report_id, **status}
+
+@app.post("/api/reports/batch")
+async def batch_reports(batch: BatchReportRequest):
+    if batch.format not in ("zip", "pdf"):
+        raise HTTPException(status_code=400, detail="Format must be 'zip' or 'pdf'.")
+    if not 1 <= len(batch.reports) <= BATCH_REPORT_MAX:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {BATCH_REPORT_MAX} reports.")
+
+    items = []
+    for i, item in enumerate(batch.reports, start=1):
+        label = re.sub(r"[^\w.-]+", "_", item.name or item.district)
+        image = image_cache.get(item.image_id) if item.image_id else None
+        items.append((f"{i:03d}_Solar_Report_{label}.pdf", item.model_dump(exclude={"name", "image_id"}), image))
+
+    pdf_engine = await engines.aget("pdf")
+    if batch.format == "zip":
+        # Rendered while streaming: one report in memory at a time
+        return StreamingResponse(
+            pdf_engine.iter_reports_zip(items),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="Solar_Reports.zip"'}
+        )
+
+    # One document: render to a temp file on the pdf pool, then stream it from disk
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        await timed("pdf_batch", executor.run("pdf", pdf_engine.generate_batch_pdf,
+                                              [(data, image) for _, data, image in items], path))
+    except Exception:
+        os.remove(path)
+        raise
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename="Solar_Reports.pdf",
+        background=BackgroundTask(os.remove, path)
+    )
+
+@app.post("/api/roi/batch")
+async def roi_batch(request: Request, format: str = "json"):
+    """
+    calculate_roi for many sites in one call (CSV or JSON body, see services/roi_batch.py).
+    ?format=csv returns a CSV with the inputs and results per site; default is JSON columns.
+    """
+    try:
+        sites = parse_sites(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    count = sites.pop("count")
+    if count > ROI_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Send at most {ROI_BATCH_MAX} sites per request.")
+    if np.any(np.asarray(sites["loan_rate"]) <= 0) or np.any(np.asarray(sites["loan_years"]) <= 0):
+        raise HTTPException(status_code=400, detail="loan_rate and loan_years must be greater than 0.")
+    if not np.isin(sites["connection_type"], PHASES).all():
+        raise HTTPException(status_code=400, detail=f"connection_type must be one of: {', '.join(PHASES)}")
+
+    results = await asyncio.to_thread(solar_engine.calculate_roi_batch, **sites)
+    if format == "csv":
+        return Response(content=results_to_csv(sites, results, count), media_type="text/csv")
+    return {"count": count, "columns": results_to_columns(results)}
+
+@app.post("/api/scenarios")
+async def scenario_sweep(sweep: ScenarioRequest):
+    """
+    Financial what-ifs for a previous /api/analyze/full result: every
+    loan_rate x loan_years x phase x bill combination, as one matrix per field.
+    """
+    analysis = analysis_cache.get(sweep.analysis_id)
+    if analysis is None:
+        raise HTTPException(status_code=404, detail="Analysis expired or not found. Please run the analysis again.")
+
+    axes = {"loan_rate": sweep.loan_rate, "loan_years": sweep.loan_years, "phase": sweep.phase, "bill": sweep.bill}
+    if any(not values for values in axes.values()):
+        raise HTTPException(status_code=400, detail="Every axis needs at least one value.")
+    if any(rate <= 0 for rate in sweep.loan_rate) or any(years <= 0 for years in sweep.loan_years):
+        raise HTTPException(status_code=400, detail="loan_rate and loan_years must be greater than 0.")
+    if any(phase not in PHASES for phase in sweep.phase):
+        raise HTTPException(status_code=400, detail=f"Phase must be one of: {', '.join(PHASES)}")
+    unknown = [field for field in sweep.fields if field not in ROI_FIELDS + SERIES_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    count = len(sweep.loan_rate) * len(sweep.loan_years) * len(sweep.phase) * len(sweep.bill)
+    if count > SCENARIO_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {SCENARIO_MAX} scenarios per request ({count} given).")
+
+    # Milliseconds even for thousands of scenarios, so no thread hop
+    matrix = run_sweep(solar_engine, analysis, axes, sweep.fields)
+    return {
+        "analysis_id": sweep.analysis_id,
+        "roof_area_m2": round(analysis["roof_area_m2"], 2),
+        "irradiance": analysis["irradiance"],
+        "axes": axes,
+        "count": count,
+        **matrix,
+    }
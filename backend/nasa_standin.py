@@ -0,0 +1,73 @@
+"""
+Local stand-in for the NASA POWER climatology endpoint (offline dev / tests).
+
+Answers any GET with the same JSON shape as
+https://power.larc.nasa.gov/api/temporal/climatology/point, with made-up but
+plausible Sri Lankan values that vary smoothly with latitude / longitude.
+Not real data: never build the production grid from it.
+
+    python nasa_standin.py --port 8765
+    NASA_POWER_URL=http://127.0.0.1:8765/api/temporal/climatology/point python -m uvicorn main:app
+    NASA_POWER_URL=... SOLIX_IRRADIANCE_GRID=data/test_grid.npz python build_irradiance_grid.py
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from services.irradiance_store import MONTHS
+
+# Monsoon-shaped monthly profile (kWh/m2/day) around Colombo
+BASE_PROFILE = [5.3, 6.0, 6.3, 5.9, 5.1, 4.7, 4.8, 5.0, 5.2, 4.9, 4.6, 4.8]
+BASE_LAT, BASE_LON = 6.9, 79.86
+
+
+def climatology(lat, lon):
+    """{JAN..DEC, ANN} for a point: the base profile, a little sunnier to the north and east."""
+    shift = 0.12 * (lat - BASE_LAT) + 0.08 * (lon - BASE_LON)
+    monthly = {month: round(value + shift, 2) for month, value in zip(MONTHS, BASE_PROFILE)}
+    monthly["ANN"] = round(sum(monthly.values()) / 12, 2)
+    return monthly
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            lat, lon = float(query["latitude"][0]), float(query["longitude"][0])
+        except (KeyError, ValueError):
+            self.send_error(422, "latitude and longitude are required")
+            return
+        body = json.dumps({
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {"parameter": {"ALLSKY_SFC_SW_DWN": climatology(lat, lon)}},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Quiet: one line per lookup drowns the server log
+
+
+def start(host="127.0.0.1", port=0):
+    """Serves on a background thread; returns (server, url). port=0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/api/temporal/climatology/point"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local NASA POWER climatology stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"🛰️ NASA POWER stand-in at http://{args.host}:{args.port}/api/temporal/climatology/point")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
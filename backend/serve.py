@@ -0,0 +1,170 @@
+"""
+Pre-fork server: several worker processes sharing one copy of the models.
+
+    python serve.py --workers 4 --port 8000
+
+The master process binds the port, loads the heavy engines once (YOLO
+through torch, the RAG embedding model, the PDF template) and then forks
+the workers. Model weights are never written after loading, so the forked
+workers share those pages with the master copy-on-write: each added worker
+costs its own Python heap, not another copy of the models
+(benchmarks/bench_prefork.py measures it).
+
+Every worker gets an equal share of the CPU for its math libraries
+(torch / OpenMP / MKL / ONNX Runtime / OpenCV threads = cores // workers),
+so N workers never run N x cores threads. Caches that hand out ids
+(images, analyses, queued reports) are mirrored in SOLIX_SHARED_DIR, so a
+follow-up request may land on any worker.
+
+Not shared: ONNX Runtime sessions (their thread pools don't survive fork,
+so SOLIX_CV_BACKEND=onnx loads the model in each worker) and the Chroma
+vector store (one sqlite connection per worker).
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+RESTART_DELAY = 1.0  # Seconds before a crashed worker is replaced
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the API on several pre-forked worker processes.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SOLIX_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("SOLIX_WORKER_THREADS", "0")),
+                        help="Math library threads per worker (default: cores // workers)")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Load the engines in every worker instead of once in the master")
+    return parser.parse_args()
+
+
+def limit_threads(threads):
+    """Must run before numpy / torch / onnxruntime are imported (they read these once)."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(var, str(threads))
+    os.environ.setdefault("SOLIX_ONNX_THREADS", str(threads))
+    # HF tokenizers warn (and fall back to one thread) if they were used before a fork
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def preload(main):
+    """Loads + warms up the engines that can be shared through fork()."""
+    from services.inference_backends import CV_BACKEND
+
+    # The master's warm-up runs single-threaded: no OpenMP pool exists yet at fork time
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    started = time.perf_counter()
+    if CV_BACKEND != "onnx":
+        main.engines.get("vision")
+    main.engines.get("pdf")
+    try:
+        from services.rag_engine import LANGCHAIN_AVAILABLE, load_embeddings
+        if LANGCHAIN_AVAILABLE:
+            load_embeddings().embed_query("solar tariff")
+    except Exception as e:
+        print(f"⚠️ Embedding model not preloaded: {e}")
+    print(f"📦 Engines preloaded in the master in {time.perf_counter() - started:.1f}s")
+
+
+def run_worker(sock, threads):
+    import cv2
+    import uvicorn
+    import main
+
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    cv2.setNumThreads(threads)
+
+    # Fresh default handlers: uvicorn installs its own (graceful shutdown on SIGTERM)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(main.app, lifespan="on", log_level="info", access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(sock, threads):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock, threads)
+        except BaseException as e:
+            print(f"❌ Worker {os.getpid()} crashed: {e}")
+            code = 1
+        finally:
+            sys.stdout.flush()
+            os._exit(code)
+    return pid
+
+
+def serve():
+    args = parse_args()
+    workers = max(1, args.workers)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    limit_threads(threads)
+    if workers > 1:
+        os.environ.setdefault("SOLIX_SHARED_DIR", os.path.join("data", "shared"))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    import main  # After the environment is final
+    from services import metrics
+    metrics.registry.clear_shared()  # Counters of a previous run's workers
+    if not args.no_preload:
+        preload(main)
+
+    # Everything loaded so far goes to the GC's permanent generation: a worker's
+    # collections would otherwise walk (and so write to, and copy) those pages
+    gc.collect()
+    gc.freeze()
+
+    print(f"🚀 Serving on http://{args.host}:{args.port} with {workers} workers x {threads} threads")
+    children = {spawn(sock, threads) for _ in range(workers)}
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        metrics.registry.retire(pid)
+        if not stopping:
+            print(f"⚠️ Worker {pid} exited (status {status}), starting a new one")
+            time.sleep(RESTART_DELAY)
+            children.add(spawn(sock, threads))
+    sock.close()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,97 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+BATCH_SIZE = int(os.getenv("SOLIX_BATCH_SIZE", "8"))
+BATCH_WAIT_MS = float(os.getenv("SOLIX_BATCH_WAIT_MS", "20"))
+
+
+class BatchInferenceServer:
+    """
+    Micro-batching in front of a model.
+
+    Callers submit one image at a time; a single worker thread collects
+    images for up to `max_wait_ms` (or until `max_batch` are waiting), runs
+    one forward pass for the whole batch and hands each caller its own result.
+    Requests with different predict settings (imgsz, augment...) are never
+    mixed in one forward pass.
+
+    predict_fn(images, **settings) must return one result per image.
+    """
+
+    def __init__(self, predict_fn, max_batch=BATCH_SIZE, max_wait_ms=BATCH_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+
+        # Simple stats for benchmarks / metrics
+        self.batches = 0
+        self.images = 0
+
+    def _ensure_worker(self):
+        # Threads don't survive fork(), so each process starts its own worker
+        if self._worker is not None and self._pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name="solix-batcher", daemon=True)
+                self._worker.start()
+
+    def submit(self, image, **settings):
+        """Queues one image. Returns a concurrent.futures.Future with its result."""
+        self._ensure_worker()
+        future = Future()
+        key = tuple(sorted(settings.items()))
+        self._queue.put((key, image, future))
+        return future
+
+    def predict(self, image, **settings):
+        """Blocking helper: submit and wait."""
+        return self.submit(image, **settings).result()
+
+    def _collect(self):
+        # Block for the first item, then gather more until the batch is full
+        # or the latency budget for the first item is used up.
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+
+            groups = {}
+            for key, image, future in items:
+                if future.set_running_or_notify_cancel():
+                    groups.setdefault(key, []).append((image, future))
+
+            for key, group in groups.items():
+                images = [image for image, _ in group]
+                try:
+                    results = self.predict_fn(images, **dict(key))
+                except Exception as e:
+                    for _, future in group:
+                        future.set_exception(e)
+                    continue
+                self.batches += 1
+                self.images += len(images)
+                for (_, future), result in zip(group, results):
+                    future.set_result(result)
@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+
+# Assumptions for the long-term projection (yearly rates as fractions)
+CASHFLOW_YEARS = int(os.getenv("SOLIX_CASHFLOW_YEARS", "20"))            # Net Plus agreements run 20 years
+PANEL_DEGRADATION = float(os.getenv("SOLIX_PANEL_DEGRADATION", "0.005"))  # Output lost per year
+TARIFF_ESCALATION = float(os.getenv("SOLIX_TARIFF_ESCALATION", "0.0"))    # Buy-back rate is fixed for the agreement
+DISCOUNT_RATE = float(os.getenv("SOLIX_DISCOUNT_RATE", "0.10"))
+OM_SHARE = float(os.getenv("SOLIX_OM_SHARE", "0.01"))                     # Yearly O&M as a share of the system cost
+OM_ESCALATION = float(os.getenv("SOLIX_OM_ESCALATION", "0.05"))           # Inflation on O&M
+
+IRR_ITERATIONS = 50
+IRR_TOLERANCE = 1e-9
+
+
+def _growth_sum(growth, rate, years):
+    """sum_{t=1..years} growth**(t-1) / (1+rate)**t, in closed form (geometric series)."""
+    q = growth / (1 + rate)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        series = np.where(np.isclose(q, 1.0, rtol=0, atol=1e-12), years, (1 - q ** years) / (1 - q))
+    return series / (1 + rate)
+
+
+def _irr(cost, flows, years):
+    """
+    Internal rate of return per site: Newton's method on all sites at once.
+    flows: (n, years) yearly cash flows after the upfront cost. NaN where
+    the flows never pay the cost back (no IRR worth reporting).
+    """
+    t = np.arange(1, years + 1)
+    # Start from the simple-payback yield, a good guess for level flows
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(cost > 0, flows[:, 0] / cost, 0.0) - 1 / years
+    rate = np.clip(rate, -0.9, 10.0)
+    has_irr = (cost > 0) & (flows.sum(axis=1) > cost)
+    active = has_irr.copy()
+    for _ in range(IRR_ITERATIONS):
+        if not active.any():
+            break
+        # Only unconverged sites move, so each site's result doesn't depend on the others
+        discount = (1 + rate[active, None]) ** -t
+        value = (flows[active] * discount).sum(axis=1) - cost[active]
+        slope = -(flows[active] * t * discount).sum(axis=1) / (1 + rate[active])
+        step = value / slope
+        rate[active] = np.clip(rate[active] - step, -0.9, 10.0)
+        still = np.abs(step) > IRR_TOLERANCE
+        active[np.flatnonzero(active)[~still]] = False
+    return np.where(has_irr, rate, np.nan)
+
+
+def project_cash_flows(total_cost, monthly_income, loan_installment=0.0, loan_years=0,
+                       years=CASHFLOW_YEARS, degradation=PANEL_DEGRADATION,
+                       escalation=TARIFF_ESCALATION, discount_rate=DISCOUNT_RATE,
+                       om_share=OM_SHARE, om_escalation=OM_ESCALATION):
+    """
+    Multi-year projection for many sites at once (arrays or scalars, broadcast).
+
+    Year t income = first-year income x ((1 - degradation) x (1 + escalation))**(t-1);
+    O&M grows with om_escalation. NPV and lifetime totals are closed-form
+    geometric series; IRR, discounted payback and the yearly balances use
+    (sites, years) arrays, no per-year Python loop.
+
+    Returns {name: (n,) array} plus "yearly_balance" (n, years): the owner's
+    cumulative position at the end of each year, after loan repayments (or the
+    upfront payment when there is no loan). Years / IRR are NaN when never reached.
+    """
+    cost, income, installment, loan_years = np.broadcast_arrays(*[
+        np.atleast_1d(np.asarray(v, dtype=np.float64))
+        for v in (total_cost, monthly_income, loan_installment, loan_years)
+    ])
+    income_1 = income * 12
+    om_1 = cost * om_share
+    growth = (1 - degradation) * (1 + escalation)
+
+    # Closed form: NPV of the project (paid upfront) and undiscounted lifetime totals
+    npv = income_1 * _growth_sum(growth, discount_rate, years) - om_1 * _growth_sum(1 + om_escalation, discount_rate, years) - cost
+    lifetime_income = income_1 * _growth_sum(growth, 0.0, years)
+    lifetime_om = om_1 * _growth_sum(1 + om_escalation, 0.0, years)
+
+    # Yearly arrays (sites, years)
+    t = np.arange(1, years + 1)
+    flows = income_1[:, None] * growth ** (t - 1) - om_1[:, None] * (1 + om_escalation) ** (t - 1)
+    irr = _irr(cost, flows, years)
+
+    discounted = np.cumsum(flows / (1 + discount_rate) ** t, axis=1)
+    paid_back = discounted >= cost[:, None]
+    first = paid_back.argmax(axis=1)  # First year the discounted flows cover the cost
+    rows = np.arange(len(cost))
+    before = np.where(first > 0, discounted[rows, first - 1], 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = (cost - before) / (discounted[rows, first] - before)
+    discounted_payback = np.where(paid_back.any(axis=1), first + fraction, np.nan)
+
+    repayments = np.where(t <= loan_years[:, None], installment[:, None] * 12, 0.0)
+    upfront = np.where(installment > 0, 0.0, cost)  # Financed systems cost nothing upfront
+    yearly_balance = np.cumsum(flows - repayments, axis=1) - upfront[:, None]
+
+    return {
+        "npv_lkr": npv,
+        "irr_percent": irr * 100,
+        "discounted_payback_years": discounted_payback,
+        "lifetime_net_income_lkr": lifetime_income - lifetime_om,
+        "yearly_balance": yearly_balance,
+    }
@@ -1,12 +1,36 @@
-from ultralytics import YOLO
+import os
+import time
 import cv2
 import numpy as np
-import base64
+from services.batch_inference import BatchInferenceServer
+from services.inference_backends import load_backend
+from services.georef import upload_georef
+from services.image_artifact import ImageArtifact
+from services.metrics import stage, IMAGE_REJECTIONS
+
+# Accuracy / latency trade-offs, selectable per request.
+# augment=True is test-time augmentation: several forward passes per image.
+INFERENCE_PROFILES = {
+    "fast": {"imgsz": 640, "augment": False, "conf": 0.15},
+    "balanced": {"imgsz": 1024, "augment": False, "conf": 0.15},
+    "accurate": {"imgsz": 1024, "augment": True, "conf": 0.15},
+}
+# "adaptive" runs "fast" first and only escalates to "accurate" when the
+# fast result looks unreliable (low confidence or almost no roof found).
+ADAPTIVE_PROFILE = "adaptive"
+ADAPTIVE_MIN_CONFIDENCE = float(os.getenv("SOLIX_ADAPTIVE_MIN_CONF", "0.4"))
+ADAPTIVE_MIN_COVERAGE = float(os.getenv("SOLIX_ADAPTIVE_MIN_COVERAGE", "0.02"))
+PROFILE_NAMES = list(INFERENCE_PROFILES) + [ADAPTIVE_PROFILE]
+DEFAULT_PROFILE = os.getenv("SOLIX_INFERENCE_PROFILE", "accurate")
 
 class SolarVision:
-    def __init__(self):
-        # Load the model once
-        self.model = YOLO("best.pt") 
+    def __init__(self, backend=None):
+        # Load the model once (ultralytics/torch or ONNX Runtime, see SOLIX_CV_BACKEND)
+        self.backend = backend if backend is not None else load_backend()
+        # Weights hash (+ runtime): part of every cached result's key, see services/result_store.py
+        self.model_version = f"{self.backend.name}-{getattr(self.backend, 'version', 'unknown')}"
+        # Concurrent requests share forward passes instead of queuing one by one
+        self.batcher = BatchInferenceServer(self.backend.predict)
 
     def validate_image(self, img):
         """
@@ -27,59 +51,174 @@ class SolarVision:
 
         return True, "OK"
 
-    def analyze_image(self, image_bytes):
-        # Convert bytes to Image
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    def _count_pixels(self, flat):
+        """True pixels per row of a bool (N, P) array."""
+        if hasattr(np, "bitwise_count") and flat.flags.c_contiguous and flat.shape[1] % 8 == 0:
+            # bool is one 0/1 byte: popcount over 8-byte words is the fastest count
+            return np.bitwise_count(flat.view(np.uint64)).sum(axis=1)
+        return np.count_nonzero(flat, axis=1)
+
+    def ground_resolution(self, georef, image_shape):
+        """m/px of the image actually analysed (corrects for any resize since fetching)."""
+        m_per_px = georef["m_per_px"]
+        if georef.get("image_px"):
+            m_per_px *= georef["image_px"] / image_shape[1]
+        return m_per_px
+
+    def measure_objects(self, result, image_shape, m_per_px):
+        """
+        Detections -> [{id, pixel_area, estimated_m2}] (same for every backend).
+        m_per_px: ground resolution of the image (see services.georef).
+
+        Areas are counted on the mask stack directly (no per-object resize) and
+        scaled analytically to image pixels. Pixels shared by overlapping masks
+        are counted once, for the most confident instance, so summing
+        estimated_m2 gives the area of the union.
+        """
+        masks = result.masks
+        count = len(masks)
+        if count == 0:
+            return []
+
+        # Masks larger than the image (ultralytics upsamples to imgsz): nearest-neighbour
+        # downscaling by an integer factor is just a strided view
+        step_y = max(masks.shape[1] // image_shape[0], 1)
+        step_x = max(masks.shape[2] // image_shape[1], 1)
+        if step_y > 1 or step_x > 1:
+            masks = masks[:, ::step_y, ::step_x]
+
+        # Most confident first (backends already sort, so usually no copy)
+        order = np.argsort(-np.asarray(result.scores), kind="stable")
+        if not np.array_equal(order, np.arange(count)):
+            masks = masks[order]
+        # Per-instance pixel counts for the whole stack at once
+        owned_pixels = self._count_pixels(masks.reshape(count, -1))
+
+        if count > 1:
+            # Masks are cropped to their boxes, so overlaps can only happen
+            # inside the box (+1 px for rounding) -> box windows in mask pixels
+            boxes = np.asarray(result.boxes, dtype=np.float64)[order]
+            fy, fx = masks.shape[1] / image_shape[0], masks.shape[2] / image_shape[1]
+            x0 = np.clip(np.floor(boxes[:, 0] * fx) - 1, 0, masks.shape[2]).astype(int)
+            y0 = np.clip(np.floor(boxes[:, 1] * fy) - 1, 0, masks.shape[1]).astype(int)
+            x1 = np.clip(np.ceil(boxes[:, 2] * fx) + 1, 0, masks.shape[2]).astype(int)
+            y1 = np.clip(np.ceil(boxes[:, 3] * fy) + 1, 0, masks.shape[1]).astype(int)
+
+            # Remove pixels already claimed by a more confident instance
+            claimed = masks[0].copy()
+            for rank in range(1, count):
+                window = (slice(y0[rank], y1[rank]), slice(x0[rank], x1[rank]))
+                mask = masks[rank][window]
+                owned_pixels[rank] -= np.count_nonzero(mask & claimed[window])
+                claimed[window] |= mask
+
+        # Mask pixel -> original image pixels (same as resizing the mask up)
+        scale = (image_shape[0] * image_shape[1]) / (masks.shape[1] * masks.shape[2])
+        pixel_areas = owned_pixels * scale
+        # Area Calculation (Web Mercator pixel size at this zoom + latitude)
+        areas_m2 = pixel_areas * (m_per_px * m_per_px)
+
+        detected_objects = [None] * count
+        for rank, i in enumerate(order.tolist()):
+            detected_objects[i] = {
+                "id": i,
+                "pixel_area": float(pixel_areas[rank]),
+                "estimated_m2": float(areas_m2[rank])
+            }
+        return detected_objects
+
+    def _run_profile(self, img, profile):
+        t0 = time.perf_counter()
+        result = self.batcher.predict(img, **INFERENCE_PROFILES[profile])
+        latency_ms = round((time.perf_counter() - t0) * 1000, 1)
+        return result, {"profile": profile, "latency_ms": latency_ms}
+
+    def _needs_escalation(self, result):
+        if len(result) == 0:
+            return True
+        confidence = float(np.mean(result.scores))
+        coverage = float(result.masks.any(axis=0).mean())
+        return confidence < ADAPTIVE_MIN_CONFIDENCE or coverage < ADAPTIVE_MIN_COVERAGE
+
+    def warm_up(self, profile=DEFAULT_PROFILE):
+        """One dummy inference per pass of `profile`, so the first real request doesn't pay for lazy init."""
+        img = np.zeros((256, 256, 3), dtype=np.uint8)
+        profiles = ["fast", "accurate"] if profile == ADAPTIVE_PROFILE else [profile]
+        for name in profiles:
+            self.backend.predict([img], **INFERENCE_PROFILES[name])
+
+    def run_inference(self, img, profile=DEFAULT_PROFILE):
+        """Runs a named profile. Returns (detections, timing info for the response)."""
+        if profile not in PROFILE_NAMES:
+            raise ValueError(f"Unknown inference profile: {profile}")
+
+        if profile != ADAPTIVE_PROFILE:
+            result, run = self._run_profile(img, profile)
+            passes = [run]
+        else:
+            result, run = self._run_profile(img, "fast")
+            passes = [run]
+            if self._needs_escalation(result):
+                result, run = self._run_profile(img, "accurate")
+                passes.append(run)
+
+        return result, {
+            "profile": profile,
+            "escalated": len(passes) > 1,
+            "passes": passes,
+            "latency_ms": round(sum(p["latency_ms"] for p in passes), 1),
+        }
+
+    def analyze_image(self, image, profile=DEFAULT_PROFILE, georef=None):
+        # Accepts encoded bytes (upload / single tile) or a decoded BGR array (mosaic)
+        # georef: ground resolution from services.georef (None -> zoom-19 tile at the equator)
+        if georef is None:
+            georef = upload_georef(0.0)
+        if isinstance(image, np.ndarray):
+            img = image
+        else:
+            with stage("decode"):
+                nparr = np.frombuffer(image, np.uint8)
+                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
         # --- STEP 1: Pre-check Quality ---
-        is_valid, reason = self.validate_image(img)
+        with stage("validate"):
+            is_valid, reason = self.validate_image(img)
         if not is_valid:
             # Return empty result with error warning if bad image
             print(f"⚠️ Image Rejected: {reason}")
+            IMAGE_REJECTIONS.inc(reason=reason)
+            # Nothing to annotate: hand back the input (uploaded JPEGs are not re-encoded)
+            if image is img:
+                original = ImageArtifact(pixels=img)
+            else:
+                original = ImageArtifact.from_upload(image, pixels=img)
             return {
                 "detection_count": 0,
                 "objects": [],
-                "annotated_image": base64.b64encode(image_bytes).decode('utf-8'),
+                "annotated_image": original,
                 "warning": reason
             }
 
-        # --- STEP 2: Advanced Inference (The Accuracy Fix) ---
-        # augment=True: Flips/rotates image internally to find more objects
-        # imgsz=1024: Upscales image to detect small objects (chimneys/vents)
+        # --- STEP 2: Inference with the requested profile ---
+        # "accurate" (default) = imgsz 1024 + TTA: finds small objects (chimneys/vents)
         # conf=0.15: Lowers threshold slightly to catch faint panels
-        results = self.model(img, augment=True, imgsz=1024, conf=0.15)
-        result = results[0]
+        with stage("inference"):
+            result, inference_info = self.run_inference(img, profile)
 
-        detected_objects = []
-        
         # --- STEP 3: Process Results ---
-        if result.masks:
-            for i, mask in enumerate(result.masks.data):
-                # Move to CPU and convert to numpy
-                mask_np = mask.cpu().numpy()
-                
-                # Resize mask back to original image size (YOLO masks are smaller)
-                mask_resized = cv2.resize(mask_np, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
-                
-                pixel_area = np.sum(mask_resized)
-                
-                # Area Calculation (0.09 m^2 per pixel at Zoom 19)
-                real_world_area = float(pixel_area) * 0.09 
-
-                detected_objects.append({
-                    "id": i,
-                    "pixel_area": float(pixel_area),
-                    "estimated_m2": real_world_area 
-                })
-
-        # Generate Annotated Image
-        annotated_img = result.plot()
-        _, encoded_img = cv2.imencode('.jpg', annotated_img)
-        img_base64 = base64.b64encode(encoded_img).decode('utf-8')
+        m_per_px = self.ground_resolution(georef, img.shape)
+        with stage("masks"):
+            detected_objects = self.measure_objects(result, img.shape, m_per_px)
+
+        # Generate Annotated Image (encoded lazily, once, by whoever needs the JPEG)
+        with stage("annotate"):
+            annotated_img = ImageArtifact(pixels=result.plot())
 
         return {
             "detection_count": len(detected_objects),
             "objects": detected_objects,
-            "annotated_image": img_base64
+            "annotated_image": annotated_img,
+            "inference": inference_info,
+            "ground_resolution": {"zoom": georef["zoom"], "lat": georef["lat"], "m_per_px": round(m_per_px, 4)}
         }
\ No newline at end of file
@@ -0,0 +1,151 @@
+import functools
+import os
+
+import numpy as np
+
+# Typical (non-leap) year
+DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+MONTH_OF_DAY = np.repeat(np.arange(12), DAYS_IN_MONTH)  # (365,)
+HOURS = 24 * len(MONTH_OF_DAY)  # 8760
+
+# Middle of Sri Lanka, used when a site has no latitude
+DEFAULT_LAT = 7.9
+PERFORMANCE_RATIO = 0.75  # Same derate as calculate_roi
+
+# Battery: charged from PV during the day, exported in the CEB evening peak.
+# Power is sized so a full battery empties within the peak window, so every
+# day starts with an empty battery and days can be simulated independently.
+BATTERY_KWH_PER_KW = float(os.getenv("SOLIX_BATTERY_KWH_PER_KW", "2.0"))  # Storage per kW of PV
+BATTERY_EFFICIENCY = float(os.getenv("SOLIX_BATTERY_EFFICIENCY", "0.9"))  # Round trip
+PEAK_HOURS = np.arange(18, 22)  # 18:00-22:00 (CEB peak is 18:30-22:30)
+
+SIM_CHUNK = int(os.getenv("SOLIX_SIM_CHUNK", "128"))  # Sites simulated per step (memory bound)
+
+# Share of the daily consumption per hour (each sums to 1)
+LOAD_PROFILES = {
+    # Morning bump, low daytime use, evening peak (lights, cooking, TV)
+    "residential": np.array([
+        2.5, 2.2, 2.0, 2.0, 2.2, 3.0, 4.5, 4.8, 4.0, 3.2, 3.0, 3.0,
+        3.2, 3.2, 3.0, 3.0, 3.4, 4.5, 6.5, 7.8, 7.6, 6.5, 4.8, 3.6,
+    ]),
+    # Office / shop hours
+    "commercial": np.array([
+        1.5, 1.5, 1.5, 1.5, 1.5, 1.8, 2.5, 4.0, 6.5, 7.5, 7.8, 7.8,
+        7.5, 7.8, 7.8, 7.5, 6.8, 5.0, 3.2, 2.5, 2.0, 1.8, 1.6, 1.5,
+    ]),
+}
+LOAD_PROFILES = {name: weights / weights.sum() for name, weights in LOAD_PROFILES.items()}
+
+
+@functools.lru_cache(maxsize=256)
+def _clear_sky_shape(lat_tenths):
+    """
+    Hourly shape of the clear-sky irradiance at a latitude, (365, 24).
+    Scaled so the mean daily total over each month is 1: multiplying by
+    that month's kWh/m2/day gives hourly kWh/m2 that add up to the
+    NASA monthly value.
+    """
+    lat = np.radians(lat_tenths / 10)
+    day = np.arange(1, 366)[:, None]
+    hour = np.arange(24)[None, :] + 0.5  # Solar time, middle of the hour
+    declination = np.radians(23.45) * np.sin(2 * np.pi * (284 + day) / 365)
+    hour_angle = np.radians(15 * (hour - 12))
+    cos_zenith = np.sin(lat) * np.sin(declination) + np.cos(lat) * np.cos(declination) * np.cos(hour_angle)
+    cos_zenith = np.clip(cos_zenith, 0, None)
+    # Haurwitz clear-sky model (W/m2); zero below the horizon
+    with np.errstate(divide="ignore"):
+        ghi = np.where(cos_zenith > 0, 1098 * cos_zenith * np.exp(-0.057 / cos_zenith), 0.0)
+
+    daily = ghi.sum(axis=1)
+    monthly_mean = np.bincount(MONTH_OF_DAY, weights=daily) / DAYS_IN_MONTH
+    shape = ghi / monthly_mean[MONTH_OF_DAY][:, None]
+    shape.flags.writeable = False  # Shared between calls
+    return shape
+
+
+def hourly_irradiance(monthly, lat):
+    """[JAN..DEC] kWh/m2/day per site (n, 12) + latitudes (n,) -> hourly kWh/m2 (n, 365, 24)."""
+    keys = np.round(np.asarray(lat, dtype=np.float64) * 10).astype(int)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    shapes = np.stack([_clear_sky_shape(int(key)) for key in unique])
+    return shapes[inverse] * monthly[:, MONTH_OF_DAY, None]
+
+
+def _simulate_chunk(monthly, lat):
+    """PV + battery for one kW of PV (battery size and power scale with the system)."""
+    pv = PERFORMANCE_RATIO * hourly_irradiance(monthly, lat)  # kWh per hour
+
+    # Battery charging: greedy from the first sunny hour, limited by power and capacity
+    power = BATTERY_KWH_PER_KW / len(PEAK_HOURS)
+    absorbed = np.diff(np.minimum(np.cumsum(np.minimum(pv, power), axis=2), BATTERY_KWH_PER_KW), axis=2, prepend=0)
+    stored = absorbed.sum(axis=2, keepdims=True) * BATTERY_EFFICIENCY
+
+    # Discharge at full power from the start of the peak window until empty
+    steps = power * np.arange(1, len(PEAK_HOURS) + 1)
+    discharge = np.zeros_like(pv)
+    discharge[:, :, PEAK_HOURS] = np.diff(np.minimum(steps, stored), axis=2, prepend=0)
+
+    generation = pv.sum(axis=(1, 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = {
+            "generation_per_kw": generation,
+            "battery_charge_share": np.where(generation > 0, absorbed.sum(axis=(1, 2)) / generation, 0.0),
+            "battery_export_share": np.where(generation > 0, discharge.sum(axis=(1, 2)) / generation, 0.0),
+        }
+    supply = pv - absorbed + discharge  # What the house could draw each hour
+    return shares, supply
+
+
+def _load_coverage(supply, load_per_kw, load_shape):
+    """Share of the load met hour by hour, for loads (n,) against supplies (n, 365, 24), both per kW."""
+    load = load_per_kw[:, None] * load_shape  # (n, 24), the same every day
+    covered = np.minimum(load[:, None, :], supply).sum(axis=(1, 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(load_per_kw > 0, covered / (load.sum(axis=1) * len(MONTH_OF_DAY)), 0.0)
+
+
+def simulate_year(system_kw, monthly_irradiance, lat=DEFAULT_LAT, monthly_load_kwh=0.0, load_profile="residential"):
+    """
+    Typical-year hourly (8760 h) simulation of PV + battery for many sites.
+
+    system_kw, lat, monthly_load_kwh: (n,) arrays or scalars.
+    monthly_irradiance: (n, 12) or (12,) kWh/m2/day, e.g. NASA POWER climatology.
+    Returns {name: (n,) array}:
+      annual_generation_kwh  - PV output over the year
+      battery_charge_share   - share of the PV output that goes into the battery
+      battery_export_share   - share that comes back out in the evening peak (after losses)
+      load_coverage          - share of the household load matched hour by hour by PV + battery
+    """
+    monthly = np.asarray(monthly_irradiance, dtype=np.float64)
+    kw = np.asarray(system_kw, dtype=np.float64)
+    n = max(kw.size, np.asarray(lat).size, np.asarray(monthly_load_kwh).size, monthly.size // 12)
+    kw = np.broadcast_to(kw, (n,))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        load_per_kw = np.broadcast_to(np.where(kw > 0, np.asarray(monthly_load_kwh, dtype=np.float64) / 30 / kw, 0.0), (n,))
+    load_shape = LOAD_PROFILES[load_profile]
+
+    # Everything but the load coverage scales with system size, so sites (or
+    # sweep scenarios) with the same climate + latitude share one simulation
+    climates = np.column_stack([
+        np.broadcast_to(monthly.reshape(-1, 12), (n, 12)),
+        np.broadcast_to(np.asarray(lat, dtype=np.float64), (n,)),
+    ])
+    climates, climate_of_site = np.unique(climates, axis=0, return_inverse=True)
+    climate_of_site = climate_of_site.reshape(-1)
+
+    result = {name: np.empty(n) for name in ("generation_per_kw", "battery_charge_share",
+                                             "battery_export_share", "load_coverage")}
+    # (sites, 365, 24) float64 is 70 KB per site, so large batches go in chunks
+    for start in range(0, len(climates), SIM_CHUNK):
+        shares, supply = _simulate_chunk(climates[start:start + SIM_CHUNK, :12], climates[start:start + SIM_CHUNK, 12])
+        sites = np.flatnonzero((climate_of_site >= start) & (climate_of_site < start + SIM_CHUNK))
+        local = climate_of_site[sites] - start
+        for name, values in shares.items():
+            result[name][sites] = values[local]
+        # Coverage only needs one pass per distinct load / PV ratio
+        loads, load_index = np.unique(np.column_stack([local, load_per_kw[sites]]), axis=0, return_inverse=True)
+        coverage = _load_coverage(supply[loads[:, 0].astype(int)], loads[:, 1], load_shape)
+        result["load_coverage"][sites] = coverage[load_index.reshape(-1)]
+
+    result["annual_generation_kwh"] = result.pop("generation_per_kw") * kw
+    return result
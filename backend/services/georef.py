@@ -0,0 +1,83 @@
+import functools
+import math
+import os
+
+# Web Mercator (EPSG:3857) constants, as used by Esri / Google / OSM tiles
+EARTH_CIRCUMFERENCE_M = 2 * math.pi * 6378137.0
+TILE_SIZE = 256
+
+# Zoom used for satellite tiles (lower = cheaper tiles, fewer pixels per roof)
+DEFAULT_ZOOM = int(os.getenv("SOLIX_TILE_ZOOM", "19"))
+
+# Resolutions are cached per (zoom, latitude band). Inside a 0.01 degree band
+# cos(lat) changes by less than 0.005% at Sri Lankan latitudes.
+LAT_BAND_DEG = 0.01
+
+
+# Mathematical magic to convert Lat/Lon to "Tile Coordinates" (Web Mercator)
+def deg2num_float(lat_deg, lon_deg, zoom):
+    """Fractional tile coordinates: the decimals are the position inside the tile."""
+    lat_rad = math.radians(lat_deg)
+    n = 2.0 ** zoom
+    xtile = (lon_deg + 180.0) / 360.0 * n
+    ytile = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n
+    return (xtile, ytile)
+
+def deg2num(lat_deg, lon_deg, zoom):
+    xtile, ytile = deg2num_float(lat_deg, lon_deg, zoom)
+    return (int(xtile), int(ytile))
+
+def num2lat(ytile, zoom):
+    """Inverse of deg2num for the y axis (fractional tiles allowed)."""
+    n = 2.0 ** zoom
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ytile / n))))
+
+
+@functools.lru_cache(maxsize=4096)
+def _band_resolution(zoom, band):
+    lat = (band + 0.5) * LAT_BAND_DEG
+    return EARTH_CIRCUMFERENCE_M * math.cos(math.radians(lat)) / (TILE_SIZE * 2 ** zoom)
+
+def metres_per_pixel(lat, zoom=DEFAULT_ZOOM, resize=1.0):
+    """
+    Ground size of one pixel at `lat`.
+    resize = image pixels / native tile pixels (0.5 if the image was halved).
+    """
+    return _band_resolution(zoom, math.floor(lat / LAT_BAND_DEG)) / resize
+
+
+def tile_georef(lat, lon, zoom=DEFAULT_ZOOM, grid=1):
+    """
+    Georeference of an image from fetch_satellite_image (grid=1) or
+    fetch_satellite_mosaic_async (grid > 1), for SolarVision.analyze_image.
+
+    A single tile is centred on the tile, not on the point; the mosaic crop
+    is centred on the point. `image_px` is the width the fetcher delivers,
+    so a tile served at another size is corrected for automatically.
+    """
+    grid = max(1, grid if grid % 2 else grid + 1)
+    if grid == 1:
+        _, ytile = deg2num(lat, lon, zoom)
+        centre_lat = num2lat(ytile + 0.5, zoom)
+        image_px = TILE_SIZE
+    else:
+        centre_lat = lat
+        image_px = (grid - 1) * TILE_SIZE
+    return {
+        "zoom": zoom,
+        "lat": round(centre_lat, 6),
+        "m_per_px": metres_per_pixel(centre_lat, zoom),
+        "image_px": image_px,
+    }
+
+def upload_georef(lat, zoom=DEFAULT_ZOOM):
+    """
+    Uploaded images have no known scale: assume a native tile at `zoom`
+    (the old fixed 0.09 m^2/px was this assumption at the equator).
+    """
+    return {
+        "zoom": zoom,
+        "lat": round(lat, 6),
+        "m_per_px": metres_per_pixel(lat, zoom),
+        "image_px": None,
+    }
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from io import BytesIO
+from PIL import Image
+
+JPEG_QUALITY = int(os.getenv("SOLIX_JPEG_QUALITY", "90"))
+IMAGE_CACHE_ITEMS = int(os.getenv("SOLIX_IMAGE_CACHE_ITEMS", "256"))
+IMAGE_CACHE_TTL = int(os.getenv("SOLIX_IMAGE_CACHE_TTL", "3600"))  # seconds
+
+
+class ImageArtifact:
+    """
+    One image moving through the pipeline: decoded BGR pixels and/or its JPEG.
+
+    Whichever form is missing is produced on first use and kept, so an image
+    is decoded at most once and encoded at most once per request, however
+    many consumers (PDF, API, cache) ask for it.
+    """
+
+    def __init__(self, pixels=None, jpeg=None):
+        if pixels is None and jpeg is None:
+            raise ValueError("ImageArtifact needs pixels or JPEG bytes")
+        self.id = uuid.uuid4().hex
+        self._pixels = pixels
+        self._jpeg = jpeg
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_upload(cls, data, pixels=None):
+        """Encoded bytes as received. JPEG is kept as-is; other formats are re-encoded later."""
+        if bytes(data[:2]) == b"\xff\xd8":
+            return cls(pixels=pixels, jpeg=bytes(data))
+        if pixels is None:
+            pixels = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        return cls(pixels=pixels)
+
+    @property
+    def pixels(self):
+        if self._pixels is None:
+            with self._lock:
+                if self._pixels is None:
+                    self._pixels = cv2.imdecode(np.frombuffer(self._jpeg, np.uint8), cv2.IMREAD_COLOR)
+        return self._pixels
+
+    @property
+    def size(self):
+        """(width, height) without decoding the JPEG if the pixels are gone."""
+        if self._pixels is not None:
+            return self._pixels.shape[1], self._pixels.shape[0]
+        with Image.open(BytesIO(self._jpeg)) as img:
+            return img.size
+
+    def jpeg(self):
+        if self._jpeg is None:
+            with self._lock:
+                if self._jpeg is None:
+                    ok, encoded = cv2.imencode(".jpg", self._pixels, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                    if not ok:
+                        raise ValueError("Could not encode image as JPEG")
+                    self._jpeg = encoded.tobytes()
+        return self._jpeg
+
+    def __getstate__(self):
+        # Pickled for other worker processes (queued reports): the JPEG is enough
+        return {"id": self.id, "jpeg": self.jpeg()}
+
+    def __setstate__(self, state):
+        self.id = state["id"]
+        self._pixels = None
+        self._jpeg = state["jpeg"]
+        self._lock = threading.Lock()
+
+    def compact(self):
+        """Drop the decoded pixels once a JPEG exists (it is ~10x smaller)."""
+        with self._lock:
+            if self._jpeg is not None:
+                self._pixels = None
+
+
+class ImageCache:
+    """
+    Recent artifacts by id (in memory), so the API can return a URL instead
+    of inlining the image as base64. Oldest entries go first (count + TTL).
+    With a `shared` SharedDir (multi-worker serving) the JPEGs are also
+    written there, and an id this process doesn't know is looked up on disk.
+    """
+
+    def __init__(self, max_items=IMAGE_CACHE_ITEMS, ttl_seconds=IMAGE_CACHE_TTL, shared=None):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._items = OrderedDict()  # id -> (created, artifact)
+        self._lock = threading.Lock()
+
+    def put(self, artifact):
+        # Only the JPEG is served from here, so don't hold on to raw pixels
+        artifact.jpeg()
+        artifact.compact()
+        with self._lock:
+            self._items[artifact.id] = (time.time(), artifact)
+            self._trim()
+        if self.shared is not None:
+            self.shared.write(f"{artifact.id}.jpg", artifact.jpeg())
+        return artifact.id
+
+    def get(self, artifact_id):
+        with self._lock:
+            self._trim()
+            entry = self._items.get(artifact_id)
+        if entry is not None:
+            return entry[1]
+        if self.shared is None or not artifact_id.isalnum():
+            return None
+        jpeg = self.shared.read(f"{artifact_id}.jpg")  # Cached by another worker
+        if jpeg is None:
+            return None
+        artifact = ImageArtifact(jpeg=jpeg)
+        artifact.id = artifact_id
+        with self._lock:
+            self._items[artifact_id] = (time.time(), artifact)
+            self._trim()
+        return artifact
+
+    def _trim(self):
+        # Caller holds the lock
+        cutoff = time.time() - self.ttl_seconds
+        while self._items:
+            created, _ = next(iter(self._items.values()))
+            if len(self._items) <= self.max_items and created >= cutoff:
+                break
+            self._items.popitem(last=False)
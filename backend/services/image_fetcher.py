@@ -1,36 +1,203 @@
-import math
+import asyncio
+import threading
+from concurrent.futures import Future
+import cv2
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+import httpx
 from PIL import Image
 from io import BytesIO
+from services.tile_cache import TileCache
+from services.georef import DEFAULT_ZOOM, TILE_SIZE, deg2num, deg2num_float
 
-# Mathematical magic to convert Lat/Lon to "Tile Coordinates" (Web Mercator)
-def deg2num(lat_deg, lon_deg, zoom):
-    lat_rad = math.radians(lat_deg)
-    n = 2.0 ** zoom
-    xtile = int((lon_deg + 180.0) / 360.0 * n)
-    ytile = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
-    return (xtile, ytile)
+# Esri World Imagery URL (Free to use for education)
+TILE_URL = "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{zoom}/{y}/{x}"
+TILE_HEADERS = {'User-Agent': 'Mozilla/5.0'}
 
-def fetch_satellite_image(lat, lon, zoom=19):
-    """
-    Downloads the satellite image for a specific lat/lon from Esri World Imagery.
-    """
-    xtile, ytile = deg2num(lat, lon, zoom)
-    
-    # Esri World Imagery URL (Free to use for education)
-    url = f"https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{zoom}/{ytile}/{xtile}"
-    
+# Tiles never change for a location, so repeat analyses are served from disk
+tile_cache = TileCache()
+
+# Downloads currently running, so concurrent requests for one tile share it
+_inflight = {}        # (zoom, x, y) -> concurrent.futures.Future
+_inflight_async = {}  # (zoom, x, y) -> asyncio.Task downloading it
+_inflight_lock = threading.Lock()
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Shared keep-alive session for the sync code path."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers.update(TILE_HEADERS)
+                session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+                _session = session
+    return _session
+
+def _download_tile(zoom, xtile, ytile):
+    url = TILE_URL.format(zoom=zoom, x=xtile, y=ytile)
     try:
-        # 1. Download the image tile
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, timeout=10)
-        
+        response = get_session().get(url, timeout=10)
         if response.status_code == 200:
-            # 2. Return the image bytes
             return response.content
-        else:
-            print(f"Error downloading tile: Status {response.status_code}")
-            return None
+        print(f"Error downloading tile: Status {response.status_code}")
+        return None
     except Exception as e:
         print(f"Error fetching image: {e}")
-        return None
\ No newline at end of file
+        return None
+
+async def _download_tile_async(zoom, xtile, ytile, client):
+    url = TILE_URL.format(zoom=zoom, x=xtile, y=ytile)
+    try:
+        response = await client.get(url, headers=TILE_HEADERS, timeout=10)
+        if response.status_code == 200:
+            return response.content
+        print(f"Error downloading tile: Status {response.status_code}")
+        return None
+    except Exception as e:
+        print(f"Error fetching image: {e}")
+        return None
+
+def _store_tile(zoom, xtile, ytile, data):
+    # A full/read-only disk must not fail the analysis
+    try:
+        tile_cache.put(zoom, xtile, ytile, data)
+    except OSError as e:
+        print(f"⚠️ Could not cache tile: {e}")
+
+def fetch_tile(zoom, xtile, ytile):
+    """Cached + coalesced tile download (blocking)."""
+    data = tile_cache.get(zoom, xtile, ytile)
+    if data is not None:
+        return data
+
+    key = (zoom, xtile, ytile)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+    if not is_leader:
+        return future.result()
+
+    try:
+        data = _download_tile(zoom, xtile, ytile)
+        if data:
+            _store_tile(zoom, xtile, ytile, data)
+    except BaseException as e:
+        future.set_exception(e)  # Waiters fail the same way, not with a silent None
+        raise
+    else:
+        future.set_result(data)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+    return data
+
+async def _download_and_store_async(key, client):
+    zoom, xtile, ytile = key
+    own_client = client is None
+    if own_client:
+        client = httpx.AsyncClient()
+    try:
+        data = await _download_tile_async(zoom, xtile, ytile, client)
+        if data:
+            await asyncio.to_thread(_store_tile, zoom, xtile, ytile, data)
+        return data
+    finally:
+        _inflight_async.pop(key, None)
+        if own_client:
+            await client.aclose()
+
+async def fetch_tile_async(zoom, xtile, ytile, client=None):
+    """Cached + coalesced tile download for the event loop."""
+    data = await asyncio.to_thread(tile_cache.get, zoom, xtile, ytile)
+    if data is not None:
+        return data
+
+    key = (zoom, xtile, ytile)
+    task = _inflight_async.get(key)
+    if task is None:
+        # A task of its own: the request that started it disconnecting doesn't cancel it for the others
+        task = asyncio.ensure_future(_download_and_store_async(key, client))
+        _inflight_async[key] = task
+    return await asyncio.shield(task)
+
+def fetch_satellite_image(lat, lon, zoom=DEFAULT_ZOOM):
+    """
+    Downloads the satellite image for a specific lat/lon from Esri World Imagery.
+    """
+    xtile, ytile = deg2num(lat, lon, zoom)
+    return fetch_tile(zoom, xtile, ytile)
+
+async def fetch_satellite_image_async(lat, lon, zoom=DEFAULT_ZOOM, client=None):
+    """
+    Non-blocking version of fetch_satellite_image for the API.
+    Pass the app's shared httpx.AsyncClient to reuse connections.
+    """
+    xtile, ytile = deg2num(lat, lon, zoom)
+    return await fetch_tile_async(zoom, xtile, ytile, client=client)
+
+
+def stitch_mosaic(tiles, grid, xtile_f, ytile_f):
+    """
+    Decodes a grid x grid block of tiles (row-major, None = missing) into one
+    BGR buffer and crops it around the exact pixel of (xtile_f, ytile_f).
+    The crop is (grid - 1) tiles wide, which always fits inside the mosaic.
+    """
+    mosaic = np.zeros((grid * TILE_SIZE, grid * TILE_SIZE, 3), dtype=np.uint8)
+    for i, data in enumerate(tiles):
+        if not data:
+            continue  # Missing neighbour stays black
+        tile = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if tile is None:
+            continue
+        if tile.shape[:2] != (TILE_SIZE, TILE_SIZE):
+            tile = cv2.resize(tile, (TILE_SIZE, TILE_SIZE), interpolation=cv2.INTER_AREA)
+        row, col = divmod(i, grid)
+        mosaic[row * TILE_SIZE:(row + 1) * TILE_SIZE, col * TILE_SIZE:(col + 1) * TILE_SIZE] = tile
+
+    if grid == 1:
+        return mosaic
+
+    # Position of the point inside the mosaic (top-left tile = int(tile) - grid // 2)
+    radius = grid // 2
+    px = (xtile_f - (int(xtile_f) - radius)) * TILE_SIZE
+    py = (ytile_f - (int(ytile_f) - radius)) * TILE_SIZE
+    crop = (grid - 1) * TILE_SIZE
+    x0 = min(max(int(round(px - crop / 2)), 0), mosaic.shape[1] - crop)
+    y0 = min(max(int(round(py - crop / 2)), 0), mosaic.shape[0] - crop)
+    return np.ascontiguousarray(mosaic[y0:y0 + crop, x0:x0 + crop])
+
+async def fetch_satellite_mosaic_async(lat, lon, zoom=DEFAULT_ZOOM, grid=3, client=None):
+    """
+    Fetches the grid x grid neighbourhood around lat/lon in parallel and
+    returns a BGR numpy image centred on the point (no JPEG re-encode).
+    Returns None if the centre tile can't be downloaded.
+    """
+    grid = max(1, grid if grid % 2 else grid + 1)  # Needs a centre tile
+    xtile_f, ytile_f = deg2num_float(lat, lon, zoom)
+    xtile, ytile = int(xtile_f), int(ytile_f)
+    radius = grid // 2
+
+    coords = [(xtile + dx, ytile + dy)
+              for dy in range(-radius, radius + 1)
+              for dx in range(-radius, radius + 1)]
+    own_client = client is None
+    if own_client:
+        client = httpx.AsyncClient()  # One pool for all tiles
+    try:
+        tiles = await asyncio.gather(*[fetch_tile_async(zoom, x, y, client=client) for x, y in coords])
+    finally:
+        if own_client:
+            await client.aclose()
+    if not tiles[len(tiles) // 2]:
+        return None
+
+    # Decoding 9 JPEGs is CPU work -> keep it off the event loop
+    return await asyncio.to_thread(stitch_mosaic, tiles, grid, xtile_f, ytile_f)
@@ -0,0 +1,333 @@
+import ast
+import hashlib
+import os
+
+import cv2
+import numpy as np
+
+# Which runtime SolarVision uses: "ultralytics" (best.pt via torch) or "onnx"
+CV_BACKEND = os.getenv("SOLIX_CV_BACKEND", "ultralytics")
+WEIGHTS_PT = os.getenv("SOLIX_WEIGHTS", "best.pt")
+WEIGHTS_ONNX = os.getenv("SOLIX_ONNX_WEIGHTS", "best.onnx")
+WEIGHTS_ONNX_INT8 = os.getenv("SOLIX_ONNX_INT8_WEIGHTS", "best.int8.onnx")
+ONNX_THREADS = int(os.getenv("SOLIX_ONNX_THREADS", "0"))  # 0 = let ORT decide
+ONNX_INT8 = os.getenv("SOLIX_ONNX_INT8", "0") == "1"
+ORT_PROVIDER = os.getenv("SOLIX_ORT_PROVIDER", "cpu")  # "cpu" or "openvino"
+
+NMS_IOU = 0.7   # Same defaults as ultralytics predict
+MAX_DET = 300
+
+
+def weights_version(path):
+    """Content hash of a weights file: cached results are only reused for the same model."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+class Detections:
+    """
+    Backend-independent segmentation result for one image.
+
+    masks:   bool (N, mh, mw), covering exactly the original image (no
+             letterbox padding) at the model's mask resolution.
+    boxes:   float (N, 4) xyxy in original image pixels
+    scores:  float (N,)
+    classes: int (N,)
+    """
+
+    def __init__(self, masks, boxes, scores, classes, names, orig_shape, plot_fn):
+        self.masks = masks
+        self.boxes = boxes
+        self.scores = scores
+        self.classes = classes
+        self.names = names
+        self.orig_shape = orig_shape
+        self._plot_fn = plot_fn
+
+    def __len__(self):
+        return len(self.scores)
+
+    def plot(self):
+        """Annotated BGR image (same look as ultralytics' result.plot())."""
+        return self._plot_fn()
+
+
+def _strip_letterbox(masks, orig_shape):
+    """Crops letterbox padding off masks shaped (N, H', W')."""
+    mh, mw = masks.shape[1:]
+    oh, ow = orig_shape
+    gain = min(mh / oh, mw / ow)
+    pad_w, pad_h = (mw - ow * gain) / 2, (mh - oh * gain) / 2
+    top, left = int(round(pad_h - 0.1)), int(round(pad_w - 0.1))
+    bottom, right = int(round(mh - pad_h + 0.1)), int(round(mw - pad_w + 0.1))
+    return masks[:, top:bottom, left:right]
+
+
+class UltralyticsBackend:
+    """PyTorch weights through ultralytics (original path)."""
+    name = "ultralytics"
+
+    def __init__(self, weights=WEIGHTS_PT):
+        from ultralytics import YOLO  # Heavy import (torch), only when used
+        self.model = YOLO(weights)
+        self.version = weights_version(getattr(self.model, "ckpt_path", None) or weights)
+
+    def _convert(self, result):
+        if result.masks is None or len(result.masks) == 0:
+            masks = np.zeros((0,) + tuple(result.orig_shape), dtype=bool)
+        else:
+            # One device -> host copy for all instances
+            masks = _strip_letterbox(result.masks.data.cpu().numpy() > 0.5, result.orig_shape)
+        boxes = result.boxes
+        return Detections(
+            masks=masks,
+            boxes=boxes.xyxy.cpu().numpy() if boxes is not None else np.zeros((0, 4)),
+            scores=boxes.conf.cpu().numpy() if boxes is not None else np.zeros(0),
+            classes=boxes.cls.cpu().numpy().astype(int) if boxes is not None else np.zeros(0, int),
+            names=result.names,
+            orig_shape=tuple(result.orig_shape),
+            plot_fn=result.plot,
+        )
+
+    def predict(self, images, imgsz=1024, augment=False, conf=0.15):
+        results = self.model(images, imgsz=imgsz, augment=augment, conf=conf, verbose=False)
+        return [self._convert(r) for r in results]
+
+
+# --- ONNX Runtime helpers (YOLOv8-seg export: output0 = boxes, output1 = protos) ---
+def _letterbox(img, size, rect=False, stride=32):
+    """
+    Resize + pad like ultralytics' LetterBox. rect=True pads only up to a
+    multiple of the stride (needs a dynamic-shape model), else to size x size.
+    Returns (canvas, gain, (left, top)).
+    """
+    h, w = img.shape[:2]
+    gain = min(size / h, size / w)
+    nh, nw = int(round(h * gain)), int(round(w * gain))
+    dw, dh = size - nw, size - nh
+    if rect:
+        dw, dh = dw % stride, dh % stride
+    top, bottom = int(round(dh / 2 - 0.1)), int(round(dh / 2 + 0.1))
+    left, right = int(round(dw / 2 - 0.1)), int(round(dw / 2 + 0.1))
+    if (nw, nh) != (w, h):
+        img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    canvas = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return canvas, gain, (left, top)
+
+
+def _nms(boxes, scores, classes, iou_threshold):
+    """Class-aware NMS (boxes xyxy). Returns kept indices, best score first."""
+    if len(scores) == 0:
+        return np.zeros(0, dtype=int)
+    # Offset boxes per class so different classes never suppress each other
+    offset = boxes + (classes[:, None] * 7680.0)
+    x1, y1, x2, y2 = offset.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size and len(keep) < MAX_DET:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+
+def _bilinear_weights(out_size, in_size):
+    """(out_size, in_size) matrix of bilinear upsampling weights (torch's align_corners=False)."""
+    src = np.clip((np.arange(out_size) + 0.5) * (in_size / out_size) - 0.5, 0, in_size - 1)
+    low = np.floor(src).astype(int)
+    high = np.minimum(low + 1, in_size - 1)
+    weights = np.zeros((out_size, in_size), dtype=np.float32)
+    weights[np.arange(out_size), low] += 1 - (src - low)
+    weights[np.arange(out_size), high] += src - low
+    return weights
+
+
+def _box_masks(coeffs, protos, boxes, canvas_shape):
+    """
+    Instance masks at input resolution, like ultralytics' process_mask(upsample=True):
+    logits upsampled (bilinear) to the input size, > 0, zero outside each box.
+    Only the pixels inside each box are computed (the rest would be cropped anyway).
+    """
+    nm, mh, mw = protos.shape
+    ch, cw = canvas_shape
+    rows, cols = _bilinear_weights(ch, mh), _bilinear_weights(cw, mw)
+    masks = np.zeros((len(boxes), ch, cw), dtype=bool)
+    # Pixel centres inside [x1, x2) x [y1, y2), same rule as ultralytics' crop_mask
+    x0, y0 = np.clip(np.ceil(boxes[:, :2]), 0, [cw, ch]).astype(int).T
+    x1, y1 = np.clip(np.ceil(boxes[:, 2:]), 0, [cw, ch]).astype(int).T
+    for i in range(len(boxes)):
+        if x1[i] <= x0[i] or y1[i] <= y0[i]:
+            continue
+        wy, wx = rows[y0[i]:y1[i]], cols[x0[i]:x1[i]]
+        # Proto rows / cols that feed this window
+        py = np.flatnonzero(wy.any(axis=0))
+        px = np.flatnonzero(wx.any(axis=0))
+        py, px = slice(py[0], py[-1] + 1), slice(px[0], px[-1] + 1)
+        logits = np.tensordot(coeffs[i], protos[:, py, px], axes=1)
+        masks[i, y0[i]:y1[i], x0[i]:x1[i]] = (wy[:, py] @ logits @ wx[:, px].T) > 0
+    return masks
+
+
+def _palette(i):
+    # Deterministic bright colours (BGR)
+    rng = np.random.default_rng(i + 3)
+    return tuple(int(c) for c in rng.integers(64, 255, 3))
+
+
+class OnnxBackend:
+    """
+    ONNX Runtime backend: no torch / ultralytics import at all.
+    Export the model first with export_onnx.py (dynamic input size).
+    """
+    name = "onnx"
+
+    def __init__(self, weights=None, threads=ONNX_THREADS, int8=ONNX_INT8, provider=ORT_PROVIDER):
+        import onnxruntime as ort
+
+        if weights is None:
+            weights = WEIGHTS_ONNX_INT8 if int8 else WEIGHTS_ONNX
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+
+        providers = ["CPUExecutionProvider"]
+        if provider == "openvino" and "OpenVINOExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "OpenVINOExecutionProvider")
+
+        self.session = ort.InferenceSession(weights, sess_options=options, providers=providers)
+        self.version = weights_version(weights)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Static exports have a fixed square size and batch of 1
+        batch, _, height, _ = model_input.shape
+        self.fixed_size = height if isinstance(height, int) else None
+        self.dynamic_batch = not isinstance(batch, int)
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {0: "roof"}
+
+    def _forward(self, canvases):
+        # All canvases share one shape (rect padding only when the inputs match)
+        blob = np.stack(canvases)[..., ::-1].transpose(0, 3, 1, 2)
+        blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+        if self.dynamic_batch or len(canvases) == 1:
+            preds, protos = self.session.run(None, {self.input_name: blob})[:2]
+            return list(zip(preds, protos))
+        outputs = []
+        for i in range(len(canvases)):
+            preds, protos = self.session.run(None, {self.input_name: blob[i:i + 1]})[:2]
+            outputs.append((preds[0], protos[0]))
+        return outputs
+
+    def _decode(self, preds, protos, canvas_shape, conf):
+        """Raw head output -> (boxes xyxy in input px, scores, classes, masks at input res)."""
+        nm = protos.shape[0]
+        preds = preds.T  # (anchors, 4 + nc + nm)
+        nc = preds.shape[1] - 4 - nm
+        class_scores = preds[:, 4:4 + nc]
+        classes = class_scores.argmax(1)
+        scores = class_scores[np.arange(len(classes)), classes]
+        candidates = scores > conf
+        preds, scores, classes = preds[candidates], scores[candidates], classes[candidates]
+
+        cx, cy, w, h = preds[:, :4].T
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        keep = _nms(boxes, scores, classes, NMS_IOU)
+        boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+
+        masks = _box_masks(preds[keep, 4 + nc:], protos, boxes, canvas_shape)
+        return boxes, scores, classes, masks
+
+    def _to_detections(self, img, parts, canvas_shape, gain, pad):
+        boxes, scores, classes, masks = parts
+        oh, ow = img.shape[:2]
+
+        # Input frame -> original frame
+        mh, mw = masks.shape[1:]
+        ch, cw = canvas_shape
+        left, top = pad
+        mx0, my0 = int(round(left * mw / cw)), int(round(top * mh / ch))
+        mx1, my1 = int(round((left + ow * gain) * mw / cw)), int(round((top + oh * gain) * mh / ch))
+        masks = masks[:, my0:my1, mx0:mx1]
+        boxes = (boxes - np.array([left, top, left, top], dtype=np.float32)) / gain
+        boxes = np.clip(boxes, 0, [ow, oh, ow, oh])
+
+        def plot():
+            return self._plot(img, masks, boxes, scores, classes)
+
+        return Detections(masks, boxes, scores, classes, self.names, (oh, ow), plot)
+
+    def _plot(self, img, masks, boxes, scores, classes):
+        annotated = img.copy()
+        if len(masks):
+            # One label map at mask resolution, resized once
+            labels = np.zeros(masks.shape[1:], dtype=np.int32)
+            for i in range(len(masks) - 1, -1, -1):
+                labels[masks[i]] = i + 1
+            labels = cv2.resize(labels.astype(np.float32), (img.shape[1], img.shape[0]),
+                                interpolation=cv2.INTER_NEAREST).astype(np.int32)
+            colours = np.array([(0, 0, 0)] + [_palette(int(c)) for c in classes], dtype=np.uint8)
+            overlay = colours[labels]
+            covered = labels > 0
+            annotated[covered] = (annotated[covered] * 0.5 + overlay[covered] * 0.5).astype(np.uint8)
+        for (x1, y1, x2, y2), score, cls in zip(boxes.astype(int), scores, classes):
+            colour = _palette(int(cls))
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), colour, 2)
+            label = f"{self.names.get(int(cls), cls)} {score:.2f}"
+            cv2.putText(annotated, label, (x1, max(y1 - 4, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.4, colour, 1)
+        return annotated
+
+    def _merge_flip(self, parts, flipped_parts, canvas_width):
+        # Un-mirror the flipped pass, then NMS over both passes
+        boxes, scores, classes, masks = flipped_parts
+        boxes = boxes.copy()
+        boxes[:, [0, 2]] = canvas_width - boxes[:, [2, 0]]
+        masks = masks[:, :, ::-1]
+
+        boxes = np.concatenate([parts[0], boxes])
+        scores = np.concatenate([parts[1], scores])
+        classes = np.concatenate([parts[2], classes])
+        masks = np.concatenate([parts[3], masks])
+        keep = _nms(boxes, scores, classes, NMS_IOU)
+        return boxes[keep], scores[keep], classes[keep], masks[keep]
+
+    def predict(self, images, imgsz=1024, augment=False, conf=0.15):
+        size = self.fixed_size or int(imgsz)
+        # Same rule as ultralytics: minimal (rect) padding when shapes allow it
+        same_shapes = len({img.shape for img in images}) == 1
+        rect = self.fixed_size is None and same_shapes
+        boxed = [_letterbox(img, size, rect=rect) for img in images]
+        canvases = [canvas for canvas, _, _ in boxed]
+        if augment:
+            # Test-time augmentation: extra mirrored pass per image
+            canvases += [np.ascontiguousarray(canvas[:, ::-1]) for canvas in canvases]
+        outputs = self._forward(canvases)
+
+        detections = []
+        for i, (img, (canvas, gain, pad)) in enumerate(zip(images, boxed)):
+            parts = self._decode(*outputs[i], canvas.shape[:2], conf)
+            if augment:
+                flipped = self._decode(*outputs[len(images) + i], canvas.shape[:2], conf)
+                parts = self._merge_flip(parts, flipped, canvas.shape[1])
+            detections.append(self._to_detections(img, parts, canvas.shape[:2], gain, pad))
+        return detections
+
+
+def load_backend(name=CV_BACKEND, **kwargs):
+    if name == "onnx":
+        return OnnxBackend(**kwargs)
+    if name == "ultralytics":
+        return UltralyticsBackend(**kwargs)
+    raise ValueError(f"Unknown CV backend: {name}")
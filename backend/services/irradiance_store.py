@@ -0,0 +1,206 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# NASA POWER climatology keys, in the order they are stored on disk
+MONTHS = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN",
+          "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+FIELDS = MONTHS + ["ANN"]
+
+# Sri Lanka bounding box, sampled on NASA POWER's ~0.5 degree cells
+GRID_BOUNDS = {"lat_min": 5.5, "lat_max": 10.0, "lon_min": 79.5, "lon_max": 82.0}
+GRID_STEP = 0.5
+
+GRID_PATH = os.getenv("SOLIX_IRRADIANCE_GRID", "data/irradiance_grid.npz")
+CACHE_PATH = os.getenv("SOLIX_IRRADIANCE_CACHE", "data/irradiance_cache.ndjson")
+GRID_RETRY_SECONDS = 60  # A missing grid is looked for again this often (built in the background, see main.py)
+
+
+def grid_axes(bounds=GRID_BOUNDS, step=GRID_STEP):
+    """Latitude / longitude sample points of the offline grid."""
+    lats = np.arange(bounds["lat_min"], bounds["lat_max"] + step / 2, step)
+    lons = np.arange(bounds["lon_min"], bounds["lon_max"] + step / 2, step)
+    return lats, lons
+
+
+def parse_nasa_climatology(data):
+    """NASA POWER JSON -> float32 array [JAN..DEC, ANN]."""
+    monthly = data['properties']['parameter']['ALLSKY_SFC_SW_DWN']
+    return np.array([float(monthly[k]) for k in FIELDS], dtype=np.float32)
+
+
+def save_grid(path, lats, lons, values):
+    """Writes the grid atomically. values has shape (len(lats), len(lons), 13)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, lats=lats, lons=lons, values=values.astype(np.float32))
+    os.replace(tmp_path, path)
+
+
+class IrradianceStore:
+    """
+    Local irradiance lookup so most analyses never call NASA.
+
+    1. Offline grid (npz on disk) -> bilinear interpolation, no network.
+    2. Read-through cache for points outside the grid (LRU + TTL). On disk
+       it's an append-only log (one JSON line per NASA result), rewritten
+       only once it holds twice max_entries lines.
+    Values are [JAN..DEC, ANN] in kWh/m2/day.
+    """
+
+    def __init__(self, grid_path=GRID_PATH, cache_path=CACHE_PATH,
+                 max_entries=5000, ttl_seconds=180 * 24 * 3600, precision=2):
+        self.grid_path = grid_path
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.precision = precision  # cache key rounding (2 -> ~1 km)
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # (lat, lon) -> (values, stored_at)
+        self._log_lines = 0          # Lines in the cache file (compacted at 2 * max_entries)
+
+        self.lats = self.lons = self.values = None
+        self._grid_checked_at = time.monotonic()
+        self._load_grid()
+        self._load_cache()
+
+    # --- Offline grid ---
+    def _load_grid(self, quiet=False):
+        if not os.path.exists(self.grid_path):
+            if not quiet:
+                print(f"⚠️ Irradiance grid not found at {self.grid_path}. Run build_irradiance_grid.py")
+            return
+        try:
+            with np.load(self.grid_path) as grid:
+                self.lats = grid["lats"]
+                self.lons = grid["lons"]
+                self.values = grid["values"]
+            # Plain lists: bisect on these is much faster than numpy for one point
+            self._lat_list = self.lats.tolist()
+            self._lon_list = self.lons.tolist()
+            self._holes = np.isnan(self.values).any(axis=-1).tolist()
+        except Exception as e:
+            print(f"⚠️ Could not load irradiance grid: {e}")
+
+    def reload_grid(self):
+        """Picks up a grid written after start-up (e.g. by the background build)."""
+        self._grid_checked_at = time.monotonic()
+        self._load_grid(quiet=True)
+
+    def _interpolate(self, lat, lon):
+        if self.values is None:
+            # Another worker (or the background build) may have written it since
+            if time.monotonic() - self._grid_checked_at < GRID_RETRY_SECONDS:
+                return None
+            self.reload_grid()
+            if self.values is None:
+                return None
+        lats, lons = self._lat_list, self._lon_list
+        if not (lats[0] <= lat <= lats[-1] and lons[0] <= lon <= lons[-1]):
+            return None
+
+        # Cell corners + fractional position inside the cell
+        i = min(bisect.bisect_right(lats, lat) - 1, len(lats) - 2)
+        j = min(bisect.bisect_right(lons, lon) - 1, len(lons) - 2)
+        ty = (lat - lats[i]) / (lats[i + 1] - lats[i])
+        tx = (lon - lons[j]) / (lons[j + 1] - lons[j])
+
+        holes = self._holes
+        if holes[i][j] or holes[i][j + 1] or holes[i + 1][j] or holes[i + 1][j + 1]:
+            return None  # Hole in the grid (failed download) -> use the cache path
+
+        weights = ((1 - ty) * (1 - tx), (1 - ty) * tx, ty * (1 - tx), ty * tx)
+        cell = self.values[i:i + 2, j:j + 2].reshape(4, -1)
+        return np.dot(weights, cell)
+
+    # --- Read-through cache ---
+    def _key(self, lat, lon):
+        return (round(lat, self.precision), round(lon, self.precision))
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                lines = f.readlines()
+        except OSError as e:
+            print(f"⚠️ Ignoring unreadable irradiance cache: {e}")
+            return
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # Last line cut short by a crash
+        self._log_lines = len(lines)
+        self._add_entries(entries)
+
+    def _add_entries(self, entries):
+        now = time.time()
+        with self._lock:
+            for entry in sorted(entries, key=lambda e: e["t"]):  # Oldest first = LRU order
+                if now - entry["t"] < self.ttl_seconds:
+                    key = (entry["lat"], entry["lon"])
+                    self._cache[key] = (np.array(entry["v"], dtype=np.float32), entry["t"])
+                    self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _entry(self, key, values, stored_at):
+        return {"lat": key[0], "lon": key[1], "v": [round(float(x), 3) for x in values], "t": stored_at}
+
+    def _compact(self):
+        # Caller holds the lock. Rewrites the log with just the live entries.
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            for key, (values, stored_at) in self._cache.items():
+                f.write(json.dumps(self._entry(key, values, stored_at)) + "\n")
+        os.replace(tmp_path, self.cache_path)
+        self._log_lines = len(self._cache)
+
+    def _cached(self, lat, lon):
+        key = self._key(lat, lon)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            values, stored_at = entry
+            if time.time() - stored_at >= self.ttl_seconds:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return values
+
+    def remember(self, lat, lon, values):
+        """Stores a fresh NASA result for an off-grid point."""
+        key, stored_at = self._key(lat, lon), time.time()
+        with self._lock:
+            self._cache[key] = (np.asarray(values, dtype=np.float32), stored_at)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            try:
+                if self._log_lines >= 2 * self.max_entries:
+                    self._compact()
+                else:
+                    # One short line, appended: no rewrite of the whole cache per miss
+                    os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+                    with open(self.cache_path, "a") as f:
+                        f.write(json.dumps(self._entry(key, values, stored_at)) + "\n")
+                    self._log_lines += 1
+            except Exception as e:
+                print(f"⚠️ Could not persist irradiance cache: {e}")
+
+    def lookup(self, lat, lon):
+        """Returns [JAN..DEC, ANN] or None if the point has to be fetched."""
+        values = self._interpolate(lat, lon)
+        if values is None:
+            values = self._cached(lat, lon)
+        return values
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import threading
+import time
+
+# "background": start listening right away, load engines on background threads
+# "lazy": load each engine on its first request
+# "eager": load everything before accepting requests (old behaviour)
+ENGINE_LOADING = os.getenv("SOLIX_ENGINE_LOADING", "background")
+WARMUP = os.getenv("SOLIX_WARMUP", "1") == "1"  # One dummy inference / embedding after loading
+
+
+class _Slot:
+    def __init__(self, name, factory, warmup, required):
+        self.name = name
+        self.factory = factory
+        self.warmup = warmup
+        self.required = required
+        self.state = "pending"  # pending | loading | ready | failed
+        self.engine = None
+        self.error = None
+        self.timings = {}
+        self.lock = threading.Lock()
+
+
+class EngineManager:
+    """
+    Owns the heavy engines (YOLO, RAG) so the app can accept requests
+    before they exist.
+
+    register() only records how to build an engine. start() (from the
+    lifespan) loads them according to `mode`; get() returns an engine,
+    loading it in the caller's thread if nothing has yet, or waiting for
+    the load already in progress. ready() is what /health/ready reports:
+    every required engine loaded and warmed up.
+    """
+
+    def __init__(self, mode=ENGINE_LOADING, warmup=WARMUP):
+        self.mode = mode
+        self.warmup = warmup
+        self._slots = {}
+        self.created = time.perf_counter()
+        self.started_s = None  # Import -> lifespan start (when the server begins listening)
+
+    def register(self, name, factory, warmup=None, required=True):
+        """factory() builds the engine; warmup(engine) exercises it once. Non-required engines may fail."""
+        self._slots[name] = _Slot(name, factory, warmup, required)
+
+    def _load(self, slot):
+        with slot.lock:
+            if slot.state in ("ready", "failed"):
+                return
+            slot.state = "loading"
+            t0 = time.perf_counter()
+            try:
+                engine = slot.factory()
+                slot.timings["load_s"] = round(time.perf_counter() - t0, 3)
+                if self.warmup and slot.warmup is not None:
+                    t1 = time.perf_counter()
+                    slot.warmup(engine)
+                    slot.timings["warmup_s"] = round(time.perf_counter() - t1, 3)
+                slot.engine, slot.state = engine, "ready"
+                print(f"✅ {slot.name} engine ready ({self._describe(slot)})")
+            except Exception as e:
+                slot.error, slot.state = str(e), "failed"
+                print(f"❌ Failed to load {slot.name} engine: {e}")
+            slot.timings["ready_after_s"] = round(time.perf_counter() - self.created, 3)
+
+    @staticmethod
+    def _describe(slot):
+        return ", ".join(f"{key[:-2]} {value}s" for key, value in slot.timings.items())
+
+    def start(self):
+        self.started_s = round(time.perf_counter() - self.created, 3)
+        print(f"⏱️ App started in {self.started_s}s (engines: {self.mode})")
+        if self.mode == "eager":
+            for slot in self._slots.values():
+                self._load(slot)
+        elif self.mode == "background":
+            # One thread per engine: YOLO and the embedding model load side by side
+            for slot in self._slots.values():
+                threading.Thread(target=self._load, args=(slot,), name=f"solix-load-{slot.name}", daemon=True).start()
+
+    def get(self, name):
+        """The engine, or None if it failed to load. Blocks while it is loading."""
+        slot = self._slots[name]
+        if slot.state != "ready":
+            self._load(slot)  # Waits on the slot lock if another thread is loading it
+        return slot.engine
+
+    def loaded(self, name):
+        """The engine if it is ready, else None (never blocks or starts a load)."""
+        slot = self._slots[name]
+        return slot.engine if slot.state == "ready" else None
+
+    async def aget(self, name):
+        slot = self._slots[name]
+        if slot.state == "ready":
+            return slot.engine
+        return await asyncio.to_thread(self.get, name)
+
+    def ready(self):
+        # Lazy engines load on first use, so "not loaded yet" still counts as ready
+        ok = ("ready", "pending", "loading") if self.mode == "lazy" else ("ready",)
+        return all(slot.state in ok for slot in self._slots.values() if slot.required)
+
+    def status(self):
+        return {
+            "ready": self.ready(),
+            "mode": self.mode,
+            "started_s": self.started_s,
+            "engines": {
+                slot.name: {"state": slot.state, "required": slot.required, "error": slot.error, **slot.timings}
+                for slot in self._slots.values()
+            },
+        }
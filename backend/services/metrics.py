@@ -0,0 +1,340 @@
+import bisect
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+
+from services.shared_state import shared_dir
+
+# Per-stage timers + counters, exposed on /metrics (Prometheus text format).
+# Off = every timer / counter call returns right away (no clock read, no lock).
+ENABLED = os.getenv("SOLIX_METRICS", "1") == "1"
+# Opt-in profiling: a share of requests (0.01 = 1 in 100) is profiled and the
+# report written to PROFILE_DIR. "pyinstrument" if installed, else cProfile.
+PROFILE_SAMPLE = float(os.getenv("SOLIX_PROFILE_SAMPLE", "0"))
+PROFILER = os.getenv("SOLIX_PROFILER", "pyinstrument")
+PROFILE_DIR = os.getenv("SOLIX_PROFILE_DIR", "data/profiles")
+FLUSH_SECONDS = 5  # How often a serve.py worker publishes its numbers for the others' /metrics
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}  # label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def merge(into, series):
+        for key, value in series:
+            into[tuple(key)] = into.get(tuple(key), 0) + value
+
+    @staticmethod
+    def series(merged):
+        return [[list(key), value] for key, value in merged.items()]
+
+    def render(self, merged):
+        for key, value in sorted(merged.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][slot] += 1
+            state[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def merge(into, series):
+        for key, counts, total in series:
+            state = into.setdefault(tuple(key), [[0] * len(counts), 0.0])
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += total
+
+    @staticmethod
+    def series(merged):
+        return [[list(key), counts, total] for key, (counts, total) in merged.items()]
+
+    def render(self, merged):
+        for key, (counts, total) in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                names = self.labelnames + ("le",)
+                yield f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    """
+    The process's metrics. With serve.py's workers each process counts on its
+    own and publishes a snapshot to the shared directory every FLUSH_SECONDS;
+    /metrics on any worker adds them all up (its own numbers are live).
+
+    The serve.py master clears the snapshots before forking (a new run starts
+    at 0) and folds the last snapshot of a worker that exits into
+    retired.json, so totals never go backwards while it runs.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        # No expiry: snapshots are removed explicitly (clear_shared / retire)
+        self._shared = shared_dir("metrics", float("inf"))
+        self._flusher = None
+
+    def counter(self, name, help, labelnames=()):
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def start(self):
+        """Starts publishing snapshots (multi-worker only). Call once per process, after fork."""
+        if not ENABLED or self._shared is None or self._flusher is not None:
+            return
+        for metric in self._metrics.values():
+            metric.clear()  # Counted in the master before fork(): would be summed once per worker
+
+        def flush():
+            while True:
+                time.sleep(FLUSH_SECONDS)
+                self._publish()
+
+        self._flusher = threading.Thread(target=flush, name="solix-metrics", daemon=True)
+        self._flusher.start()
+
+    def stop(self):
+        """Publishes a last snapshot (worker shutdown), so retire() gets every count."""
+        if ENABLED and self._shared is not None:
+            self._publish()
+
+    def _publish(self):
+        try:
+            self._shared.write(f"{os.getpid()}.json", json.dumps(self.snapshot()).encode("utf-8"))
+        except OSError as e:
+            print(f"⚠️ Could not publish metrics: {e}")
+
+    def _read(self, name):
+        try:
+            return json.loads(self._shared.read(name) or "{}")
+        except ValueError:
+            return {}  # Being replaced right now
+
+    def clear_shared(self):
+        """Deletes every snapshot, e.g. those of a previous run (serve.py master, before forking)."""
+        if self._shared is not None:
+            for name, _ in list(self._shared.items()):
+                self._shared.remove(name)
+
+    def retire(self, pid):
+        """Adds an exited worker's last snapshot to retired.json and deletes it (serve.py master)."""
+        if self._shared is None:
+            return
+        snapshot = self._read(f"{pid}.json")
+        if snapshot:
+            merged = self._merge([self._read("retired.json"), snapshot])
+            retired = {name: self._metrics[name].series(series) for name, series in merged.items()}
+            self._shared.write("retired.json", json.dumps(retired).encode("utf-8"))
+        self._shared.remove(f"{pid}.json")
+
+    def _merge(self, snapshots):
+        merged = {}
+        for name, metric in self._metrics.items():
+            merged[name] = {}
+            for snapshot in snapshots:
+                metric.merge(merged[name], snapshot.get(name, []))
+        return merged
+
+    def render(self):
+        snapshots = [self.snapshot()]
+        if self._shared is not None:
+            own = f"{os.getpid()}.json"
+            for name, data in self._shared.items():
+                if name != own and name.endswith(".json"):
+                    try:
+                        snapshots.append(json.loads(data))
+                    except ValueError:
+                        continue  # Being replaced right now
+
+        lines = []
+        for name, merged in self._merge(snapshots).items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(merged))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram("solix_stage_seconds", "Time spent per pipeline stage", ("stage",))
+REQUEST_SECONDS = registry.histogram("solix_http_request_seconds", "HTTP request latency (until the last byte)",
+                                     ("method", "route", "status"))
+CACHE_EVENTS = registry.counter("solix_cache_events_total", "Cache lookups by cache and outcome", ("cache", "result"))
+IRRADIANCE_SOURCES = registry.counter("solix_irradiance_lookups_total",
+                                      "Irradiance lookups by where the value came from (district_fallback = NASA failed)",
+                                      ("source",))
+IMAGE_REJECTIONS = registry.counter("solix_image_rejections_total", "Images rejected before inference", ("reason",))
+LLM_TOKENS = registry.counter("solix_llm_tokens_total", "LLM tokens reported by the model", ("kind",))
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, stage=self.name)
+        return False
+
+
+_OFF = nullcontext()
+
+
+def stage(name):
+    """with stage("inference"): ... -> solix_stage_seconds{stage="inference"}."""
+    return _Stage(name) if ENABLED else _OFF
+
+
+async def timed(name, awaitable):
+    """await timed("tile_fetch", coroutine): stage() for something awaited (e.g. inside gather)."""
+    if not ENABLED:
+        return await awaitable
+    with _Stage(name):
+        return await awaitable
+
+
+# --- Profiling hook ---
+_profiling = threading.Lock()  # One profiled request at a time (profilers are per thread)
+_profile_ids = itertools.count(1)
+
+
+def _profiler():
+    """(start, stop, save(path without extension)) for the configured profiler."""
+    if PROFILER == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("⚠️ pyinstrument not installed, profiling with cProfile")
+        else:
+            profiler = Profiler(async_mode="enabled")
+
+            def save(path):
+                with open(f"{path}.html", "w") as f:
+                    f.write(profiler.output_html())
+            return profiler.start, profiler.stop, save
+    import cProfile
+    profiler = cProfile.Profile()
+    return profiler.enable, profiler.disable, lambda path: profiler.dump_stats(f"{path}.prof")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: request latency per route (the route template, so ids
+    don't blow up the label count) and, when PROFILE_SAMPLE > 0, a profile of
+    one request in 1/PROFILE_SAMPLE. Only the event-loop thread is profiled:
+    work on the thread pools (YOLO, PDF) shows up in the stage timers instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profile = PROFILE_SAMPLE > 0 and random.random() < PROFILE_SAMPLE and _profiling.acquire(blocking=False)
+        started = time.perf_counter()
+        try:
+            if profile:
+                await self._profiled(scope, receive, send_status)
+            else:
+                await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"],
+                                    route=getattr(route, "path", "unmatched"), status=status)
+
+    async def _profiled(self, scope, receive, send):
+        start, stop, save = _profiler()
+        try:
+            start()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                stop()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = scope["path"].strip("/").replace("/", "_") or "root"
+            path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_profile_ids)}-{name}")
+            save(path)
+            print(f"🔬 Profile of {scope['method']} {scope['path']} written to {path}")
+        finally:
+            _profiling.release()
@@ -1,6 +1,15 @@
 from fpdf import FPDF
+from fpdf.enums import XPos, YPos
 import os
+import io
+import threading
+import zipfile
+from io import BytesIO
 from datetime import datetime
+from PIL import Image
+
+# Shorthand for the old ln=1 (move to the start of the next line)
+NEXT_LINE = {"new_x": XPos.LMARGIN, "new_y": YPos.NEXT}
 
 class ReportGenerator(FPDF):
     def header(self):
@@ -8,86 +17,284 @@ class ReportGenerator(FPDF):
         # Assuming logo.png is in the static directory or a known path
         # if os.path.exists("static/logo.png"):
         #     self.image("static/logo.png", 10, 8, 33)
-        # Arial bold 15
-        self.set_font('Arial', 'B', 15)
+        # Helvetica bold 15 (fpdf2 maps Arial to it anyway)
+        self.set_font('helvetica', 'B', 15)
         # Move to the right
         self.cell(80)
         # Title
-        self.cell(30, 10, 'Solar Potential Assessment Report', 0, 1, 'C')
+        self.cell(30, 10, 'Solar Potential Assessment Report', 0, align='C', **NEXT_LINE)
         # Line break
         self.ln(10)
 
     def footer(self):
         self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
+        self.set_font('helvetica', 'I', 8)
         self.set_text_color(128) # Grey text for footer
-        self.cell(0, 10, f'Page {self.page_no()}/{{nb}}', 0, 0, 'C')
+        self.cell(0, 10, f'Page {self.page_no()}/{{nb}}', 0, align='C')
 
     def add_chapter_title(self, title):
-        self.set_font('Arial', 'B', 14)
+        self.set_font('helvetica', 'B', 14)
         self.set_fill_color(220, 230, 240) # Light blue-grey background
-        self.cell(0, 10, title, 0, 1, 'L', 1) # Cell with background
+        self.cell(0, 10, title, 0, align='L', fill=True, **NEXT_LINE) # Cell with background
         self.ln(5)
 
-def generate_solar_pdf(data, image_path, filename="report.pdf"):
-    pdf = ReportGenerator()
+def draw_report(pdf, data, image):
+    """
+    The report layout. Starts a new page; image is a JPEG source (path /
+    BytesIO) or None. Rendering normally goes through ReportTemplate,
+    which runs this once per process and replays the result.
+    """
     pdf.add_page()
-    
+
     # --- Section 1: Project Details ---
     pdf.add_chapter_title("1. Project Details")
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt=f"Location: {data['district']} District", ln=True)
-    pdf.cell(200, 10, txt=f"Generated on: {datetime.now().strftime('%Y-%m-%d')}", ln=True)
+    pdf.set_font("helvetica", size=12)
+    pdf.cell(200, 10, text=f"Location: {data['district']} District", **NEXT_LINE)
+    pdf.cell(200, 10, text=f"Generated on: {data['date']}", **NEXT_LINE)
     pdf.ln(10)
 
     # --- Section 2: Roof Image ---
     pdf.add_chapter_title("2. Roof Analysis")
-    
-    if os.path.exists(image_path):
-        pdf.image(image_path, x=10, w=100) # Draw the image
+
+    if image is not None:
+        pdf.image(image, x=10, w=100) # Draw the image
         pdf.ln(85) # Move cursor down below image
     else:
-        pdf.cell(200, 10, txt="[Image not found]", ln=True)
+        pdf.cell(200, 10, text="[Image not found]", **NEXT_LINE)
 
-    pdf.set_font("Arial", size=11)
-    pdf.cell(200, 8, txt=f"Detected Roof Area: {data['roof_area']} sq meters", ln=True)
+    pdf.set_font("helvetica", size=11)
+    pdf.cell(200, 8, text=f"Detected Roof Area: {data['roof_area']} sq meters", **NEXT_LINE)
     pdf.ln(10)
 
     # --- Section 3: Technical Potential ---
     pdf.add_chapter_title("3. Energy Potential")
-    pdf.set_font("Arial", size=11)
-    
-    pdf.cell(200, 8, txt=f"Recommended System Size: {data['system_size']} kW", ln=True)
-    pdf.cell(200, 8, txt=f"Estimated Generation: {data['generation']} kWh (Units) per month", ln=True)
+    pdf.set_font("helvetica", size=11)
+
+    pdf.cell(200, 8, text=f"Recommended System Size: {data['system_size']} kW", **NEXT_LINE)
+    pdf.cell(200, 8, text=f"Estimated Generation: {data['generation']} kWh (Units) per month", **NEXT_LINE)
     pdf.ln(10)
 
     # --- Section 4: Financials (CEB) ---
     pdf.add_chapter_title("4. Financial Projection (CEB Net Plus)")
-    
-    pdf.set_font("Arial", size=12)
-    
+
+    pdf.set_font("helvetica", size=12)
+
     # Financial data in a structured way
-    pdf.set_font("Arial", 'B', size=12)
-    pdf.cell(80, 8, "CEB Buy-Back Rate:", 0, 0, 'L')
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 8, f"LKR {data['tariff_rate']} per Unit", 0, 1, 'L')
-
-    pdf.set_font("Arial", 'B', size=12)
-    pdf.cell(80, 8, "Monthly Earnings:", 0, 0, 'L')
-    pdf.set_font("Arial", size=12)
+    pdf.set_font("helvetica", 'B', size=12)
+    pdf.cell(80, 8, "CEB Buy-Back Rate:", 0, align='L')
+    pdf.set_font("helvetica", size=12)
+    pdf.cell(0, 8, f"LKR {data['tariff_rate']} per Unit", 0, align='L', **NEXT_LINE)
+
+    pdf.set_font("helvetica", 'B', size=12)
+    pdf.cell(80, 8, "Monthly Earnings:", 0, align='L')
+    pdf.set_font("helvetica", size=12)
     pdf.set_text_color(0, 100, 0) # Green color for money
-    pdf.cell(0, 8, f"LKR {data['earnings']}", 0, 1, 'L')
+    pdf.cell(0, 8, f"LKR {data['earnings']}", 0, align='L', **NEXT_LINE)
     pdf.set_text_color(0, 0, 0) # Reset color
 
-    pdf.set_font("Arial", 'B', size=12)
-    pdf.cell(80, 8, "Payback Period:", 0, 0, 'L')
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 8, f"{data['payback']} Years", 0, 1, 'L')
+    pdf.set_font("helvetica", 'B', size=12)
+    pdf.cell(80, 8, "Payback Period:", 0, align='L')
+    pdf.set_font("helvetica", size=12)
+    pdf.cell(0, 8, f"{data['payback']} Years", 0, align='L', **NEXT_LINE)
 
     pdf.ln(10) # Add some space after financials
 
+
+# --- Precompiled template ---
+# Fields filled per report; everything else on the page is static
+REPORT_FIELDS = ("district", "date", "roof_area", "system_size", "generation",
+                 "tariff_rate", "earnings", "payback")
+
+class _LayoutRecorder(ReportGenerator):
+    """Runs draw_report with "{field}" placeholders and records where every cell and the image land."""
+
+    def __init__(self):
+        super().__init__()
+        self.ops = []  # (page, kind, x, y, w, h, text, font, text colour, fill colour or None, align)
+
+    def page_no(self):
+        return "{page}"  # Footer numbering is filled in per report
+
+    def cell(self, w=None, h=None, text="", border=0, align="", fill=False, **kwargs):
+        x = self.x
+        super().cell(w, h, text, border, align=align, fill=fill, **kwargs)
+        if w == 0:
+            w = self.w - self.r_margin - x
+        h = h if h is not None else self.font_size
+        # Auto page breaks happen inside cell(), so read the position back afterwards
+        y = self.y - h if kwargs.get("new_y") == YPos.NEXT else self.y
+        if text or fill:
+            font = (self.font_family, self.font_style, self.font_size_pt)
+            fill_color = self.fill_color if fill else None
+            self.ops.append((self.page, "cell", x, y, w, h, text, font, self.text_color, fill_color, align))
+
+    def image(self, name, x=None, y=None, w=0, h=0, **kwargs):
+        info = super().image(name, x=x, y=y, w=w, h=h, **kwargs)
+        height = info.rendered_height
+        self.ops.append((self.page, "image", x, self.y - height, info.rendered_width, height,
+                         None, None, None, None, None))
+        return info
+
+class _TemplatePDF(FPDF):
+    """Output document for templates: headers/footers are part of the recorded page ops."""
+
+class ReportTemplate:
+    """
+    The report page layout, compiled once per process per image aspect ratio.
+
+    Compiling runs draw_report() with placeholder data and records the final
+    position, font and colour of every cell. render_into() then replays
+    those as plain text/rect/image calls, so no per-report line layout,
+    font switching or page-break logic runs, only the data strings change.
+    """
+
+    def __init__(self, aspect=None):
+        self.aspect = aspect  # image height / width, or None for "no image"
+        recorder = _LayoutRecorder()
+        placeholder_image = None
+        if aspect is not None:
+            # Same shape as the real image -> same height on the page and same page breaks
+            placeholder_image = Image.new("RGB", (100, max(1, round(100 * aspect))))
+        recorder.set_compression(False)
+        draw_report(recorder, {field: f"{{{field}}}" for field in REPORT_FIELDS}, placeholder_image)
+        recorder.output()  # Renders the last footer
+        self.ops = recorder.ops
+        self.pages = recorder.page
+        self.c_margin = recorder.c_margin
+
+    def render_into(self, pdf, data, image):
+        """Appends one report (self.pages pages) to pdf; image is a JPEG source or None."""
+        values = {field: str(data.get(field, "")) for field in REPORT_FIELDS}
+        values["nb"] = str(self.pages)
+        first_page = pdf.page + 1
+        current_font = current_text = current_fill = None
+        for page, kind, x, y, w, h, text, font, text_color, fill_color, align in self.ops:
+            while pdf.page < first_page + page - 1:
+                pdf.add_page()
+                current_font = current_text = current_fill = None  # Graphics state is per page
+            if kind == "image":
+                pdf.image(image, x=x, y=y, w=w, h=h)
+                continue
+            if fill_color is not None:
+                if fill_color != current_fill:
+                    pdf.set_fill_color(fill_color)
+                    current_fill = fill_color
+                pdf.rect(x, y, w, h, style="F")
+            if not text:
+                continue
+            if font != current_font:
+                pdf.set_font(*font)
+                current_font = font
+            if text_color != current_text:
+                pdf.set_text_color(text_color)
+                current_text = text_color
+            if "{" in text:
+                text = text.format_map({**values, "page": str(pdf.page - first_page + 1)})
+            # Same text placement as FPDF.cell()
+            if align == "C":
+                dx = (w - pdf.get_string_width(text)) / 2
+            elif align == "R":
+                dx = w - self.c_margin - pdf.get_string_width(text)
+            else:
+                dx = self.c_margin
+            pdf.text(x + dx, y + 0.5 * h + 0.3 * pdf.font_size, text)
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+def _image_source(image):
+    """ImageArtifact / file path / None -> (JPEG source for FPDF or None, aspect ratio or None)."""
+    if hasattr(image, "jpeg"):
+        width, height = image.size
+        return BytesIO(image.jpeg()), height / width
+    if image and os.path.exists(image):
+        with Image.open(image) as img:
+            width, height = img.size
+        return image, height / width
+    return None, None
+
+def get_template(aspect):
+    # Satellite tiles and mosaics are square, so this is normally a single template
+    key = None if aspect is None else round(aspect, 3)
+    template = _templates.get(key)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(key)
+            if template is None:
+                template = ReportTemplate(key)
+                _templates[key] = template
+    return template
+
+def _report_values(data):
+    values = dict(data)
+    values.setdefault("date", datetime.now().strftime('%Y-%m-%d'))
+    return values
+
+def render_report(pdf, data, image):
+    """Appends one report to pdf (a _TemplatePDF, see new_document)."""
+    source, aspect = _image_source(image)
+    get_template(aspect).render_into(pdf, _report_values(data), source)
+
+def new_document():
+    return _TemplatePDF()
+
+def generate_solar_pdf(data, image, filename="report.pdf", output_path=None):
+    # image: an ImageArtifact (JPEG embedded straight from memory) or a file path
+    # output_path: where to write the PDF (default: static/<filename>)
+    pdf = new_document()
+    render_report(pdf, data, image)
+
     # Save
-    output_path = f"static/{filename}"
-    os.makedirs("static", exist_ok=True)
+    if output_path is None:
+        output_path = f"static/{filename}"
+        os.makedirs("static", exist_ok=True)
     pdf.output(output_path)
-    return output_path
\ No newline at end of file
+    return output_path
+
+
+# --- Batch reports ---
+def generate_batch_pdf(items, output):
+    """
+    Many reports in one multi-page PDF. items: iterable of (data, image).
+    output: path or binary file object. The document is built in memory
+    (FPDF can't stream), so callers should cap the batch size.
+    """
+    pdf = new_document()
+    for data, image in items:
+        render_report(pdf, data, image)
+    pdf.output(output)
+    return output
+
+class _ZipStream(io.RawIOBase):
+    """Write-only sink for ZipFile that hands out what was written so far."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_reports_zip(items):
+    """
+    Yields a ZIP archive with one PDF per (filename, data, image) item,
+    chunk by chunk: only one report is held in memory at a time.
+    """
+    sink = _ZipStream()
+    # PDFs are already compressed (JPEG + deflate), so store them as-is
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for filename, data, image in items:
+            pdf = new_document()
+            render_report(pdf, data, image)
+            archive.writestr(filename, bytes(pdf.output()))
+            yield sink.drain()
+    yield sink.drain()  # Central directory
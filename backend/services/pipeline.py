@@ -0,0 +1,57 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Worker count per stage (override with env vars).
+# "cv"  -> decode/validate + wait on the YOLO micro-batcher. Keep this at
+#          least SOLIX_BATCH_SIZE or batches can never fill up.
+# "pdf" -> FPDF rendering + disk writes (background report queue + lazy downloads)
+STAGE_WORKERS = {
+    "cv": int(os.getenv("SOLIX_CV_WORKERS", "8")),
+    "pdf": int(os.getenv("SOLIX_PDF_WORKERS", "2")),
+}
+
+
+class StagedExecutor:
+    """
+    Runs blocking pipeline stages on bounded worker pools so the event loop
+    stays free for other requests (/api/chat etc.).
+    Each stage has its own pool: a burst of PDF renders can't starve inference.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = {**STAGE_WORKERS, **(workers or {})}
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self, stage):
+        # Pools are created on first use (threads don't exist until needed)
+        pool = self._pools.get(stage)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(stage)
+                if pool is None:
+                    pool = ThreadPoolExecutor(
+                        max_workers=self.workers.get(stage, 1),
+                        thread_name_prefix=f"solix-{stage}"
+                    )
+                    self._pools[stage] = pool
+        return pool
+
+    async def run(self, stage, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on the pool for `stage` and await the result."""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        return await loop.run_in_executor(self._get_pool(stage), call)
+
+    def submit(self, stage, func, *args, **kwargs):
+        """Fire-and-forget version of run() for background work (returns a concurrent Future)."""
+        return self._get_pool(stage).submit(func, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.shutdown(wait=wait)
@@ -0,0 +1,245 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from services.metrics import CACHE_EVENTS
+
+ANSWER_CACHE_ITEMS = int(os.getenv("SOLIX_RAG_ANSWER_CACHE_ITEMS", "1000"))
+ANSWER_CACHE_TTL = int(os.getenv("SOLIX_RAG_ANSWER_CACHE_TTL", str(24 * 3600)))  # seconds
+# Cosine similarity above which a past answer is reused for a differently worded question
+SIMILARITY_THRESHOLD = float(os.getenv("SOLIX_RAG_SIMILARITY", "0.93"))
+# Looser than answers: near questions share their chunks even when their answers differ
+RETRIEVAL_SIMILARITY_THRESHOLD = float(os.getenv("SOLIX_RAG_RETRIEVAL_SIMILARITY", "0.85"))
+RETRIEVAL_CACHE_ITEMS = int(os.getenv("SOLIX_RAG_RETRIEVAL_CACHE_ITEMS", "2000"))
+RETRIEVAL_CACHE_TTL = int(os.getenv("SOLIX_RAG_RETRIEVAL_CACHE_TTL", str(24 * 3600)))
+VERSION_CHECK_SECONDS = float(os.getenv("SOLIX_RAG_VERSION_CHECK", "30"))  # How often chroma_db is re-checked
+
+
+def normalize_question(text):
+    """Key for exact matches: case, spacing and trailing punctuation don't matter."""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+def question_numbers(text):
+    """
+    The numbers in a question, in order ("5kW" and "5.0 kW" -> (5.0,)).
+    Embeddings barely separate "5kW" from "10kW", so answers are only
+    reused between questions with the same numbers.
+    """
+    return tuple(float(n) for n in re.findall(r"\d+(?:\.\d+)?", text.replace(",", "")))
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def db_fingerprint(path):
+    """
+    Changes whenever the vector store on disk is rebuilt (build_memory.py):
+    a hash of every file's name, size and mtime. None if it doesn't exist.
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue  # Being replaced right now; the next check sees the new file
+            digest.update(f"{os.path.relpath(file_path, path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+class _LRU:
+    """OrderedDict with a size cap and TTL. Caller holds the owner's lock."""
+
+    def __init__(self, max_items, ttl_seconds):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.items = OrderedDict()  # key -> (created, value)
+
+    def get(self, key):
+        entry = self.items.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time() - self.ttl_seconds:
+            del self.items[key]
+            return None
+        self.items.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, value):
+        self.items[key] = (time.time(), value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+
+class _VectorLRU(_LRU):
+    """_LRU of (unit embedding, value) with a nearest-neighbour lookup over the embeddings."""
+
+    def __init__(self, max_items, ttl_seconds):
+        super().__init__(max_items, ttl_seconds)
+        self._matrix = None  # (keys, embedding matrix), rebuilt after a change
+
+    def put(self, key, value):
+        super().put(key, value)
+        self._matrix = None
+
+    def clear(self):
+        super().clear()
+        self._matrix = None
+
+    def nearest(self, query, threshold, accept=None):
+        """Value of the most similar entry with cosine >= threshold (and accept(value)), or None."""
+        if self._matrix is None:
+            if not self.items:
+                return None
+            keys = list(self.items)
+            self._matrix = (keys, np.stack([self.items[key][1][0] for key in keys]))
+        keys, matrix = self._matrix
+        scores = matrix @ query
+        for index in np.argsort(-scores):
+            if scores[index] < threshold:
+                break
+            entry = self.get(keys[index])  # Also checks the TTL
+            if entry is not None and (accept is None or accept(entry)):
+                return entry
+        return None
+
+
+class RAGCache:
+    """
+    Two cache levels in front of SolarRAG's retrieval chain.
+
+    1. Answers: exact match on the normalized question, then cosine
+       similarity against the embeddings of past questions
+       (>= SIMILARITY_THRESHOLD) with the same numbers (question_numbers).
+       A hit skips retrieval and the LLM.
+    2. Retrieval: nearest past query embedding (>= RETRIEVAL_SIMILARITY_THRESHOLD)
+       -> its retrieved chunks. A hit skips the vector search (the LLM
+       still runs), e.g. for "5kW" after "10kW" or a rewording just under
+       the answer threshold.
+
+    Both are LRU + TTL and are dropped when the vector store on disk
+    changes (db_fingerprint), so answers never outlive a rebuild.
+    """
+
+    def __init__(self, db_path, similarity_threshold=SIMILARITY_THRESHOLD,
+                 answer_items=ANSWER_CACHE_ITEMS, answer_ttl=ANSWER_CACHE_TTL,
+                 retrieval_similarity_threshold=RETRIEVAL_SIMILARITY_THRESHOLD,
+                 retrieval_items=RETRIEVAL_CACHE_ITEMS, retrieval_ttl=RETRIEVAL_CACHE_TTL):
+        self.db_path = db_path
+        self.similarity_threshold = similarity_threshold
+        self.retrieval_similarity_threshold = retrieval_similarity_threshold
+        # question -> (unit embedding, answer, numbers)
+        self._answers = _VectorLRU(answer_items, answer_ttl)
+        # embedding hash -> (unit embedding, documents)
+        self._retrievals = _VectorLRU(retrieval_items, retrieval_ttl)
+        self._lock = threading.Lock()
+
+        self._version = db_fingerprint(db_path)
+        self._checked_at = time.monotonic()
+        self.metrics = {
+            "exact_hits": 0, "semantic_hits": 0, "answer_misses": 0,
+            "retrieval_hits": 0, "retrieval_misses": 0, "invalidations": 0,
+        }
+
+    # --- Invalidation ---
+    def _check_version(self):
+        # Caller holds the lock. Walking chroma_db is cheap but not free, so throttle it
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        version = db_fingerprint(self.db_path)
+        if version != self._version:
+            self._version = version
+            self._clear()
+            self.metrics["invalidations"] += 1
+            print("♻️ Knowledge base changed: RAG caches cleared")
+
+    def _clear(self):
+        self._answers.clear()
+        self._retrievals.clear()
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    # --- Level 1: answers ---
+    def exact_answer(self, question):
+        with self._lock:
+            self._check_version()
+            entry = self._answers.get(normalize_question(question))
+            if entry is not None:
+                self.metrics["exact_hits"] += 1
+                CACHE_EVENTS.inc(cache="rag_answers", result="exact_hit")
+                return entry[1]
+        return None
+
+    def similar_answer(self, question, embedding):
+        """Best past answer for a question (and its embedding), or None (counts a miss)."""
+        numbers = question_numbers(question)
+        with self._lock:
+            entry = self._answers.nearest(_unit(embedding), self.similarity_threshold,
+                                          accept=lambda entry: entry[2] == numbers)
+            if entry is not None:
+                self.metrics["semantic_hits"] += 1
+                CACHE_EVENTS.inc(cache="rag_answers", result="semantic_hit")
+                return entry[1]
+            self.metrics["answer_misses"] += 1
+        CACHE_EVENTS.inc(cache="rag_answers", result="miss")
+        return None
+
+    def store_answer(self, question, embedding, answer):
+        with self._lock:
+            self._answers.put(normalize_question(question), (_unit(embedding), answer, question_numbers(question)))
+
+    # --- Level 2: retrieval ---
+    @staticmethod
+    def _embedding_key(embedding):
+        return hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+
+    def retrieved(self, embedding):
+        """Chunks retrieved for this or the nearest similar query embedding, or None."""
+        with self._lock:
+            entry = self._retrievals.get(self._embedding_key(embedding))
+            if entry is None:
+                entry = self._retrievals.nearest(_unit(embedding), self.retrieval_similarity_threshold)
+            documents = entry[1] if entry is not None else None
+            self.metrics["retrieval_hits" if documents is not None else "retrieval_misses"] += 1
+        CACHE_EVENTS.inc(cache="rag_retrieval", result="hit" if documents is not None else "miss")
+        return documents
+
+    def store_retrieved(self, embedding, documents):
+        with self._lock:
+            self._retrievals.put(self._embedding_key(embedding), (_unit(embedding), documents))
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            answered = metrics["exact_hits"] + metrics["semantic_hits"] + metrics["answer_misses"]
+            searched = metrics["retrieval_hits"] + metrics["retrieval_misses"]
+            metrics.update({
+                "answers_cached": len(self._answers.items),
+                "retrievals_cached": len(self._retrievals.items),
+                "answer_hit_rate": round((metrics["exact_hits"] + metrics["semantic_hits"]) / answered, 3) if answered else 0.0,
+                "retrieval_hit_rate": round(metrics["retrieval_hits"] / searched, 3) if searched else 0.0,
+                "similarity_threshold": self.similarity_threshold,
+                "retrieval_similarity_threshold": self.retrieval_similarity_threshold,
+            })
+        return metrics
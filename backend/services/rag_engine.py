@@ -1,5 +1,8 @@
+import asyncio
 import os
 from dotenv import load_dotenv
+from services.rag_cache import RAGCache
+from services.metrics import ENABLED as METRICS_ENABLED, stage, timed, LLM_TOKENS
 
 load_dotenv()
 
@@ -10,6 +13,8 @@ try:
     from langchain_core.prompts import ChatPromptTemplate
     from langchain_classic.chains import create_retrieval_chain
     from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.callbacks import BaseCallbackHandler
     LANGCHAIN_AVAILABLE = True
 except ImportError as e:
     print(f"⚠️ LangChain packages not fully installed: {e}")
@@ -21,13 +26,47 @@ except ImportError as e:
     ChatPromptTemplate = None
     create_retrieval_chain = None
     create_stuff_documents_chain = None
+    FakeListChatModel = None
+    BaseCallbackHandler = object
 
 # --- CONFIGURATION ---
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 DB_PATH = "chroma_db"
+RETRIEVAL_K = 5
+# Local stand-in for Gemini (tests / offline dev): streams a canned reply, no API key needed
+FAKE_LLM = os.getenv("SOLIX_FAKE_LLM", "0") == "1"
+FAKE_LLM_REPLY = os.getenv("SOLIX_FAKE_LLM_REPLY", "This is a test answer from the local fake model. Net Plus pays LKR 20.90 per unit.")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+_embeddings = None
+
+
+class TokenCounter(BaseCallbackHandler):
+    """Adds the token usage the LLM reports (Gemini does, the fake model doesn't) to /metrics."""
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                for kind in ("input", "output"):
+                    if usage.get(f"{kind}_tokens"):
+                        LLM_TOKENS.inc(usage[f"{kind}_tokens"], kind=kind)
+
+
+def load_embeddings():
+    """
+    The embedding model, loaded once per process. serve.py calls this before
+    forking so every worker shares the weights (the vector store itself is
+    opened per worker: sqlite connections don't survive fork).
+    """
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    return _embeddings
 
 class SolarRAG:
-    def __init__(self):
+    def __init__(self, embeddings=None, vector_db=None):
+        """embeddings / vector_db: stand-ins for the HuggingFace model and chroma_db (tests)."""
         print("⚙️ Loading RAG Engine...")
         
         if not LANGCHAIN_AVAILABLE:
@@ -36,28 +75,37 @@ class SolarRAG:
             return
         
         self.available = True
+        # Repeat questions skip the LLM (and the vector search); see services/rag_cache.py
+        self.cache = RAGCache(DB_PATH)
         
         try:
             # 1. Setup Embedding
-            self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+            self.embeddings = embeddings if embeddings is not None else load_embeddings()
             
             # 2. Load the Vector Database
-            if os.path.exists(DB_PATH):
+            if vector_db is not None:
+                self.vector_db = vector_db
+                self.retriever = self.vector_db.as_retriever(search_kwargs={"k": RETRIEVAL_K})
+            elif os.path.exists(DB_PATH):
                 self.vector_db = Chroma(
                     persist_directory=DB_PATH, 
                     embedding_function=self.embeddings
                 )
-                self.retriever = self.vector_db.as_retriever(search_kwargs={"k": 5})
+                self.retriever = self.vector_db.as_retriever(search_kwargs={"k": RETRIEVAL_K})
             else:
                 raise Exception("❌ Database not found! Run build_memory.py first.")
 
             # 3. Setup the LLM
-            # Note: 'gemini-1.5-flash' is the current standard model name, but 'gemini-pro' works too.
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-flash-latest", 
-                google_api_key=GOOGLE_API_KEY,
-                temperature=0.3
-            )
+            if FAKE_LLM:
+                print("🧪 Using the local fake LLM (SOLIX_FAKE_LLM=1)")
+                self.llm = FakeListChatModel(responses=[FAKE_LLM_REPLY], sleep=0.02)
+            else:
+                # Note: 'gemini-1.5-flash' is the current standard model name, but 'gemini-pro' works too.
+                self.llm = ChatGoogleGenerativeAI(
+                    model="gemini-flash-latest", 
+                    google_api_key=GOOGLE_API_KEY,
+                    temperature=0.3
+                )
 
             # 4. Create the Prompt
             system_prompt = (
@@ -77,21 +125,90 @@ class SolarRAG:
             # 5. Build Chain
             self.question_answer_chain = create_stuff_documents_chain(self.llm, self.prompt)
             self.rag_chain = create_retrieval_chain(self.retriever, self.question_answer_chain)
+            self.llm_config = {"callbacks": [TokenCounter()]} if METRICS_ENABLED else {}
             print("✅ RAG Engine Loaded Successfully")
         except Exception as e:
             print(f"❌ Failed to initialize RAG Engine: {e}")
             self.available = False
 
+    def warm_up(self):
+        """Loads the embedding model weights and the vector index (no LLM call)."""
+        if not self.available:
+            return
+        self.vector_db.similarity_search_by_vector(self.embeddings.embed_query("solar tariff"), k=1)
+
+    def retrieve(self, embedding):
+        """Chunks for a query embedding (level-2 cache in front of Chroma)."""
+        documents = self.cache.retrieved(embedding)
+        if documents is None:
+            with stage("rag_retrieve"):
+                documents = self.vector_db.similarity_search_by_vector(embedding, k=RETRIEVAL_K)
+            self.cache.store_retrieved(embedding, documents)
+        return documents
+
     def get_answer(self, query):
         if not self.available:
             return "⚠️ RAG Engine is not available. Please install langchain packages."
         
         try:
-            response = self.rag_chain.invoke({"input": query})
-            return response["answer"]
+            answer = self.cache.exact_answer(query)
+            if answer is not None:
+                return answer
+
+            # Embedded once, used for the similarity lookup, the retrieval cache and the search
+            with stage("rag_embed"):
+                embedding = self.embeddings.embed_query(query)
+            answer = self.cache.similar_answer(query, embedding)
+            if answer is not None:
+                return answer
+
+            # Same as rag_chain.invoke, with the retrieval step cached
+            documents = self.retrieve(embedding)
+            with stage("rag_llm"):
+                answer = self.question_answer_chain.invoke({"input": query, "context": documents}, config=self.llm_config)
+            self.cache.store_answer(query, embedding, answer)  # Errors below are never cached
+            return answer
         except Exception as e:
             return f"⚠️ Error: {str(e)}"
 
+    async def astream_answer(self, query):
+        """
+        Same answer as get_answer, yielded as text chunks while the LLM
+        generates it. Cache hits come back as a single chunk.
+        Cache lookups (the exact one checks chroma_db on disk), embedding and
+        search run in threads, so the event loop never blocks.
+        """
+        if not self.available:
+            yield "⚠️ RAG Engine is not available. Please install langchain packages."
+            return
+
+        answer = await asyncio.to_thread(self.cache.exact_answer, query)
+        if answer is not None:
+            yield answer
+            return
+
+        embedding = await timed("rag_embed", asyncio.to_thread(self.embeddings.embed_query, query))
+        answer = await asyncio.to_thread(self.cache.similar_answer, query, embedding)
+        if answer is not None:
+            yield answer
+            return
+
+        documents = await asyncio.to_thread(self.retrieve, embedding)
+        chunks = []
+        # Includes the time the client takes to read the chunks (the stream waits for it)
+        with stage("rag_llm"):
+            async for chunk in self.question_answer_chain.astream({"input": query, "context": documents},
+                                                                  config=self.llm_config):
+                chunks.append(chunk)
+                yield chunk
+        # Only complete answers are cached (a dropped client never gets here)
+        self.cache.store_answer(query, embedding, "".join(chunks))
+
+    def cache_stats(self):
+        if not self.available:
+            return {}
+        return self.cache.stats()
+
 if __name__ == "__main__":
     rag = SolarRAG()
     print("🤖 Testing RAG Engine...")
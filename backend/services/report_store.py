@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from services.metrics import CACHE_EVENTS
+
+REPORT_DIR = os.getenv("SOLIX_REPORT_DIR", "data/reports")
+REPORT_STORE_MAX_MB = int(os.getenv("SOLIX_REPORT_STORE_MB", "200"))
+REPORT_TTL = int(os.getenv("SOLIX_REPORT_TTL", str(7 * 24 * 3600)))  # seconds
+# "background": render right after the analysis, off the request path
+# "lazy": render only when the report is first downloaded
+PDF_MODE = os.getenv("SOLIX_PDF_MODE", "background")
+REPORT_JOBS = int(os.getenv("SOLIX_REPORT_JOBS", "512"))  # Pending renders kept in memory
+
+
+def report_key(data, image_jpeg=b""):
+    """
+    Content address of a report: everything that ends up in the PDF
+    (the figures, the roof image and the date printed on it).
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(data, sort_keys=True, default=str).encode("utf-8"))
+    digest.update(hashlib.sha256(image_jpeg).digest())
+    return digest.hexdigest()[:32]
+
+
+class ReportStore:
+    """
+    Rendered PDFs on disk, named by report_key().
+
+    - Writes go to a temp file and are renamed into place, so readers never
+      see half a PDF and concurrent requests never overwrite each other.
+    - An identical report is rendered once: later (or simultaneous) requests
+      for the same key get the existing file.
+    - Files older than ttl_seconds, or the least recently used ones beyond
+      max_bytes, are deleted.
+    """
+
+    def __init__(self, root=REPORT_DIR, max_bytes=REPORT_STORE_MAX_MB * 1024 * 1024,
+                 ttl_seconds=REPORT_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> (size, last used), LRU order
+        self._inflight = {}          # key -> Future of the render in progress
+        self.total_bytes = 0
+        self.hits = 0
+        self.renders = 0
+        self._load_index()
+
+    def path(self, key):
+        return os.path.join(self.root, f"{key}.pdf")
+
+    def _load_index(self):
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".tmp"):
+                # Left over from a crash mid-render (recent ones may be another worker's)
+                if os.path.getmtime(path) < time.time() - 3600:
+                    os.remove(path)
+            elif name.endswith(".pdf"):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for mtime, key, size in sorted(entries):
+            self._index[key] = (size, mtime)
+            self.total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock
+        cutoff = time.time() - self.ttl_seconds
+        while self._index:
+            key, (size, used) = next(iter(self._index.items()))
+            if self.total_bytes <= self.max_bytes and used >= cutoff:
+                break
+            del self._index[key]
+            self.total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key):
+        """Path of the stored report, or None."""
+        path = self.path(key)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                # May have been rendered by another worker process
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    return None
+                entry = (stat.st_size, stat.st_mtime)
+                self.total_bytes += stat.st_size
+            elif not os.path.exists(path):
+                self.total_bytes -= entry[0]
+                del self._index[key]
+                return None
+            if entry[1] < time.time() - self.ttl_seconds:
+                self._index[key] = entry
+                return None  # Expired: re-rendered (and replaced) by the caller
+            self._index[key] = (entry[0], time.time())
+            self._index.move_to_end(key)
+        try:
+            os.utime(path)  # Keeps LRU order across restarts
+        except OSError:
+            pass
+        return path
+
+    def get_or_render(self, key, render):
+        """
+        Returns the path for `key`, calling render(path) to write the PDF
+        only if no identical report exists yet.
+        """
+        path = self.get(key)
+        if path is not None:
+            self.hits += 1
+            CACHE_EVENTS.inc(cache="reports", result="hit")
+            return path
+
+        with self._lock:
+            future = self._inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._inflight[key] = future
+        if not is_leader:
+            return future.result()  # Same report is being rendered right now
+
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            path = self.path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                render(tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            size = os.path.getsize(path)
+            CACHE_EVENTS.inc(cache="reports", result="render")
+            with self._lock:
+                self.renders += 1
+                old = self._index.pop(key, None)
+                if old is not None:
+                    self.total_bytes -= old[0]  # Expired copy was replaced
+                self._index[key] = (size, time.time())
+                self.total_bytes += size
+                self._evict()
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"reports": len(self._index), "bytes": self.total_bytes,
+                    "hits": self.hits, "renders": self.renders}
+
+
+class ReportQueue:
+    """
+    Keeps PDF rendering off the analysis request path.
+
+    submit() only records what a report needs. In "background" mode the
+    render is also queued on a bounded pool right away; in "lazy" mode it
+    happens on the first download. Either way ensure() renders on demand if
+    the file isn't there yet, and identical reports are rendered once.
+    Pending jobs live in this process (up to max_jobs, oldest dropped) and,
+    with a `shared` SharedDir, are also pickled there so another worker
+    process can render a report it didn't queue.
+    """
+
+    def __init__(self, store, render, submit, mode=PDF_MODE, max_jobs=REPORT_JOBS, shared=None):
+        self.store = store
+        self.render = render    # render(path, *args) writes the PDF to path
+        self._submit = submit   # submit(func, *args) runs func on a worker pool
+        self.mode = mode
+        self.max_jobs = max_jobs
+        self.shared = shared
+        self._jobs = OrderedDict()  # report_id -> {"args", "status", "error"}
+        self._lock = threading.Lock()
+
+    def submit(self, report_id, *args):
+        with self._lock:
+            if report_id in self._jobs:
+                self._jobs.move_to_end(report_id)
+                return
+        if self.store.get(report_id) is not None:
+            return  # Identical report already rendered
+        with self._lock:
+            self._jobs[report_id] = {"args": args, "status": "queued", "error": None}
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        if self.shared is not None:
+            self.shared.write(f"{report_id}.pkl", pickle.dumps(args))
+        if self.mode == "background":
+            self._submit(self._render_quietly, report_id)
+
+    def _render_quietly(self, report_id):
+        try:
+            self.ensure(report_id)
+        except Exception:
+            pass  # Recorded in the job status; a download will retry
+
+    def _job(self, report_id):
+        # Caller holds the lock. Falls back to a job queued by another worker
+        job = self._jobs.get(report_id)
+        if job is None and self.shared is not None:
+            data = self.shared.read(f"{report_id}.pkl")
+            if data is not None:
+                job = {"args": pickle.loads(data), "status": "queued", "error": None}
+                self._jobs[report_id] = job
+        return job
+
+    def ensure(self, report_id):
+        """Path of the rendered report, rendering it now if needed. None = unknown id."""
+        path = self.store.get(report_id)
+        if path is not None:
+            return path
+        with self._lock:
+            job = self._job(report_id)
+            if job is None:
+                return None
+            job["status"] = "rendering"
+        try:
+            path = self.store.get_or_render(report_id, lambda p: self.render(p, *job["args"]))
+        except Exception as e:
+            print(f"❌ Report {report_id} failed to render: {e}")
+            with self._lock:
+                job["status"], job["error"] = "failed", str(e)
+            raise
+        with self._lock:
+            self._jobs.pop(report_id, None)  # The store has it from now on
+        if self.shared is not None:
+            self.shared.remove(f"{report_id}.pkl")
+        return path
+
+    def status(self, report_id):
+        """{"status": queued | rendering | failed | ready} or None for an unknown id."""
+        # The store first: another worker may have rendered a job this one also holds
+        if self.store.get(report_id) is not None:
+            return {"status": "ready", "error": None}
+        with self._lock:
+            job = self._job(report_id)
+            if job is not None:
+                return {"status": job["status"], "error": job["error"]}
+        return None
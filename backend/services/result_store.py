@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from services.metrics import CACHE_EVENTS
+from services.shared_state import try_lock, unlock
+
+RESULT_DB = os.getenv("SOLIX_RESULT_DB", "data/results.sqlite3")
+# Geohash length of the cache key: 8 chars ~ 38 x 19 m, so clicks a few metres apart on one roof share a result
+GEOHASH_PRECISION = int(os.getenv("SOLIX_RESULT_GEOHASH", "8"))
+RESULT_TTL = int(os.getenv("SOLIX_RESULT_TTL", str(30 * 24 * 3600)))  # seconds (imagery changes slowly)
+QUICK_RADIUS_M = float(os.getenv("SOLIX_QUICK_RADIUS_M", "500"))  # /api/estimate/quick neighbourhood
+QUICK_NEIGHBOURS = 16
+# serve.py workers wait for one another's computation of the same key (polling its lock file)
+LOCK_POLL = 0.1   # seconds
+LOCK_WAIT = 60.0  # seconds before computing anyway (a stuck worker must not block the others)
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_M_PER_DEG_LAT = 111_320.0
+
+
+def geohash(lat, lon, precision=GEOHASH_PRECISION):
+    """Standard geohash: interleaved lon/lat bisection bits, 5 per base32 character."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, point = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if point >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def _to_json(value):
+    # numpy scalars / arrays in the CV results
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+
+def cacheable(record):
+    """
+    Only results worth reusing for RESULT_TTL are stored: irradiance from the
+    grid / NASA (a district_fallback means NASA was down, and depends on the
+    district, which isn't in the key) and an image the CV engine accepted
+    (a cloudy tile today may be clear on the next fetch).
+    """
+    return record.get("irradiance_source") in ("local", "nasa") and not record["cv_results"].get("warning")
+
+
+def _distance_m(lat1, lon1, lat2, lon2):
+    # Equirectangular approximation: plenty for a few hundred metres
+    dx = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(lat2 - lat1, dx) * _M_PER_DEG_LAT
+
+
+class ResultStore:
+    """
+    Persistent cache of the expensive half of an analysis (image fetch,
+    YOLO, NASA lookup) per location, in SQLite (shared by serve.py workers).
+
+    - Key: geohash of (lat, lon) + model version (hash of the weights file)
+      + inference settings. Results of any other model version are deleted
+      when the vision engine loads new weights (purge_models).
+    - get_or_compute() coalesces concurrent identical requests: one
+      computation, every caller gets its result. Across serve.py workers
+      too when given a lock_dir (lock files in the shared directory).
+    - An R*Tree index over (lat, lon) lets nearby() find past analyses around
+      a point without a table scan (/api/estimate/quick).
+
+    Stored per result: the record (JSON: cv results, irradiance and its
+    source) and the annotated image JPEG. Financials are not stored: they
+    depend on the bill / loan inputs and are cheap to recompute. Records
+    that aren't cacheable() are never stored (nor served, if older rows have them).
+    """
+
+    def __init__(self, path=RESULT_DB, precision=GEOHASH_PRECISION, ttl_seconds=RESULT_TTL, lock_dir=None):
+        self.path = path
+        self.lock_dir = lock_dir
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()  # sqlite connections are per thread (and per process)
+        self._inflight = {}              # key -> asyncio.Task computing it
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._init_schema()
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _init_schema(self):
+        db = self._db()
+        db.execute("""CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY,
+            key TEXT UNIQUE NOT NULL,
+            model TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            created REAL NOT NULL,
+            roof_area_m2 REAL,
+            is_estimated INTEGER,
+            record TEXT NOT NULL,
+            image BLOB
+        )""")
+        db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS results_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+
+    def key(self, lat, lon, model, **settings):
+        return f"{geohash(lat, lon, self.precision)}|{model}|{json.dumps(settings, sort_keys=True)}"
+
+    # --- Storage ---
+    def get(self, key):
+        """{**record, "image": JPEG bytes} or None (missing / expired)."""
+        row = self._db().execute(
+            "SELECT record, image, created FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[2] < time.time() - self.ttl_seconds:
+            return None
+        record = json.loads(row[0])
+        if not cacheable(record):
+            return None
+        return {**record, "image": row[1]}
+
+    def put(self, key, lat, lon, record, image):
+        """
+        record: JSON-able dict with "cv_results", "irradiance_source", "roof_area_m2"
+        and "is_estimated"; image: JPEG bytes. False (nothing stored) if not cacheable().
+        """
+        if not cacheable(record):
+            return False
+        db = self._db()
+        model = key.split("|")[1]
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            old = db.execute("SELECT id FROM results WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                db.execute("DELETE FROM results WHERE id = ?", old)
+                db.execute("DELETE FROM results_rtree WHERE id = ?", old)
+            cursor = db.execute(
+                "INSERT INTO results (key, model, lat, lon, created, roof_area_m2, is_estimated, record, image) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, lat, lon, time.time(), record["roof_area_m2"], int(record["is_estimated"]),
+                 json.dumps(record, default=_to_json), image)
+            )
+            db.execute("INSERT INTO results_rtree VALUES (?, ?, ?, ?, ?)", (cursor.lastrowid, lat, lat, lon, lon))
+        return True
+
+    def purge_models(self, current):
+        """Deletes results computed with any other model version (new best.pt) or past the TTL."""
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            stale = "model != ? OR created < ?"
+            params = (current, time.time() - self.ttl_seconds)
+            db.execute(f"DELETE FROM results_rtree WHERE id IN (SELECT id FROM results WHERE {stale})", params)
+            removed = db.execute(f"DELETE FROM results WHERE {stale}", params).rowcount
+        if removed:
+            print(f"♻️ Removed {removed} cached analyses (model changed or expired)")
+        return removed
+
+    # --- Coalescing ---
+    async def get_or_compute(self, key, lat, lon, compute):
+        """
+        (result, source): a stored result ("cache"), the result of the same
+        computation already running in this process or, with lock_dir, in
+        another serve.py worker ("coalesced"), or of a new one ("computed").
+        compute() is async and returns (record, JPEG) or None (nothing worth
+        caching, e.g. no image for this location).
+        """
+        result = await asyncio.to_thread(self.get, key)
+        if result is not None:
+            self.hits += 1
+            CACHE_EVENTS.inc(cache="results", result="hit")
+            return result, "cache"
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            CACHE_EVENTS.inc(cache="results", result="coalesced")
+            return (await asyncio.shield(task))[0], "coalesced"
+
+        async def run():
+            lock = None
+            try:
+                lock = await self._lock(key)
+                if lock is not None and lock[0] is None:
+                    # Another worker held the key: its result is in the database now (unless it failed)
+                    result = await asyncio.to_thread(self.get, key)
+                    if result is not None:
+                        self.coalesced += 1
+                        CACHE_EVENTS.inc(cache="results", result="coalesced")
+                        return result, "coalesced"
+                    lock = await self._lock(key, wait=False)
+
+                self.misses += 1
+                CACHE_EVENTS.inc(cache="results", result="miss")
+                computed = await compute()
+                if computed is None:
+                    return None, "computed"
+                record, image = computed
+                try:
+                    await asyncio.to_thread(self.put, key, lat, lon, record, image)
+                except Exception as e:
+                    print(f"⚠️ Could not store analysis result: {e}")  # The caller still gets it
+                return {**record, "image": image}, "computed"
+            finally:
+                self._inflight.pop(key, None)
+                if lock is not None and lock[0] is not None:
+                    unlock(*lock)
+
+        # A task of its own: a caller disconnecting doesn't cancel it for the others
+        task = asyncio.ensure_future(run())
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _lock(self, key, wait=True):
+        """
+        Cross-worker half of the coalescing (only with lock_dir): (fd, path) once
+        this process holds the key's lock file; (None, path) if wait and another
+        worker held it (it has finished, or LOCK_WAIT passed); None without lock_dir
+        or if, without waiting, it's still held (compute anyway, just unlocked).
+        """
+        if self.lock_dir is None:
+            return None
+        path = os.path.join(self.lock_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lock")
+        fd = try_lock(path)
+        if fd is not None:
+            return fd, path
+        if not wait:
+            return None
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL)
+            fd = try_lock(path)
+            if fd is not None:
+                unlock(fd, path)  # Free again: the other worker is done
+                break
+        return None, path
+
+    # --- Spatial queries ---
+    def nearby(self, lat, lon, radius_m=QUICK_RADIUS_M, model=None, limit=QUICK_NEIGHBOURS):
+        """Past results within radius_m (nearest first): [{distance_m, roof_area_m2, is_estimated}]."""
+        dlat = radius_m / _M_PER_DEG_LAT
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        query = ("SELECT r.lat, r.lon, r.roof_area_m2, r.is_estimated FROM results_rtree t "
+                 "JOIN results r ON r.id = t.id "
+                 "WHERE t.max_lat >= ? AND t.min_lat <= ? AND t.max_lon >= ? AND t.min_lon <= ? AND r.created >= ?")
+        params = [lat - dlat, lat + dlat, lon - dlon, lon + dlon, time.time() - self.ttl_seconds]
+        if model is not None:
+            query += " AND r.model = ?"
+            params.append(model)
+        found = []
+        for row_lat, row_lon, area, is_estimated in self._db().execute(query, params):
+            distance = _distance_m(lat, lon, row_lat, row_lon)
+            if distance <= radius_m:
+                found.append({"distance_m": distance, "roof_area_m2": area, "is_estimated": bool(is_estimated)})
+        found.sort(key=lambda item: item["distance_m"])
+        return found[:limit]
+
+    def stats(self):
+        count = self._db().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"results": count, "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "computing": len(self._inflight)}
@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+import numpy as np
+from services.solar_engine import ROI_FIELDS
+from services.energy_sim import DEFAULT_LAT
+
+# calculate_roi arguments; None = required column
+ROI_INPUTS = {
+    "roof_area_m2": None,
+    "annual_irradiance": None,
+    "monthly_bill": 0.0,
+    "loan_rate": 11.5,
+    "loan_years": 5,
+    "connection_type": "Single",
+    "lat": DEFAULT_LAT,  # Only shapes the hourly battery simulation
+}
+
+
+def _rows_to_columns(rows):
+    if not rows:
+        raise ValueError("No sites given")
+    return {name: [row.get(name) for row in rows] for name in ROI_INPUTS}
+
+
+def parse_sites(body, content_type):
+    """
+    Request body -> {argument: array} for calculate_roi_batch.
+
+    CSV: header row with the calculate_roi argument names.
+    JSON: a list of site objects, {"sites": [...]}, or columns
+    ({"roof_area_m2": [...], ...}). Missing optional values use the
+    calculate_roi defaults. Raises ValueError with a readable message.
+    """
+    if "csv" in content_type:
+        columns = _rows_to_columns(list(csv.DictReader(io.StringIO(body.decode("utf-8-sig")))))
+    else:
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if isinstance(payload, dict) and "sites" in payload:
+            payload = payload["sites"]
+        if isinstance(payload, list):
+            columns = _rows_to_columns(payload)
+        elif isinstance(payload, dict):
+            columns = {name: payload.get(name) for name in ROI_INPUTS}
+        else:
+            raise ValueError("Expected a list of sites or a dict of columns")
+
+    count = None
+    arrays = {}
+    for name, default in ROI_INPUTS.items():
+        values = columns.get(name)
+        if values is None:
+            if default is None:
+                raise ValueError(f"Missing column '{name}'")
+            arrays[name] = default
+            continue
+        if not isinstance(values, list):
+            values = [values]
+        if count is None:
+            count = len(values)
+        elif len(values) != count:
+            raise ValueError(f"Column '{name}' has {len(values)} values, expected {count}")
+        if default is None and any(v in (None, "") for v in values):
+            raise ValueError(f"Column '{name}' has empty values")
+        # Empty cells fall back to the default, like a missing column
+        values = [default if v in (None, "") else v for v in values]
+        if name == "connection_type":
+            arrays[name] = np.asarray([str(v) for v in values])
+        else:
+            try:
+                arrays[name] = np.asarray(values, dtype=np.float64)
+            except (TypeError, ValueError):
+                raise ValueError(f"Column '{name}' must be numeric")
+    if not count:
+        raise ValueError("No sites given")
+    arrays["count"] = count
+    return arrays
+
+
+def json_safe(values):
+    """Array -> (nested) lists, NaN -> None (JSON has no NaN)."""
+    values = np.asarray(values)
+    if values.dtype.kind == "f" and np.isnan(values).any():
+        values = np.where(np.isnan(values), None, values.astype(object))
+    return values.tolist()
+
+
+def results_to_columns(results):
+    """calculate_roi_batch output -> JSON-friendly lists."""
+    return {field: json_safe(results[field]) for field in ROI_FIELDS}
+
+
+def results_to_csv(inputs, results, count):
+    """One CSV row per site: the inputs followed by every calculate_roi field (None -> empty cell)."""
+    columns = {name: np.broadcast_to(np.asarray(inputs[name]), (count,)).tolist() for name in ROI_INPUTS}
+    columns.update({field: json_safe(np.broadcast_to(np.asarray(results[field]), (count,))) for field in ROI_FIELDS})
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    writer.writerows(zip(*columns.values()))
+    return out.getvalue()
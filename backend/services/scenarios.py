@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from services.roi_batch import json_safe
+
+ANALYSIS_CACHE_ITEMS = int(os.getenv("SOLIX_ANALYSIS_CACHE_ITEMS", "1024"))
+ANALYSIS_CACHE_TTL = int(os.getenv("SOLIX_ANALYSIS_CACHE_TTL", str(24 * 3600)))  # seconds
+SCENARIO_MAX = int(os.getenv("SOLIX_SCENARIO_MAX", "20000"))  # Grid points per sweep
+
+# Sweep axis (request name, same as the /api/analyze/full form field) -> calculate_roi argument
+SCENARIO_AXES = {
+    "loan_rate": "loan_rate",
+    "loan_years": "loan_years",
+    "phase": "connection_type",
+    "bill": "monthly_bill",
+}
+PHASES = ("Single", "Three")
+# Returned when the request doesn't name any fields (numeric, chart-friendly)
+DEFAULT_SCENARIO_FIELDS = (
+    "recommended_system_kw", "monthly_generation_kwh", "normal_monthly_income",
+    "total_investment_lkr", "payback_period", "loan_installment", "net_monthly_result",
+    "npv_lkr", "irr_percent",
+)
+
+
+class AnalysisCache:
+    """
+    The expensive half of an analysis (roof area from the image + CV,
+    irradiance from NASA) by analysis id, so financial what-ifs can be
+    re-run against it without fetching or detecting anything again.
+    In memory, oldest entries go first (count + TTL); also written to
+    `shared` (a SharedDir) when several worker processes serve the API.
+    """
+
+    def __init__(self, max_items=ANALYSIS_CACHE_ITEMS, ttl_seconds=ANALYSIS_CACHE_TTL, shared=None):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._items = OrderedDict()  # id -> (created, analysis dict)
+        self._lock = threading.Lock()
+
+    def put(self, analysis):
+        analysis_id = uuid.uuid4().hex
+        with self._lock:
+            self._items[analysis_id] = (time.time(), analysis)
+            self._trim()
+        if self.shared is not None:
+            self.shared.write(f"{analysis_id}.json", json.dumps(analysis, default=_to_json).encode("utf-8"))
+        return analysis_id
+
+    def get(self, analysis_id):
+        with self._lock:
+            self._trim()
+            entry = self._items.get(analysis_id)
+        if entry is not None:
+            return entry[1]
+        if self.shared is None or not analysis_id.isalnum():
+            return None
+        data = self.shared.read(f"{analysis_id}.json")  # Cached by another worker
+        if data is None:
+            return None
+        analysis = json.loads(data)
+        with self._lock:
+            self._items[analysis_id] = (time.time(), analysis)
+            self._trim()
+        return analysis
+
+    def _trim(self):
+        # Caller holds the lock
+        cutoff = time.time() - self.ttl_seconds
+        while self._items:
+            created, _ = next(iter(self._items.values()))
+            if len(self._items) <= self.max_items and created >= cutoff:
+                break
+            self._items.popitem(last=False)
+
+
+def _to_json(value):
+    # numpy arrays / scalars (monthly irradiance) -> lists / numbers
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+
+def run_sweep(calculator, analysis, axes, fields=DEFAULT_SCENARIO_FIELDS):
+    """
+    Every combination of the axis values (loan_rate x loan_years x phase x bill)
+    against one cached analysis, in a single calculate_roi_batch call.
+
+    axes: {axis name: list of values}, in the order the matrix should use.
+    Returns {"shape": [...], "values": {field: nested lists with that shape}},
+    so values[field][i][j][k][l] belongs to the i-th, j-th, ... axis values.
+    Per-year fields (yearly_balance_lkr) get one more, innermost level.
+    """
+    grids = np.meshgrid(*(np.asarray(values) for values in axes.values()), indexing="ij")
+    shape = grids[0].shape
+    arguments = {SCENARIO_AXES[name]: grid.ravel() for name, grid in zip(axes, grids)}
+    results = calculator.calculate_roi_batch(analysis["roof_area_m2"], analysis["irradiance"],
+                                             monthly_irradiance=analysis["monthly_irradiance"],
+                                             lat=analysis["lat"], **arguments)
+    values = {}
+    for field in fields:
+        column = np.asarray(results[field])
+        extra = column.shape[1:] if column.ndim > 1 else ()  # Years, for per-year fields
+        # Fields that don't depend on any axis come back as scalars
+        column = np.broadcast_to(column, (grids[0].size,) + extra)
+        values[field] = json_safe(column.reshape(shape + extra))
+    return {"shape": list(shape), "values": values}
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no serve.py workers there, try_lock() always succeeds
+    fcntl = None
+
+# Set by serve.py when it runs several worker processes: per-process caches
+# (images, analyses, queued reports) also go here so any worker can answer
+# for an id another worker handed out. Unset = one process, memory only.
+SHARED_DIR = os.getenv("SOLIX_SHARED_DIR")
+SWEEP_SECONDS = 60  # How often expired files are looked for
+
+
+class SharedDir:
+    """
+    Small files (one per id) in a directory all workers can see.
+
+    Writes go to a temp file and are renamed into place, so a reader never
+    sees a partial file. Files older than ttl_seconds count as gone and are
+    deleted by an occasional sweep from write().
+    """
+
+    def __init__(self, root, ttl_seconds):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self._swept_at = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def write(self, name, data):
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._sweep()
+
+    def read(self, name):
+        """The file's bytes, or None if it doesn't exist or has expired."""
+        path = self._path(name)
+        try:
+            if os.path.getmtime(path) < time.time() - self.ttl_seconds:
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def items(self):
+        """(name, bytes) of every file that hasn't expired."""
+        cutoff = time.time() - self.ttl_seconds
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    continue
+                with open(entry.path, "rb") as f:
+                    yield entry.name, f.read()
+            except FileNotFoundError:
+                pass
+
+    def remove(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def _sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._swept_at < SWEEP_SECONDS:
+                return
+            self._swept_at = now
+        cutoff = now - max(self.ttl_seconds, SWEEP_SECONDS)  # Temp files get at least a minute
+        for entry in os.scandir(self.root):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass  # Another worker swept it first
+
+
+def shared_dir(kind, ttl_seconds):
+    """SharedDir for one kind of cache under SOLIX_SHARED_DIR, or None when running single-process."""
+    if not SHARED_DIR:
+        return None
+    return SharedDir(os.path.join(SHARED_DIR, kind), ttl_seconds)
+
+
+def shared_path(kind):
+    """Directory for one kind of shared file under SOLIX_SHARED_DIR (created), or None when single-process."""
+    if not SHARED_DIR:
+        return None
+    path = os.path.join(SHARED_DIR, kind)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def try_lock(path):
+    """
+    Exclusive lock on a lock file (created if missing) without waiting: an
+    open fd to pass to unlock(), or None if another process or fd holds it.
+    The OS drops the lock if the holder dies, so a crash never leaves it stuck.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # The previous holder may have deleted the file between our open and flock
+        if os.fstat(fd).st_ino == os.stat(path).st_ino:
+            return fd
+    except (BlockingIOError, FileNotFoundError):
+        pass
+    os.close(fd)
+    return None
+
+
+def unlock(fd, path):
+    """Releases a try_lock() lock and deletes its file (lock files don't pile up)."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    os.close(fd)
@@ -0,0 +1,234 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+
+from services.batch_inference import BATCH_SIZE
+from services.shared_state import try_lock, unlock
+
+# Site fields for /api/analyze/batch (same names as the /api/analyze/full form); None = required
+SITE_INPUTS = {
+    "district": None,
+    "lat": None,
+    "lon": None,
+    "bill": 0.0,
+    "loan_rate": 11.5,
+    "loan_years": 5,
+    "phase": "Single",
+    "name": "",  # Optional label, echoed back
+}
+ANALYZE_BATCH_MAX = int(os.getenv("SOLIX_ANALYZE_BATCH_MAX", "5000"))  # Sites per request
+# Sites fetching (tile + irradiance) at once, and sites inside YOLO at once. The second
+# should be at least SOLIX_BATCH_SIZE so the micro-batcher can fill its forward passes.
+FETCH_CONCURRENCY = int(os.getenv("SOLIX_BATCH_FETCH_CONCURRENCY", "8"))
+CV_CONCURRENCY = int(os.getenv("SOLIX_BATCH_CV_CONCURRENCY", str(BATCH_SIZE)))
+ROI_GROUP = 64  # Max sites per calculate_roi_batch call
+BATCH_DIR = os.getenv("SOLIX_BATCH_DIR", "data/batches")
+BATCH_TTL = int(os.getenv("SOLIX_BATCH_TTL", str(7 * 24 * 3600)))  # seconds a journal is kept for resuming
+
+
+def _site(row, number, phases):
+    site = {}
+    for name, default in SITE_INPUTS.items():
+        value = row.get(name)
+        if value in (None, ""):
+            if default is None:
+                raise ValueError(f"Site {number}: missing '{name}'")
+            value = default
+        try:
+            if name in ("lat", "lon", "bill", "loan_rate"):
+                value = float(value)
+            elif name == "loan_years":
+                value = int(float(value))
+            else:
+                value = str(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Site {number}: '{name}' must be numeric")
+        site[name] = value
+    if site["lat"] == 0 or site["lon"] == 0:
+        raise ValueError(f"Site {number}: invalid GPS coordinates")
+    if site["loan_rate"] <= 0:
+        raise ValueError(f"Site {number}: loan_rate must be greater than 0")
+    if site["phase"] not in phases:
+        raise ValueError(f"Site {number}: phase must be one of {', '.join(phases)}")
+    return site
+
+
+def parse_site_list(body, content_type, phases, max_sites=ANALYZE_BATCH_MAX):
+    """
+    Request body -> list of site dicts (SITE_INPUTS keys, defaults filled in).
+
+    CSV with a header row, NDJSON (one site object per line), or JSON (a list
+    of site objects or {"sites": [...]}). Raises ValueError with a readable message.
+    """
+    text = body.decode("utf-8-sig")
+    if "csv" in content_type:
+        rows = csv.DictReader(io.StringIO(text))
+    elif "ndjson" in content_type:
+        try:
+            rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid NDJSON: {e}")
+    else:
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if isinstance(rows, dict):
+            rows = rows.get("sites")
+        if not isinstance(rows, list):
+            raise ValueError("Expected a list of sites or {\"sites\": [...]}")
+
+    sites = []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            raise ValueError(f"Site {number}: expected an object")
+        if number > max_sites:
+            raise ValueError(f"Send at most {max_sites} sites per request.")
+        sites.append(_site(row, number, phases))
+    if not sites:
+        raise ValueError("No sites given")
+    return sites
+
+
+def batch_key(sites, settings):
+    """Content address of a batch: the same sites with the same settings resume the same journal."""
+    digest = hashlib.sha256(json.dumps([settings, sites], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+class BatchJournal:
+    """
+    Results of one batch on disk (<BATCH_DIR>/<batch_id>.ndjson), one line
+    per finished site, appended as each site completes. Sending the same
+    batch again replays these lines and analyses only the sites that are
+    missing, so an interrupted upload of a housing scheme picks up where it
+    stopped. Only successful sites are journaled: failures are retried.
+
+    One writer at a time: lock() takes an exclusive lock file next to the
+    journal, which also holds across serve.py workers (same directory).
+    """
+
+    def __init__(self, batch_id, root=BATCH_DIR, ttl_seconds=BATCH_TTL):
+        self.batch_id = batch_id
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.path = os.path.join(root, f"{batch_id}.ndjson")
+        self._lock = None
+
+    def lock(self):
+        """True if this journal is now ours, False if another request (or worker) is writing it."""
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = try_lock(f"{self.path}.lock")
+        return self._lock is not None
+
+    def unlock(self):
+        """Releases lock(); safe to call more than once."""
+        if self._lock is not None:
+            fd, self._lock = self._lock, None
+            unlock(fd, f"{self.path}.lock")
+
+    def load(self):
+        """{site index: result} of the sites finished so far (none if expired)."""
+        try:
+            if os.path.getmtime(self.path) < time.time() - self.ttl_seconds:
+                return {}
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return {}
+        done = {}
+        for line in lines:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Last line cut short by a crash
+            done[result["index"]] = result
+        return done
+
+    def append(self, result):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+    def sweep(self):
+        """Deletes every journal older than the TTL."""
+        if not os.path.isdir(self.root):
+            return
+        cutoff = time.time() - self.ttl_seconds
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".lock"):
+                continue  # Held by a running batch (deleted by unlock)
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+async def stream_sites(sites, fetch, detect, finish, fetch_concurrency=FETCH_CONCURRENCY,
+                       cv_concurrency=CV_CONCURRENCY, group_size=ROI_GROUP):
+    """
+    Runs (index, site) pairs through three overlapping stages and yields one
+    result dict per site, in the order they finish:
+
+        fetch(site)            async: image + irradiance, fetch_concurrency sites at a time
+        detect(site, fetched)  async: roof detection, cv_concurrency sites at a time
+                               (together they fill the YOLO micro-batcher)
+        finish([(index, site, detected), ...])  sync, on a thread: one vectorized
+                               ROI call for every site detected so far -> results
+
+    Stages are joined by small bounded queues and the caller pulls results,
+    so a slow reader stalls the pipeline instead of piling up images: memory
+    stays bounded whatever the number of sites. A failing site yields
+    {"index", "status": "error", "message"} and the others carry on.
+    """
+    pending = iter(sites)
+    fetched = asyncio.Queue(maxsize=cv_concurrency)
+    detected = asyncio.Queue(maxsize=group_size)
+    results = asyncio.Queue(maxsize=group_size)
+
+    def failed(index, e):
+        return {"index": index, "status": "error", "message": str(e) or type(e).__name__}
+
+    async def fetch_worker():
+        for index, site in pending:  # Shared iterator: each site is taken by one worker
+            try:
+                await fetched.put((index, site, await fetch(site)))
+            except Exception as e:
+                await results.put(failed(index, e))
+
+    async def detect_worker():
+        while True:
+            index, site, data = await fetched.get()
+            try:
+                await detected.put((index, site, await detect(site, data)))
+            except Exception as e:
+                await results.put(failed(index, e))
+
+    async def finish_worker():
+        while True:
+            group = [await detected.get()]
+            while len(group) < group_size and not detected.empty():
+                group.append(detected.get_nowait())
+            try:
+                for result in await asyncio.to_thread(finish, group):
+                    await results.put(result)
+            except Exception as e:
+                for index, _, _ in group:
+                    await results.put(failed(index, e))
+
+    tasks = [asyncio.create_task(fetch_worker()) for _ in range(fetch_concurrency)]
+    tasks += [asyncio.create_task(detect_worker()) for _ in range(cv_concurrency)]
+    tasks.append(asyncio.create_task(finish_worker()))
+    try:
+        for _ in range(len(sites)):
+            yield await results.get()
+    finally:
+        # Also runs when the client disconnects: nothing keeps working for nobody
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
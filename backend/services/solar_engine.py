@@ -1,8 +1,52 @@
+import asyncio
+import os
+import numpy as np
 import requests
+import httpx
+from services.irradiance_store import IrradianceStore, parse_nasa_climatology
+from services.energy_sim import simulate_year, DEFAULT_LAT
+from services.cashflow import project_cash_flows
+from services.metrics import stage, IRRADIANCE_SOURCES
+
+# NASA_POWER_URL can point at a local stand-in (offline dev / testing)
+NASA_POWER_URL = os.getenv("NASA_POWER_URL", "https://power.larc.nasa.gov/api/temporal/climatology/point")
+
+# Output fields of calculate_roi / calculate_roi_batch
+ROI_FIELDS = (
+    "system_capacity_kw", "recommended_system_kw", "max_roof_capacity_kw", "effective_max_kw",
+    "monthly_generation_kwh", "tariff_rate", "monthly_earning_lkr", "normal_monthly_income",
+    "battery_monthly_earning", "battery_extra_profit", "total_investment_lkr", "payback_period",
+    "loan_installment", "net_monthly_result", "note",
+    "battery_night_export_kwh", "solar_load_coverage",
+    "npv_lkr", "irr_percent", "discounted_payback_years", "lifetime_net_income_lkr",
+)
+# Per-year outputs (one value per projection year), not part of the flat ROI_FIELDS
+SERIES_FIELDS = ("yearly_balance_lkr",)
+
+def _round_or_none(value, ndigits):
+    # NaN = never reached (no IRR / no discounted payback within the projection)
+    return None if np.isnan(value) else round(value, ndigits)
+
+def round_like_python(values, ndigits):
+    """
+    round(x, ndigits) for a float array, bit-for-bit.
+    np.round scales by 10**ndigits first, which can flip values sitting next
+    to a .5 boundary; those few are redone with Python's round().
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scale = 10.0 ** ndigits
+    scaled = values * scale
+    rounded = np.rint(scaled) / scale
+    near_tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) <= 4 * np.spacing(np.abs(scaled))
+    for i in np.flatnonzero(near_tie):
+        rounded.flat[i] = round(float(values.flat[i]), ndigits)
+    return rounded
 
 class SolarCalculator:
-    def __init__(self):
-        self.base_url = "https://power.larc.nasa.gov/api/temporal/climatology/point"
+    def __init__(self, store=None):
+        self.base_url = NASA_POWER_URL
+        # Offline grid + persistent cache -> most lookups never touch the network
+        self.store = store if store is not None else IrradianceStore()
         self.district_sun_hours = {
             "Colombo": 4.5, "Gampaha": 4.6, "Kalutara": 4.5, "Galle": 4.8,
             "Matara": 4.9, "Hambantota": 5.5, "Jaffna": 5.8, "Kilinochchi": 5.7,
@@ -13,22 +57,67 @@ class SolarCalculator:
             "Monaragala": 5.0
         }
 
+    def _nasa_params(self, lat, lon):
+        return {
+            "parameters": "ALLSKY_SFC_SW_DWN",
+            "community": "RE",
+            "longitude": lon,
+            "latitude": lat,
+            "format": "JSON"
+        }
+
+    def _district_fallback(self, district, error):
+        print(f"⚠️ NASA lookup failed ({error}). Using {district} district average.")
+        IRRADIANCE_SOURCES.inc(source="district_fallback")
+        # No monthly data for districts: every month gets the annual average
+        return np.full(13, self.district_sun_hours.get(district, 4.5), dtype=np.float32)
+
+    def get_solar_climatology(self, lat, lon, district):
+        """[JAN..DEC, ANN] kWh/m2/day (monthly values feed the hourly simulation)."""
+        values = self.store.lookup(lat, lon)
+        if values is not None:
+            IRRADIANCE_SOURCES.inc(source="local")
+            return values
+
+        try:
+            with stage("nasa_call"):
+                response = requests.get(self.base_url, params=self._nasa_params(lat, lon), timeout=5)
+                values = parse_nasa_climatology(response.json())
+            IRRADIANCE_SOURCES.inc(source="nasa")
+            self.store.remember(lat, lon, values)
+            return values
+        except Exception as e:
+            return self._district_fallback(district, e)
+
     def get_solar_data(self, lat, lon, district):
+        return float(self.get_solar_climatology(lat, lon, district)[-1])
+
+    async def lookup_climatology_async(self, lat, lon, district, client=None):
+        """
+        (values, source): get_solar_climatology without blocking the event loop, plus
+        where the values came from: "local" (grid / cached NASA), "nasa" or
+        "district_fallback" (NASA failed).
+        """
+        values = self.store.lookup(lat, lon)
+        if values is not None:
+            IRRADIANCE_SOURCES.inc(source="local")
+            return values, "local"
+
+        own_client = client is None
+        if own_client:
+            client = httpx.AsyncClient()
         try:
-            params = {
-                "parameters": "ALLSKY_SFC_SW_DWN",
-                "community": "RE",
-                "longitude": lon,
-                "latitude": lat,
-                "format": "JSON"
-            }
-            response = requests.get(self.base_url, params=params, timeout=5)
-            data = response.json()
-            monthly_data = data['properties']['parameter']['ALLSKY_SFC_SW_DWN']
-            annual_avg = monthly_data.get('ANN', 5.0)
-            return float(annual_avg)
-        except:
-            return self.district_sun_hours.get(district, 4.5)
+            with stage("nasa_call"):
+                response = await client.get(self.base_url, params=self._nasa_params(lat, lon), timeout=5)
+                values = parse_nasa_climatology(response.json())
+            IRRADIANCE_SOURCES.inc(source="nasa")
+            await asyncio.to_thread(self.store.remember, lat, lon, values)
+            return values, "nasa"
+        except Exception as e:
+            return self._district_fallback(district, e), "district_fallback"
+        finally:
+            if own_client:
+                await client.aclose()
 
     def estimate_usage_from_bill(self, bill_lkr):
         fixed_charge = 1000 
@@ -53,7 +142,31 @@ class SolarCalculator:
         n = years * 12
         return round(total_loan_amount * (r * (1 + r)**n) / ((1 + r)**n - 1), 2)
 
-    def calculate_roi(self, roof_area_m2, annual_irradiance, monthly_bill=0, loan_rate=11.5, loan_years=5, connection_type="Single"):
+    def calculate_loan_installment_batch(self, total_loan_amount, rate_annual, years):
+        """calculate_loan_installment over arrays (same results)."""
+        total = np.asarray(total_loan_amount, dtype=np.float64)
+        rate = np.asarray(rate_annual, dtype=np.float64)
+        years = np.asarray(years, dtype=np.float64)
+        total, rate, years = np.broadcast_arrays(total, rate, years)
+        no_loan = (total <= 0) | (years == 0)
+        if np.any((rate == 0) & ~no_loan):
+            raise ValueError("loan_rate must not be 0 for a loan")  # Scalar path divides by zero
+
+        r = (rate / 100) / 12
+        n = years * 12
+        # (1 + r)**n with Python's pow (numpy's SIMD pow may differ in the last bit).
+        # Sites share a handful of (rate, years) pairs, so this is a few calls, not one per site.
+        # (complex numbers pack both floats exactly, and 1-D unique is much faster than axis=1)
+        pairs, inverse = np.unique((r + 1j * n).ravel(), return_inverse=True)
+        growth = np.array([(1 + p.real) ** p.imag for p in pairs.tolist()])[inverse].reshape(r.shape)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            installment = total * (r * growth) / (growth - 1)
+        return np.where(no_loan, 0.0, round_like_python(np.where(no_loan, 0.0, installment), 2))
+
+    def calculate_roi(self, roof_area_m2, annual_irradiance, monthly_bill=0, loan_rate=11.5, loan_years=5, connection_type="Single",
+                      monthly_irradiance=None, lat=DEFAULT_LAT, load_profile="residential"):
+        # monthly_irradiance: [JAN..DEC] kWh/m2/day for the battery simulation (default: annual value every month)
         # 1. Engineering Potential
         usable_area = roof_area_m2 * 0.7 
         max_roof_capacity_kw = usable_area / 6.0 
@@ -75,6 +188,7 @@ class SolarCalculator:
             roof_note = "Roof capacity is within phase limits."
 
         # 3. Required System
+        required_units = 0
         if monthly_bill > 0:
             required_units = self.estimate_usage_from_bill(monthly_bill)
             required_system_kw = required_units / 120.0 
@@ -111,14 +225,22 @@ class SolarCalculator:
         # 5. Financials (Smart Battery / Night Export)
         # Night Peak Rate: Rs 45.80
         battery_rate = 45.80
-        # Assume 50% export at day, 50% at night
-        battery_monthly_income = (monthly_units * 0.5 * buy_back_rate) + (monthly_units * 0.5 * battery_rate)
+        # Day / night split from the hourly simulation (what the battery absorbs vs. returns in the peak)
+        if monthly_irradiance is None:
+            monthly_irradiance = [annual_irradiance] * 12
+        sim = simulate_year(recommended_kw, monthly_irradiance[:12], lat, required_units, load_profile)
+        charge_share = float(sim["battery_charge_share"][0])
+        night_units = monthly_units * float(sim["battery_export_share"][0])
+        battery_monthly_income = (monthly_units * (1 - charge_share) * buy_back_rate) + (night_units * battery_rate)
         extra_profit = battery_monthly_income - monthly_income
         
         # 6. Loan & Net
         loan_payment = self.calculate_loan_installment(total_cost, loan_rate, loan_years)
         net_result = monthly_income - loan_payment
 
+        # 7. Long-term projection (degradation, escalation, O&M, discounting)
+        cash = project_cash_flows(total_cost, monthly_income, loan_payment, loan_years)
+
         return {
             "system_capacity_kw": round(recommended_kw, 2),
             "recommended_system_kw": round(recommended_kw, 2),
@@ -139,5 +261,120 @@ class SolarCalculator:
             
             "loan_installment": loan_payment,
             "net_monthly_result": round(net_result, 2),
-            "note": rec_note + phase_warning
-        }
\ No newline at end of file
+            "note": rec_note + phase_warning,
+
+            "battery_night_export_kwh": round(night_units, 2),
+            "solar_load_coverage": round(float(sim["load_coverage"][0]), 3),
+
+            "npv_lkr": round(float(cash["npv_lkr"][0]), 2),
+            "irr_percent": _round_or_none(float(cash["irr_percent"][0]), 2),
+            "discounted_payback_years": _round_or_none(float(cash["discounted_payback_years"][0]), 1),
+            "lifetime_net_income_lkr": round(float(cash["lifetime_net_income_lkr"][0]), 2),
+            "yearly_balance_lkr": [round(v, 2) for v in cash["yearly_balance"][0].tolist()]
+        }
+
+    def calculate_roi_batch(self, roof_area_m2, annual_irradiance, monthly_bill=0, loan_rate=11.5, loan_years=5, connection_type="Single",
+                            monthly_irradiance=None, lat=DEFAULT_LAT, load_profile="residential"):
+        """
+        calculate_roi for many sites at once. Arguments are arrays (or scalars,
+        broadcast against them; monthly_irradiance is (n, 12) or (12,)).
+        Returns {field: array} with the same fields and the same values as
+        calculate_roi, bit-for-bit.
+        """
+        roof, irradiance, bill, rate, years = np.broadcast_arrays(*[
+            np.asarray(v, dtype=np.float64)
+            for v in (roof_area_m2, annual_irradiance, monthly_bill, loan_rate, loan_years)
+        ])
+        single_phase = np.broadcast_to(np.asarray(connection_type) == "Single", roof.shape)
+
+        # 1. Engineering Potential
+        usable_area = roof * 0.7
+        max_roof_capacity_kw = usable_area / 6.0
+
+        # 2. Connection Limit
+        phase_limit_kw = np.where(single_phase, 5.0, 100.0)
+        effective_max_kw = np.where(max_roof_capacity_kw > phase_limit_kw, phase_limit_kw, max_roof_capacity_kw)
+
+        # 3. Required System (estimate_usage_from_bill, vectorized)
+        avg_cost = np.select([bill < 5000, bill < 15000, bill < 40000], [25.0, 45.0, 55.0], 65.0)
+        required_units = np.where(bill <= 1000, 0.0, round_like_python((bill - 1000) / avg_cost, 1))
+        required_system_kw = required_units / 120.0
+        limited = (bill > 0) & (required_system_kw > effective_max_kw)
+        recommended_kw = np.where(bill > 0, np.where(limited, effective_max_kw, required_system_kw), effective_max_kw)
+        recommended_kw = np.where(recommended_kw < 1, 1.0, recommended_kw)
+
+        # 4. Financials (Standard Day Export)
+        monthly_units = recommended_kw * irradiance * 30 * 0.75
+        buy_back_rate = np.select(
+            [recommended_kw <= 5, recommended_kw <= 20, recommended_kw <= 100],
+            [20.90, 19.61, 17.46],
+            15.07
+        )
+        monthly_income = monthly_units * buy_back_rate
+        total_cost = recommended_kw * 280000
+
+        # 5. Financials (Smart Battery / Night Export)
+        battery_rate = 45.80
+        if monthly_irradiance is None:
+            monthly_irradiance = np.repeat(irradiance.reshape(-1, 1), 12, axis=1)
+        else:
+            monthly_irradiance = np.asarray(monthly_irradiance, dtype=np.float64)[..., :12]
+        sim = simulate_year(recommended_kw.ravel(), monthly_irradiance, np.broadcast_to(lat, roof.shape).ravel(),
+                            np.where(bill > 0, required_units, 0.0).ravel(), load_profile)
+        sim = {name: values.reshape(roof.shape) for name, values in sim.items()}
+        night_units = monthly_units * sim["battery_export_share"]
+        battery_monthly_income = (monthly_units * (1 - sim["battery_charge_share"]) * buy_back_rate) + (night_units * battery_rate)
+        extra_profit = battery_monthly_income - monthly_income
+
+        # 6. Loan & Net
+        loan_payment = self.calculate_loan_installment_batch(total_cost, rate, years)
+        net_result = monthly_income - loan_payment
+
+        # 7. Long-term projection
+        cash = project_cash_flows(total_cost.ravel(), monthly_income.ravel(), loan_payment.ravel(), years.ravel())
+        cash = {name: values.reshape(roof.shape + values.shape[1:]) for name, values in cash.items()}
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            payback = round_like_python(np.where(monthly_income > 0, total_cost / (monthly_income * 12), 0.0), 1)
+        payback = np.where(monthly_income > 0, payback, 0.0)
+
+        # Notes: fixed texts picked per site; only the "limited" ones need formatting
+        notes = np.where(bill > 0, "Success: System meets your full needs.", "Based on maximum roof potential.").astype(object)
+        for i in map(tuple, np.argwhere(limited)):
+            notes[i] = (f"Warning: You need {round(float(required_system_kw[i]), 1)}kW, "
+                        f"but are limited to {float(effective_max_kw[i])}kW.")
+        notes = np.where(single_phase, notes + " (Limited to 5kW by Single Phase)", notes)
+
+        recommended = round_like_python(recommended_kw, 2)
+        income = round_like_python(monthly_income, 2)
+        return {
+            "system_capacity_kw": recommended,
+            "recommended_system_kw": recommended,
+            "max_roof_capacity_kw": round_like_python(max_roof_capacity_kw, 2),
+            "effective_max_kw": round_like_python(effective_max_kw, 2),
+
+            "monthly_generation_kwh": round_like_python(monthly_units, 2),
+            "tariff_rate": buy_back_rate,
+
+            "monthly_earning_lkr": income,
+            "normal_monthly_income": income,
+
+            "battery_monthly_earning": round_like_python(battery_monthly_income, 2),
+            "battery_extra_profit": round_like_python(extra_profit, 2),
+
+            "total_investment_lkr": round_like_python(total_cost, 2),
+            "payback_period": payback,
+
+            "loan_installment": loan_payment,
+            "net_monthly_result": round_like_python(net_result, 2),
+            "note": notes,
+
+            "battery_night_export_kwh": round_like_python(night_units, 2),
+            "solar_load_coverage": round_like_python(sim["load_coverage"], 3),
+
+            "npv_lkr": round_like_python(cash["npv_lkr"], 2),
+            "irr_percent": round_like_python(cash["irr_percent"], 2),  # NaN = no IRR
+            "discounted_payback_years": round_like_python(cash["discounted_payback_years"], 1),  # NaN = not within the projection
+            "lifetime_net_income_lkr": round_like_python(cash["lifetime_net_income_lkr"], 2),
+            "yearly_balance_lkr": round_like_python(cash["yearly_balance"], 2)
+        }
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from services.metrics import CACHE_EVENTS
+
+TILE_CACHE_DIR = os.getenv("SOLIX_TILE_CACHE_DIR", "data/tiles")
+TILE_CACHE_MAX_MB = int(os.getenv("SOLIX_TILE_CACHE_MB", "500"))
+TOUCH_SECONDS = 60  # A hit refreshes the tile's LRU time at most this often (saves a write per hit)
+EVICT_CHUNK = 64    # Oldest tiles looked at per eviction query
+
+
+class TileCache:
+    """
+    Disk cache for satellite tiles.
+
+    Tile bytes are stored content-addressed (blobs/<sha256>), so identical
+    tiles (e.g. Esri's "no imagery" placeholder) are kept once.
+    An SQLite index (index.sqlite3) maps (zoom, x, y) -> blob with a
+    last-used time and keeps the total blob size, so a put is one small
+    transaction however big the cache is, and serve.py workers share one
+    index: max_bytes holds for all of them together. Least recently used
+    tiles are evicted when the total goes over max_bytes.
+    """
+
+    def __init__(self, root=TILE_CACHE_DIR, max_bytes=TILE_CACHE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, "index.sqlite3")
+
+        self._local = threading.local()  # sqlite connections are per thread (and per process)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._init_schema()
+
+    def _key(self, zoom, x, y):
+        return f"{zoom}/{x}/{y}"
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}.jpg")
+
+    # --- Index ---
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            os.makedirs(self.root, exist_ok=True)
+            db = sqlite3.connect(self.index_path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _init_schema(self):
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS tiles (key TEXT PRIMARY KEY, digest TEXT NOT NULL, used REAL NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS tiles_used ON tiles (used)")
+        db.execute("CREATE INDEX IF NOT EXISTS tiles_digest ON tiles (digest)")
+        db.execute("CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+        db.execute("INSERT OR IGNORE INTO usage VALUES (0, 0)")
+
+    def _release_blob(self, db, digest):
+        # Inside a transaction: forgets the blob once no key uses it; returns the file to delete
+        if db.execute("SELECT 1 FROM tiles WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+            return []
+        row = db.execute("SELECT size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return []
+        db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        db.execute("UPDATE usage SET bytes = bytes - ? WHERE id = 0", row)
+        return [self._blob_path(digest)]
+
+    def _evict(self, db):
+        # Inside a transaction. Oldest keys go first; keep the newest one.
+        orphans = []
+        while db.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0] > self.max_bytes:
+            oldest = db.execute(
+                "SELECT key, digest FROM tiles WHERE key != (SELECT key FROM tiles ORDER BY used DESC LIMIT 1) "
+                "ORDER BY used LIMIT ?", (EVICT_CHUNK,)
+            ).fetchall()
+            if not oldest:
+                break
+            for key, digest in oldest:
+                db.execute("DELETE FROM tiles WHERE key = ?", (key,))
+                orphans += self._release_blob(db, digest)
+                if db.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0] <= self.max_bytes:
+                    break
+        return orphans
+
+    def _remove_files(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # --- Public API ---
+    def get(self, zoom, x, y):
+        """Returns cached tile bytes or None."""
+        key = self._key(zoom, x, y)
+        db = self._db()
+        row = db.execute("SELECT digest, used FROM tiles WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            CACHE_EVENTS.inc(cache="tiles", result="miss")
+            return None
+        digest, used = row
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                data = f.read()
+        except OSError:
+            # Blob removed behind our back -> treat as a miss
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                db.execute("DELETE FROM tiles WHERE key = ? AND digest = ?", (key, digest))
+                self._release_blob(db, digest)
+            with self._lock:
+                self.misses += 1
+            CACHE_EVENTS.inc(cache="tiles", result="miss")
+            return None
+        now = time.time()
+        if used < now - TOUCH_SECONDS:
+            db.execute("UPDATE tiles SET used = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+        CACHE_EVENTS.inc(cache="tiles", result="hit")
+        return data
+
+    def put(self, zoom, x, y, data):
+        key = self._key(zoom, x, y)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+
+        # Write the blob outside the transaction (atomic rename, same content = same name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        try:
+            db = self._db()
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                old = db.execute("SELECT digest FROM tiles WHERE key = ?", (key,)).fetchone()
+                db.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?)", (key, digest, time.time()))
+                if db.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?)", (digest, len(data))).rowcount:
+                    db.execute("UPDATE usage SET bytes = bytes + ? WHERE id = 0", (len(data),))
+                orphans = self._release_blob(db, old[0]) if old and old[0] != digest else []
+                orphans += self._evict(db)
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not update tile cache index: {e}")
+            return
+        self._remove_files(orphans)  # After the commit: readers never see a row without its blob for long
+
+    def stats(self):
+        db = self._db()
+        tiles = db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+        blobs = db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        total_bytes = db.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0]
+        with self._lock:
+            return {
+                "tiles": tiles,
+                "blobs": blobs,
+                "bytes": total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
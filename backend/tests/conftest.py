@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.fixture(scope="session")
+def grid_path():
+    """Sri Lanka irradiance grid built from nasa_standin.py (made-up values, see that file)."""
+    return os.path.join(FIXTURES, "irradiance_grid.npz")
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory, grid_path):
+    """main.app run from an empty temp dir (its data/ and static/ go there), engines loaded on demand."""
+    workdir = tmp_path_factory.mktemp("app")
+    os.makedirs(workdir / "static")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(workdir)
+        patch.setenv("SOLIX_ENGINE_LOADING", "lazy")
+        patch.setenv("SOLIX_BUILD_IRRADIANCE_GRID", "0")
+        patch.setenv("SOLIX_IRRADIANCE_GRID", grid_path)
+        import main
+        yield main.app
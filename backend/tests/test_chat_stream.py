@@ -0,0 +1,115 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services import rag_engine
+
+
+def events(body):
+    """SSE body -> [(event, data)] ("message" when no event line)."""
+    parsed = []
+    for frame in body.split("\n\n"):
+        lines = [line for line in frame.splitlines() if not line.startswith(":")]
+        if not lines:
+            continue
+        event = next((line[7:] for line in lines if line.startswith("event: ")), "message")
+        data = next(json.loads(line[6:]) for line in lines if line.startswith("data: "))
+        parsed.append((event, data))
+    return parsed
+
+
+@pytest.fixture
+def use_rag(app, monkeypatch):
+    import main
+
+    def use(engine):
+        async def aget(name):
+            assert name == "rag"
+            return engine
+        monkeypatch.setattr(main.engines, "aget", aget)
+    return use
+
+
+class StubRAG:
+    def __init__(self, chunks, fail=False):
+        self.chunks, self.fail = chunks, fail
+
+    async def astream_answer(self, query):
+        for chunk in self.chunks:
+            yield chunk
+        if self.fail:
+            raise RuntimeError("LLM quota exceeded")
+
+
+def test_tokens_are_streamed_as_sse_frames(app, use_rag):
+    use_rag(StubRAG(["Net ", "Plus ", "pays"]))
+    with TestClient(app) as client:
+        response = client.post("/api/chat/stream", json={"message": "What does Net Plus pay?"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = events(response.text)
+    assert frames[:3] == [("message", {"token": "Net "}), ("message", {"token": "Plus "}), ("message", {"token": "pays"})]
+    assert frames[-1][0] == "done"
+
+
+def test_errors_end_the_stream_with_an_error_event(app, use_rag):
+    use_rag(StubRAG(["Partial "], fail=True))
+    with TestClient(app) as client:
+        frames = events(client.post("/api/chat/stream", json={"message": "q"}).text)
+    assert frames[0] == ("message", {"token": "Partial "})
+    assert frames[-1] == ("error", {"error": "⚠️ Error: LLM quota exceeded"})
+
+
+def test_fake_llm_streams_through_the_real_chain(app, use_rag, monkeypatch):
+    pytest.importorskip("langchain_classic")
+    pytest.importorskip("langchain_chroma")  # rag_engine needs the full LangChain set
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.vectorstores import InMemoryVectorStore
+
+    monkeypatch.setattr(rag_engine, "FAKE_LLM", True)
+    embeddings = DeterministicFakeEmbedding(size=32)
+    vector_db = InMemoryVectorStore.from_texts(["Net Plus buys back solar at LKR 20.90 per unit."], embeddings)
+    rag = rag_engine.SolarRAG(embeddings=embeddings, vector_db=vector_db)
+    assert rag.available
+    use_rag(rag)
+
+    with TestClient(app) as client:
+        frames = events(client.post("/api/chat/stream", json={"message": "What does Net Plus pay?"}).text)
+        tokens = [data["token"] for event, data in frames if event == "message"]
+        assert len(tokens) > 1  # Streamed, not one block
+        assert "".join(tokens) == rag_engine.FAKE_LLM_REPLY
+        assert frames[-1][0] == "done"
+
+        # Same question again: answer cache, one chunk, no LLM
+        again = events(client.post("/api/chat/stream", json={"message": "what does net plus pay"}).text)
+        assert [data["token"] for event, data in again if event == "message"] == [rag_engine.FAKE_LLM_REPLY]
+
+
+def test_answer_cache_lookups_run_off_the_event_loop():
+    # exact_answer may walk chroma_db (version check): it must not stall other requests
+    loop_thread = threading.get_ident()
+    seen = {}
+
+    class Cache:
+        def exact_answer(self, question):
+            seen["exact"] = threading.get_ident()
+            return None
+
+        def similar_answer(self, question, embedding):
+            seen["similar"] = threading.get_ident()
+            return "cached"
+
+    class Embeddings:
+        def embed_query(self, query):
+            return [1.0, 0.0]
+
+    rag = rag_engine.SolarRAG.__new__(rag_engine.SolarRAG)
+    rag.available, rag.cache, rag.embeddings = True, Cache(), Embeddings()
+
+    async def collect():
+        return [chunk async for chunk in rag.astream_answer("What does Net Plus pay?")]
+
+    assert asyncio.run(collect()) == ["cached"]
+    assert loop_thread not in (seen["exact"], seen["similar"])
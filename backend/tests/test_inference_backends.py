@@ -0,0 +1,185 @@
+import importlib.util
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from services.inference_backends import (NMS_IOU, WEIGHTS_ONNX, WEIGHTS_PT, OnnxBackend, _box_masks, _letterbox,
+                                         _nms, _strip_letterbox)
+
+
+@pytest.fixture
+def onnx():
+    backend = OnnxBackend.__new__(OnnxBackend)  # Post-processing only: no session
+    backend.names = {0: "roof", 1: "panel"}
+    return backend
+
+
+def head_output(anchors, nc=1, nm=2):
+    """(4 + nc + nm, A) raw YOLOv8-seg output from [(cx, cy, w, h, [class scores], [mask coeffs])]."""
+    return np.array([[cx, cy, w, h, *scores, *coeffs] for cx, cy, w, h, scores, coeffs in anchors],
+                    dtype=np.float32).reshape(len(anchors), 4 + nc + nm).T
+
+
+# --- Letterbox ---
+def test_letterbox_square_pads_short_side():
+    img = np.zeros((100, 200, 3), np.uint8)
+    canvas, gain, pad = _letterbox(img, 64)
+    assert canvas.shape == (64, 64, 3) and gain == 0.32 and pad == (0, 16)
+    assert (canvas[:16] == 114).all() and (canvas[48:] == 114).all()
+    assert (canvas[16:48] == 0).all()
+
+
+def test_letterbox_rect_pads_to_stride_only():
+    canvas, gain, pad = _letterbox(np.zeros((100, 200, 3), np.uint8), 64, rect=True)
+    assert canvas.shape == (32, 64, 3) and pad == (0, 0)
+    canvas, gain, pad = _letterbox(np.zeros((100, 60, 3), np.uint8), 64, rect=True)
+    assert canvas.shape == (64, 64, 3) and gain == 0.64 and pad == (13, 0)  # 38 px wide -> 64
+
+
+def test_letterbox_keeps_image_at_its_size():
+    img = np.full((32, 32, 3), 7, np.uint8)
+    canvas, gain, pad = _letterbox(img, 32)
+    assert gain == 1 and pad == (0, 0) and (canvas == img).all()
+
+
+def test_strip_letterbox_inverts_the_padding():
+    masks = np.zeros((2, 64, 64), bool)
+    masks[:, 16:48] = True  # The image part of a 100 x 200 image letterboxed to 64
+    stripped = _strip_letterbox(masks, (100, 200))
+    assert stripped.shape == (2, 32, 64) and stripped.all()
+    assert _strip_letterbox(masks[:, :, :], (64, 64)).shape == (2, 64, 64)
+
+
+# --- NMS ---
+def test_nms_suppresses_overlaps_within_a_class():
+    boxes = np.array([[0, 0, 10, 10], [1, 0, 11, 10], [20, 20, 30, 30], [0, 0, 10, 10]], np.float32)
+    scores = np.array([0.8, 0.9, 0.5, 0.7], np.float32)
+    classes = np.array([0, 0, 0, 1])
+    # Box 0 overlaps box 1 (IoU 9/11 > 0.7); box 3 is the same box in another class
+    assert _nms(boxes, scores, classes, NMS_IOU).tolist() == [1, 3, 2]
+    assert _nms(boxes, scores, classes, 0.9).tolist() == [1, 0, 3, 2]
+    assert _nms(np.zeros((0, 4)), np.zeros(0), np.zeros(0, int), NMS_IOU).tolist() == []
+
+
+def test_box_masks_are_cropped_to_their_boxes():
+    protos = np.ones((1, 8, 8), np.float32)
+    boxes = np.array([[2, 3, 5, 7], [2.5, 0, 4, 1.5], [6, 6, 6, 9]], np.float32)
+    masks = _box_masks(np.array([[1.0], [1.0], [1.0]], np.float32), protos, boxes, (8, 8))
+    expected = np.zeros((3, 8, 8), bool)
+    expected[0, 3:7, 2:5] = True
+    expected[1, 0:2, 3:4] = True  # Pixel centres inside the box
+    assert (masks == expected).all()  # Third box is empty
+
+
+def test_box_masks_match_a_full_bilinear_upsample():
+    # Same pixels as cv2.resize (= torch bilinear) of the whole logit map, then cropped
+    rng = np.random.default_rng(0)
+    protos = rng.normal(size=(4, 16, 16)).astype(np.float32)
+    coeffs = rng.normal(size=(5, 4)).astype(np.float32)
+    boxes = np.sort(rng.uniform(0, 64, (5, 2, 2)), axis=1).reshape(5, 4)[:, [0, 2, 1, 3]].astype(np.float32)
+    masks = _box_masks(coeffs, protos, boxes, (64, 64))
+    for i in range(5):
+        logits = cv2.resize(np.tensordot(coeffs[i], protos, axes=1), (64, 64), interpolation=cv2.INTER_LINEAR)
+        x1, y1, x2, y2 = boxes[i]
+        cols, rows = np.arange(64)[None, :], np.arange(64)[:, None]
+        inside = (cols >= x1) & (cols < x2) & (rows >= y1) & (rows < y2)
+        assert (masks[i] == ((logits > 0) & inside)).all()
+
+
+# --- Decode ---
+def test_decode_boxes_scores_and_masks(onnx):
+    protos = np.stack([np.ones((8, 8)), np.zeros((8, 8))]).astype(np.float32)  # nm = 2, 8 x 8 for a 32 x 32 canvas
+    preds = head_output([
+        (8, 8, 8, 8, [0.9], [10, 0]),     # Kept: box 4..12
+        (9, 8, 8, 8, [0.8], [10, 0]),     # Same roof, IoU 0.78 with the first -> suppressed
+        (24, 20, 8, 4, [0.6], [-10, 0]),  # Kept, but its mask is empty (sigmoid(-10))
+        (24, 8, 8, 8, [0.1], [10, 0]),    # Under conf
+    ])
+    boxes, scores, classes, masks = onnx._decode(preds, protos, (32, 32), conf=0.15)
+    np.testing.assert_allclose(boxes, [[4, 4, 12, 12], [20, 18, 28, 22]])
+    np.testing.assert_allclose(scores, [0.9, 0.6])
+    assert classes.tolist() == [0, 0]
+    expected = np.zeros((32, 32), bool)  # Upsampled to the input, like ultralytics
+    expected[4:12, 4:12] = True
+    assert masks.shape == (2, 32, 32) and (masks[0] == expected).all() and not masks[1].any()
+
+
+def test_decode_picks_the_best_class(onnx):
+    protos = np.ones((2, 8, 8), np.float32)
+    preds = head_output([(8, 8, 8, 8, [0.2, 0.7], [1, 0]), (8, 8, 8, 8, [0.6, 0.1], [1, 0])], nc=2)
+    boxes, scores, classes, masks = onnx._decode(preds, protos, (32, 32), conf=0.15)
+    # Same box, different classes: both kept
+    assert classes.tolist() == [1, 0] and scores.tolist() == pytest.approx([0.7, 0.6])
+
+
+def test_detections_map_back_to_the_original_image(onnx):
+    img = np.zeros((16, 32, 3), np.uint8)
+    canvas, gain, pad = _letterbox(img, 32)
+    assert canvas.shape[:2] == (32, 32) and pad == (0, 8)
+    masks = np.zeros((1, 8, 8), bool)
+    masks[0, 3:5, 1:3] = True  # Canvas rows 12..20 = image rows 4..12
+    parts = (np.array([[4, 10, 12, 50]], np.float32), np.array([0.9]), np.array([0]), masks)
+    detections = onnx._to_detections(img, parts, canvas.shape[:2], gain, pad)
+    np.testing.assert_allclose(detections.boxes, [[4, 2, 12, 16]])  # Clipped to the image
+    assert detections.masks.shape == (1, 4, 8) and detections.orig_shape == (16, 32)
+    assert np.argwhere(detections.masks[0]).tolist() == [[1, 1], [1, 2], [2, 1], [2, 2]]
+    assert detections.plot().shape == img.shape
+
+
+def test_merge_flip_unmirrors_and_deduplicates(onnx):
+    masks = np.zeros((1, 8, 8), bool)
+    masks[0, 2:4, 0:2] = True
+    parts = (np.array([[2, 2, 10, 10]], np.float32), np.array([0.8]), np.array([0]), masks)
+    flipped_masks = np.zeros((2, 8, 8), bool)
+    flipped_masks[0, 2:4, 6:8] = True  # The same roof, seen mirrored
+    flipped_masks[1, 6:8, 0:1] = True
+    flipped = (np.array([[22, 2, 30, 10], [0, 24, 4, 32]], np.float32), np.array([0.9, 0.5]), np.array([0, 0]),
+               flipped_masks)
+    boxes, scores, classes, merged = onnx._merge_flip(parts, flipped, canvas_width=32)
+    np.testing.assert_allclose(boxes, [[2, 2, 10, 10], [28, 24, 32, 32]])
+    np.testing.assert_allclose(scores, [0.9, 0.5])  # The mirrored pass won the duplicate
+    assert (merged[0] == masks[0]).all()
+    assert np.argwhere(merged[1]).tolist() == [[6, 7], [7, 7]]
+
+
+# --- Parity with the PyTorch path (needs the real weights) ---
+def _parity_available():
+    modules = all(importlib.util.find_spec(name) for name in ("onnxruntime", "ultralytics"))
+    return modules and os.path.exists(WEIGHTS_PT) and os.path.exists(WEIGHTS_ONNX)
+
+
+def roof_scene(seed):
+    """Satellite-ish test image: light rectangular roofs on a dark textured ground."""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(40, 90, (640, 640, 3), dtype=np.uint8)
+    for _ in range(6):
+        x, y = rng.integers(0, 520, 2)
+        w, h = rng.integers(60, 120, 2)
+        cv2.rectangle(img, (int(x), int(y)), (int(x + w), int(y + h)), [int(c) for c in rng.integers(150, 230, 3)], -1)
+    return img
+
+
+@pytest.mark.skipif(not _parity_available(), reason="needs onnxruntime, ultralytics, best.pt and best.onnx")
+def test_onnx_matches_ultralytics():
+    from services.cv_engine import INFERENCE_PROFILES, SolarVision
+    from services.inference_backends import UltralyticsBackend
+
+    torch_backend, onnx_backend = UltralyticsBackend(), OnnxBackend()
+    vision = SolarVision.__new__(SolarVision)
+    # Single-pass profiles only: ultralytics ignores augment=True for segmentation models
+    profiles = [settings for settings in INFERENCE_PROFILES.values() if not settings["augment"]]
+    for seed in range(3):
+        img = roof_scene(seed)
+        # Same tolerances as benchmarks/check_onnx_parity.py
+        for settings in profiles:
+            expected = torch_backend.predict([img], **settings)[0]
+            got = onnx_backend.predict([img], **settings)[0]
+            areas = [sum(o["estimated_m2"] for o in vision.measure_objects(d, img.shape, 0.3)) for d in (expected, got)]
+            assert areas[1] == pytest.approx(areas[0], rel=0.05, abs=1.0)
+
+            a, b = [cv2.resize(d.masks.any(axis=0).astype(np.uint8), img.shape[1::-1], interpolation=cv2.INTER_NEAREST)
+                    if len(d) else np.zeros(img.shape[:2], np.uint8) for d in (expected, got)]
+            union = np.logical_or(a, b).sum()
+            assert union == 0 or np.logical_and(a, b).sum() / union >= 0.9
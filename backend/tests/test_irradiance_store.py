@@ -0,0 +1,107 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+import pytest
+
+import nasa_standin
+from build_irradiance_grid import build_grid
+from services.irradiance_store import FIELDS, IrradianceStore
+from services.solar_engine import SolarCalculator
+
+
+def expected(lat, lon):
+    values = nasa_standin.climatology(lat, lon)
+    return np.array([values[k] for k in FIELDS], dtype=np.float32)
+
+
+@pytest.fixture
+def standin():
+    server, url = nasa_standin.start()
+    yield url
+    server.shutdown()
+
+
+@pytest.fixture
+def store(grid_path, tmp_path):
+    return IrradianceStore(grid_path=grid_path, cache_path=str(tmp_path / "cache.ndjson"))
+
+
+def test_grid_nodes_and_interpolation(store):
+    np.testing.assert_allclose(store.lookup(7.0, 80.0), expected(7.0, 80.0), atol=1e-4)
+    # The stand-in is linear in lat / lon, so bilinear interpolation is exact between nodes
+    np.testing.assert_allclose(store.lookup(6.9271, 79.8612), expected(6.9271, 79.8612), atol=0.01)
+
+
+def test_grid_lookup_needs_no_network_and_is_fast(store):
+    started = time.perf_counter()
+    for _ in range(1000):
+        assert store.lookup(6.9271, 79.8612) is not None
+    assert (time.perf_counter() - started) / 1000 < 1e-3
+
+
+def test_off_grid_points_are_cached_and_appended(store, tmp_path):
+    assert store.lookup(12.0, 80.0) is None
+    store.remember(12.0, 80.0, expected(12.0, 80.0))
+    store.remember(12.5, 80.0, expected(12.5, 80.0))
+    np.testing.assert_allclose(store.lookup(12.0, 80.0), expected(12.0, 80.0), atol=1e-3)
+
+    lines = (tmp_path / "cache.ndjson").read_text().splitlines()
+    assert len(lines) == 2  # One line per miss, no rewrite
+
+    reloaded = IrradianceStore(grid_path=store.grid_path, cache_path=store.cache_path)
+    np.testing.assert_allclose(reloaded.lookup(12.5, 80.0), expected(12.5, 80.0), atol=1e-3)
+
+
+def test_cache_log_is_compacted_and_bounded(grid_path, tmp_path):
+    path = tmp_path / "cache.ndjson"
+    store = IrradianceStore(grid_path=grid_path, cache_path=str(path), max_entries=3)
+    for i in range(10):
+        store.remember(20.0 + i, 80.0, expected(20.0 + i, 80.0))
+    assert len(path.read_text().splitlines()) <= 2 * 3 + 1
+
+    reloaded = IrradianceStore(grid_path=grid_path, cache_path=str(path), max_entries=3)
+    assert reloaded.lookup(29.0, 80.0) is not None  # Newest kept
+    assert reloaded.lookup(20.0, 80.0) is None      # Oldest evicted
+
+
+def test_expired_entries_are_dropped(grid_path, tmp_path):
+    path = tmp_path / "cache.ndjson"
+    path.write_text(json.dumps({"lat": 12.0, "lon": 80.0, "v": [5.0] * 13, "t": time.time() - 10}) + "\n")
+    assert IrradianceStore(grid_path=grid_path, cache_path=str(path), ttl_seconds=5).lookup(12.0, 80.0) is None
+
+
+def test_missing_grid_is_picked_up_once_built(standin, tmp_path, monkeypatch):
+    monkeypatch.setattr("services.irradiance_store.GRID_RETRY_SECONDS", 0)
+    grid = str(tmp_path / "grid.npz")
+    store = IrradianceStore(grid_path=grid, cache_path=str(tmp_path / "cache.ndjson"))
+    assert store.lookup(7.0, 80.0) is None
+
+    assert build_grid(grid, standin)
+    np.testing.assert_allclose(store.lookup(7.0, 80.0), expected(7.0, 80.0), atol=1e-4)
+
+
+def test_build_grid_saves_nothing_when_offline(tmp_path, monkeypatch):
+    monkeypatch.setattr("build_irradiance_grid.fetch_point", lambda *args: None)  # Every point fails
+    grid = tmp_path / "grid.npz"
+    assert not build_grid(str(grid), "http://127.0.0.1:9/unreachable")
+    assert not grid.exists()
+
+
+def test_calculator_sources(store, standin):
+    calculator = SolarCalculator(store=store)
+    calculator.base_url = standin
+
+    values, source = asyncio.run(calculator.lookup_climatology_async(7.0, 80.0, "Colombo"))
+    assert source == "local"
+
+    values, source = asyncio.run(calculator.lookup_climatology_async(12.0, 80.0, "Colombo"))
+    assert source == "nasa"
+    np.testing.assert_allclose(values, expected(12.0, 80.0), atol=1e-3)
+    assert asyncio.run(calculator.lookup_climatology_async(12.0, 80.0, "Colombo"))[1] == "local"  # Now cached
+
+    calculator.base_url = "http://127.0.0.1:9/unreachable"
+    values, source = asyncio.run(calculator.lookup_climatology_async(13.0, 80.0, "Jaffna"))
+    assert source == "district_fallback"
+    assert values[-1] == pytest.approx(calculator.district_sun_hours["Jaffna"])
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+import pytest
+
+from services.cv_engine import SolarVision
+from services.inference_backends import Detections
+
+IMAGE_SHAPE = (256, 256, 3)
+M_PER_PX = 0.3
+
+
+@pytest.fixture(scope="module")
+def vision():
+    return SolarVision.__new__(SolarVision)  # measure_objects needs no model
+
+
+def detections(rects, scores, size=256):
+    """rects: (x, y, w, h) in image pixels; masks at size x size, cropped to their boxes."""
+    scale = size / IMAGE_SHAPE[0]
+    masks = np.zeros((len(rects), size, size), dtype=bool)
+    for i, (x, y, w, h) in enumerate(rects):
+        masks[i, int(y * scale):int((y + h) * scale), int(x * scale):int((x + w) * scale)] = True
+    boxes = np.array([[x, y, x + w, y + h] for x, y, w, h in rects], dtype=np.float64).reshape(-1, 4)
+    return Detections(masks, boxes, np.asarray(scores, dtype=np.float64), np.zeros(len(rects), int),
+                      {0: "roof"}, IMAGE_SHAPE[:2], None)
+
+
+def reference(result):
+    """Old per-object resize, then pixels given to the most confident instance."""
+    claimed = np.zeros(IMAGE_SHAPE[:2], dtype=bool)
+    areas = {}
+    for i in np.argsort(-result.scores, kind="stable"):
+        mask = cv2.resize(result.masks[i].astype(np.uint8), IMAGE_SHAPE[1::-1], interpolation=cv2.INTER_NEAREST) > 0
+        areas[int(i)] = int(np.count_nonzero(mask & ~claimed))
+        claimed |= mask
+    return [areas[i] for i in range(len(areas))], int(np.count_nonzero(claimed))
+
+
+def test_no_detections(vision):
+    assert vision.measure_objects(detections([], []), IMAGE_SHAPE, M_PER_PX) == []
+
+
+def test_separate_masks_keep_their_area(vision):
+    result = detections([(0, 0, 10, 20), (100, 100, 30, 30)], [0.9, 0.8])
+    objects = vision.measure_objects(result, IMAGE_SHAPE, M_PER_PX)
+    assert [o["id"] for o in objects] == [0, 1]
+    assert [o["pixel_area"] for o in objects] == [200.0, 900.0]
+    assert objects[1]["estimated_m2"] == pytest.approx(900 * M_PER_PX ** 2)
+
+
+def test_overlap_counted_once_for_the_most_confident(vision):
+    # Second mask is more confident: the 10x10 overlap belongs to it
+    result = detections([(0, 0, 20, 20), (10, 10, 20, 20)], [0.5, 0.9])
+    objects = vision.measure_objects(result, IMAGE_SHAPE, M_PER_PX)
+    assert [o["pixel_area"] for o in objects] == [300.0, 400.0]
+    assert sum(o["pixel_area"] for o in objects) == 700.0  # Union, not 800
+
+
+def test_contained_mask_adds_nothing(vision):
+    result = detections([(0, 0, 50, 50), (10, 10, 5, 5)], [0.9, 0.4])
+    objects = vision.measure_objects(result, IMAGE_SHAPE, M_PER_PX)
+    assert [o["pixel_area"] for o in objects] == [2500.0, 0.0]
+
+
+@pytest.mark.parametrize("size", [256, 1024])
+def test_random_masks_match_resize_and_union(vision, size):
+    # 1024 = ultralytics masks at imgsz, downscaled by striding instead of cv2.resize
+    rng = np.random.default_rng(size)
+    for _ in range(20):
+        n = int(rng.integers(1, 30))
+        rects = [(*rng.integers(0, 200, 2), *rng.integers(4, 60, 2)) for _ in range(n)]
+        result = detections(rects, rng.uniform(0.15, 1.0, n), size)
+        objects = vision.measure_objects(result, IMAGE_SHAPE, M_PER_PX)
+        areas, union = reference(result)
+        assert [o["pixel_area"] for o in objects] == areas
+        assert sum(o["pixel_area"] for o in objects) == union
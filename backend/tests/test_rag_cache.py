@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from services.rag_cache import RAGCache, normalize_question, question_numbers
+
+
+def vector(*components):
+    v = np.zeros(8, dtype=np.float32)
+    v[:len(components)] = components
+    return v
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RAGCache(str(tmp_path / "chroma_db"), similarity_threshold=0.93, retrieval_similarity_threshold=0.85)
+
+
+def test_normalize_and_numbers():
+    assert normalize_question("  What is  the Tariff? ") == "what is the tariff"
+    assert question_numbers("Is 5kW enough, or 10.5 kW?") == (5.0, 10.5)
+    assert question_numbers("cost of 1,000 panels") == (1000.0,)
+    assert question_numbers("5kW") == question_numbers("5.0 kW")
+
+
+def test_exact_and_semantic_answers(cache):
+    cache.store_answer("What is the tariff for 5kW?", vector(1, 0.1), "20.90 LKR")
+    assert cache.exact_answer("what is the tariff for 5kW") == "20.90 LKR"
+    assert cache.similar_answer("Tariff for a 5 kW system?", vector(1, 0.12)) == "20.90 LKR"
+    assert cache.similar_answer("Something else", vector(0, 1)) is None
+
+
+def test_semantic_match_needs_the_same_numbers(cache):
+    cache.store_answer("What is the tariff for 5kW?", vector(1, 0.1), "5kW answer")
+    cache.store_answer("What is the tariff for 10kW?", vector(1, 0.11), "10kW answer")
+    # Nearest embedding is the 10kW question, but the numbers pick the 5kW one
+    assert cache.similar_answer("Tariff for 5 kW please", vector(1, 0.109)) == "5kW answer"
+    assert cache.similar_answer("Tariff for 20kW?", vector(1, 0.1)) is None
+
+
+def test_retrieval_reuses_chunks_of_near_queries(cache):
+    cache.store_retrieved(vector(1, 0.1), ["chunk"])
+    assert cache.retrieved(vector(1, 0.1)) == ["chunk"]    # Same embedding
+    assert cache.retrieved(vector(1, 0.4)) == ["chunk"]    # cos ~0.96: near enough for chunks
+    assert cache.retrieved(vector(1, 1)) is None           # cos ~0.77
+    stats = cache.stats()
+    assert (stats["retrieval_hits"], stats["retrieval_misses"]) == (2, 1)
+
+
+def test_clear(cache):
+    cache.store_answer("q", vector(1), "a")
+    cache.store_retrieved(vector(1), ["chunk"])
+    cache.clear()
+    assert cache.exact_answer("q") is None
+    assert cache.similar_answer("q", vector(1)) is None
+    assert cache.retrieved(vector(1)) is None
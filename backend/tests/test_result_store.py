@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from services import result_store as result_store_module
+from services.result_store import ResultStore, cacheable, geohash
+from services.shared_state import try_lock, unlock
+
+LAT, LON = 6.9271, 79.8612
+JPEG = b"\xff\xd8jpeg"
+
+
+def record(area=90.0, source="nasa", warning=None):
+    cv_results = {"objects": [{"id": 0, "estimated_m2": area}]}
+    if warning:
+        cv_results["warning"] = warning
+    return {"cv_results": cv_results, "irradiance": 5.1, "monthly_irradiance": [5.1] * 12,
+            "irradiance_source": source, "roof_area_m2": area, "is_estimated": False}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(path=str(tmp_path / "results.sqlite3"), ttl_seconds=3600)
+
+
+def age(store, seconds):
+    store._db().execute("UPDATE results SET created = created - ?", (seconds,))
+
+
+# --- Keys ---
+def test_geohash_reference_value():
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_key_shared_by_clicks_on_one_roof(store):
+    key = store.key(LAT, LON, "m1", zoom=19, mosaic=1)
+    assert store.key(LAT + 0.00002, LON - 0.00002, "m1", zoom=19, mosaic=1) == key  # ~3 m away
+    assert store.key(LAT + 0.001, LON, "m1", zoom=19, mosaic=1) != key             # ~110 m away
+    assert store.key(LAT, LON, "m1", mosaic=1, zoom=19) == key                     # Settings order
+    assert store.key(LAT, LON, "m2", zoom=19, mosaic=1) != key
+    assert store.key(LAT, LON, "m1", zoom=18, mosaic=1) != key
+
+
+# --- Storage ---
+def test_put_get_roundtrip(store):
+    key = store.key(LAT, LON, "m1")
+    assert store.get(key) is None
+    assert store.put(key, LAT, LON, record(), JPEG)
+    assert store.get(key) == {**record(), "image": JPEG}
+
+
+def test_results_expire_after_ttl(store):
+    key = store.key(LAT, LON, "m1")
+    store.put(key, LAT, LON, record(), JPEG)
+    age(store, 3000)
+    assert store.get(key) is not None
+    age(store, 1000)
+    assert store.get(key) is None
+    assert store.nearby(LAT, LON) == []
+
+
+@pytest.mark.parametrize("rec", [record(source="district_fallback"), record(source=None), record(warning="Cloudy")])
+def test_fallbacks_and_rejected_images_are_not_cached(store, rec):
+    assert not cacheable(rec)
+    key = store.key(LAT, LON, "m1")
+    assert store.put(key, LAT, LON, rec, JPEG) is False
+    assert store.get(key) is None
+    assert store.stats()["results"] == 0
+
+
+def test_old_non_cacheable_rows_are_not_served(store):
+    key = store.key(LAT, LON, "m1")
+    store.put(key, LAT, LON, record(), JPEG)
+    store._db().execute("UPDATE results SET record = ?", (
+        '{"cv_results": {"objects": []}, "irradiance_source": "district_fallback"}',))
+    assert store.get(key) is None
+
+
+def test_put_replaces_the_key(store):
+    key = store.key(LAT, LON, "m1")
+    store.put(key, LAT, LON, record(80.0), JPEG)
+    store.put(key, LAT, LON, record(120.0), JPEG)
+    assert store.get(key)["roof_area_m2"] == 120.0
+    assert [n["roof_area_m2"] for n in store.nearby(LAT, LON)] == [120.0]
+
+
+def test_purge_models_keeps_only_current_and_fresh(store):
+    store.put(store.key(LAT, LON, "old"), LAT, LON, record(), JPEG)
+    store.put(store.key(LAT, LON, "new"), LAT, LON, record(), JPEG)
+    assert store.purge_models("new") == 1
+    assert store.get(store.key(LAT, LON, "old")) is None
+    assert store.get(store.key(LAT, LON, "new")) is not None
+    age(store, 7200)
+    assert store.purge_models("new") == 1
+    assert store.stats()["results"] == 0
+    assert store._db().execute("SELECT COUNT(*) FROM results_rtree").fetchone()[0] == 0
+
+
+def test_nearby_radius_order_and_model(store):
+    for i, (dlat, model) in enumerate([(0.0009, "m1"), (0.0002, "m1"), (0.0002, "m2"), (0.01, "m1")]):
+        store.put(store.key(LAT + dlat, LON, model), LAT + dlat, LON, record(50.0 + i), JPEG)
+    found = store.nearby(LAT, LON, radius_m=500, model="m1")
+    assert [n["roof_area_m2"] for n in found] == [51.0, 50.0]  # ~22 m, ~100 m; ~1.1 km is out
+    assert found[0]["distance_m"] == pytest.approx(0.0002 * 111_320, rel=1e-3)
+    assert len(store.nearby(LAT, LON, radius_m=500)) == 3
+    assert len(store.nearby(LAT, LON, radius_m=500, limit=1)) == 1
+
+
+# --- Coalescing ---
+def test_concurrent_requests_compute_once(store):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return record(), JPEG
+
+    async def scenario():
+        key = store.key(LAT, LON, "m1")
+        first = await asyncio.gather(*[store.get_or_compute(key, LAT, LON, compute) for _ in range(5)])
+        again = await store.get_or_compute(key, LAT, LON, compute)
+        return first, again
+
+    first, again = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(source for _, source in first) == ["coalesced"] * 4 + ["computed"]
+    assert all(result["roof_area_m2"] == 90.0 for result, _ in first)
+    assert again[1] == "cache"
+    assert store.stats()["computing"] == 0
+
+
+def test_nothing_stored_when_compute_gives_nothing(store):
+    async def compute():
+        return None
+
+    key = store.key(LAT, LON, "m1")
+    assert asyncio.run(store.get_or_compute(key, LAT, LON, compute)) == (None, "computed")
+    assert store.stats()["results"] == 0
+
+
+def test_waits_for_another_worker_holding_the_key(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store_module, "LOCK_POLL", 0.01)
+    store.lock_dir = str(tmp_path / "locks")
+    os.makedirs(store.lock_dir)
+    key = store.key(LAT, LON, "m1")
+    path = os.path.join(store.lock_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lock")
+
+    async def compute():
+        raise AssertionError("computed twice")
+
+    async def other_worker():
+        fd = try_lock(path)
+        await asyncio.sleep(0.05)
+        store.put(key, LAT, LON, record(), JPEG)
+        unlock(fd, path)
+
+    async def scenario():
+        worker = asyncio.create_task(other_worker())
+        await asyncio.sleep(0)  # Lock taken first
+        result = await store.get_or_compute(key, LAT, LON, compute)
+        await worker
+        return result
+
+    result, source = asyncio.run(scenario())
+    assert source == "coalesced" and result["image"] == JPEG
+    assert os.listdir(store.lock_dir) == []
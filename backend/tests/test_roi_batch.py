@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from services.roi_batch import json_safe, parse_sites, results_to_csv
+from services.solar_engine import ROI_FIELDS, SERIES_FIELDS, SolarCalculator
+
+
+@pytest.fixture(scope="module")
+def calculator():
+    return SolarCalculator()
+
+
+def sites():
+    # Every branch: no bill, bill under the free units, roof- / phase-limited,
+    # all three export tariffs, tiny roofs (1 kW floor), both connection types
+    rng = np.random.default_rng(7)
+    roofs = [5.0, 40.0, 120.0, 300.0, 2500.0, 12000.0]
+    bills = [0.0, 800.0, 4999.0, 12000.0, 39000.0, 90000.0]
+    rows = [(roof, bill, connection) for roof in roofs for bill in bills for connection in ("Single", "Three")]
+    return {
+        "roof_area_m2": np.array([r[0] for r in rows]),
+        "annual_irradiance": rng.uniform(3.8, 6.2, len(rows)).round(2),
+        "monthly_bill": np.array([r[1] for r in rows]),
+        "loan_rate": rng.choice([6.0, 8.0, 11.5, 16.0], len(rows)),
+        "loan_years": rng.choice([1, 5, 10], len(rows)).astype(np.float64),
+        "connection_type": np.array([r[2] for r in rows]),
+        "lat": rng.uniform(6.0, 9.8, len(rows)),
+    }
+
+
+def test_batch_matches_calculate_roi_bit_for_bit(calculator):
+    inputs = sites()
+    batch = calculator.calculate_roi_batch(**inputs)
+    for i in range(len(inputs["roof_area_m2"])):
+        single = calculator.calculate_roi(
+            float(inputs["roof_area_m2"][i]), float(inputs["annual_irradiance"][i]),
+            monthly_bill=float(inputs["monthly_bill"][i]), loan_rate=float(inputs["loan_rate"][i]),
+            loan_years=int(inputs["loan_years"][i]), connection_type=str(inputs["connection_type"][i]),
+            lat=float(inputs["lat"][i]),
+        )
+        for field in ROI_FIELDS + SERIES_FIELDS:
+            # NaN in the batch = None from calculate_roi
+            assert json_safe(batch[field][i]) == single[field], (i, field)
+
+
+def test_batch_monthly_irradiance_matches(calculator):
+    monthly = [5.3, 6.0, 6.3, 5.9, 5.1, 4.7, 4.8, 5.0, 5.2, 4.9, 4.6, 4.8]
+    single = calculator.calculate_roi(80.0, 5.2, monthly_bill=15000, monthly_irradiance=monthly)
+    batch = calculator.calculate_roi_batch(np.array([80.0, 80.0]), 5.2, monthly_bill=15000, monthly_irradiance=monthly)
+    for field in ROI_FIELDS:
+        assert json_safe(batch[field][1]) == single[field], field
+
+
+def test_parse_sites_csv_defaults_and_errors():
+    body = b"roof_area_m2,annual_irradiance,monthly_bill\n50,5.1,\n80,4.9,12000\n"
+    sites = parse_sites(body, "text/csv")
+    assert sites["count"] == 2
+    assert sites["monthly_bill"].tolist() == [0.0, 12000.0]  # Empty cell -> default
+    assert sites["connection_type"].tolist() == ["Single", "Single"]
+
+    with pytest.raises(ValueError, match="Missing column 'annual_irradiance'"):
+        parse_sites(b'{"roof_area_m2": [50]}', "application/json")
+    with pytest.raises(ValueError, match="Column 'annual_irradiance' has empty values"):
+        parse_sites(b'[{"roof_area_m2": 50}]', "application/json")
+    with pytest.raises(ValueError, match="expected 2"):
+        parse_sites(b'{"roof_area_m2": [1, 2], "annual_irradiance": [5]}', "application/json")
+
+
+def test_results_to_csv_one_row_per_site(calculator):
+    inputs = parse_sites(b'{"sites": [{"roof_area_m2": 50, "annual_irradiance": 5.1}, '
+                         b'{"roof_area_m2": 90, "annual_irradiance": 4.8, "connection_type": "Three"}]}',
+                         "application/json")
+    count = inputs.pop("count")
+    results = calculator.calculate_roi_batch(**inputs)
+    lines = results_to_csv(inputs, results, count).strip().splitlines()
+    assert len(lines) == 3
+    assert lines[0].split(",")[:2] == ["roof_area_m2", "annual_irradiance"]
+
+
+@pytest.mark.parametrize("site, message", [
+    ({"loan_rate": 0}, "loan_rate and loan_years must be greater than 0."),
+    ({"loan_years": 0}, "loan_rate and loan_years must be greater than 0."),
+    ({"loan_years": -3}, "loan_rate and loan_years must be greater than 0."),
+    ({"connection_type": "Two"}, "connection_type must be one of: Single, Three"),
+])
+def test_roi_batch_endpoint_rejects_invalid_sites(app, site, message):
+    from fastapi.testclient import TestClient
+
+    sites = [{"roof_area_m2": 50, "annual_irradiance": 5.1}, {"roof_area_m2": 80, "annual_irradiance": 4.9, **site}]
+    with TestClient(app) as client:
+        response = client.post("/api/roi/batch", json=sites)
+        assert response.status_code == 400 and response.json()["detail"] == message
+        assert client.post("/api/roi/batch", json=sites[:1]).json()["count"] == 1
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from services.image_artifact import ImageArtifact
+from services.result_store import ResultStore
+from services.site_batch import BatchJournal, batch_key, parse_site_list, stream_sites
+
+PHASES = ("Single", "Three")
+SITES = [
+    {"district": "Colombo", "lat": 6.9271, "lon": 79.8612, "bill": 12000},
+    {"district": "Kandy", "lat": 7.2906, "lon": 80.6337, "bill": 8000, "phase": "Three"},
+    {"district": "Galle", "lat": 6.0535, "lon": 80.2210},
+]
+
+
+# --- Parsing ---
+def test_parse_site_list_formats_and_defaults():
+    csv_body = b"district,lat,lon,bill\nColombo,6.9271,79.8612,\nKandy,7.29,80.63,8000\n"
+    sites = parse_site_list(csv_body, "text/csv", PHASES)
+    assert [s["bill"] for s in sites] == [0.0, 8000.0]
+    assert sites[0]["phase"] == "Single" and sites[0]["loan_years"] == 5
+
+    ndjson_body = "\n".join(json.dumps(s) for s in SITES).encode()
+    assert parse_site_list(ndjson_body, "application/x-ndjson", PHASES) == \
+        parse_site_list(json.dumps({"sites": SITES}).encode(), "application/json", PHASES)
+
+
+@pytest.mark.parametrize("rows, message", [
+    ([{"district": "Colombo", "lat": 6.9}], "Site 1: missing 'lon'"),
+    ([{"district": "Colombo", "lat": 0, "lon": 79.8}], "invalid GPS"),
+    ([{"district": "Colombo", "lat": 6.9, "lon": 79.8, "phase": "Two"}], "phase must be one of"),
+    ([], "No sites given"),
+    (SITES, "at most 2 sites"),
+])
+def test_parse_site_list_errors(rows, message):
+    with pytest.raises(ValueError, match=message):
+        parse_site_list(json.dumps(rows).encode(), "application/json", PHASES, max_sites=2)
+
+
+def test_batch_key_depends_on_sites_and_settings():
+    sites = parse_site_list(json.dumps(SITES).encode(), "application/json", PHASES)
+    reordered = [dict(reversed(list(site.items()))) for site in sites]
+    assert batch_key(sites, {"zoom": 19}) == batch_key(reordered, {"zoom": 19})
+    assert batch_key(sites, {"zoom": 19}) != batch_key(sites, {"zoom": 18})
+    assert batch_key(sites, {"zoom": 19}) != batch_key(sites[:2], {"zoom": 19})
+
+
+# --- Journal ---
+def test_journal_replays_finished_sites(tmp_path):
+    journal = BatchJournal("b1", root=str(tmp_path))
+    assert journal.load() == {}
+    journal.append({"index": 2, "status": "success"})
+    journal.append({"index": 0, "status": "success"})
+    with open(journal.path, "a") as f:
+        f.write('{"index": 1, "sta')  # Cut short by a crash
+    assert sorted(BatchJournal("b1", root=str(tmp_path)).load()) == [0, 2]
+
+
+def test_journal_expires(tmp_path):
+    journal = BatchJournal("b1", root=str(tmp_path), ttl_seconds=60)
+    journal.append({"index": 0})
+    old = time.time() - 120
+    os.utime(journal.path, (old, old))
+    assert journal.load() == {}
+
+
+def test_journal_lock_is_exclusive(tmp_path):
+    first, second = BatchJournal("b1", root=str(tmp_path)), BatchJournal("b1", root=str(tmp_path))
+    assert first.lock()
+    assert not second.lock()
+    assert BatchJournal("b2", root=str(tmp_path)).lock()  # Other batches are not blocked
+    first.unlock()
+    first.unlock()  # Idempotent
+    assert not os.path.exists(f"{first.path}.lock")
+    assert second.lock()
+    second.unlock()
+
+
+def test_sweep_keeps_fresh_journals_and_locks(tmp_path):
+    old, fresh = BatchJournal("old", root=str(tmp_path), ttl_seconds=60), BatchJournal("new", root=str(tmp_path))
+    old.append({"index": 0})
+    fresh.append({"index": 0})
+    assert old.lock()
+    past = time.time() - 120
+    os.utime(old.path, (past, past))
+    os.utime(f"{old.path}.lock", (past, past))
+    old.sweep()
+    assert not os.path.exists(old.path)
+    assert os.path.exists(fresh.path)
+    assert os.path.exists(f"{old.path}.lock")  # Still held
+    old.unlock()
+
+
+# --- Pipeline ---
+def test_stream_sites_yields_every_site_and_isolates_failures():
+    groups = []
+
+    async def fetch(site):
+        if site == "bad-fetch":
+            raise ValueError("no tile")
+        await asyncio.sleep(0)
+        return site.upper()
+
+    async def detect(site, fetched):
+        if site == "bad-detect":
+            raise RuntimeError()
+        return fetched + "!"
+
+    def finish(group):
+        groups.append(len(group))
+        return [{"index": index, "status": "success", "value": detected} for index, _, detected in group]
+
+    sites = [(i, f"site{i}") for i in range(40)] + [(40, "bad-fetch"), (41, "bad-detect")]
+
+    async def collect():
+        return [result async for result in stream_sites(sites, fetch, detect, finish, group_size=8)]
+
+    results = {result["index"]: result for result in asyncio.run(collect())}
+    assert sorted(results) == list(range(42))
+    assert results[3] == {"index": 3, "status": "success", "value": "SITE3!"}
+    assert results[40] == {"index": 40, "status": "error", "message": "no tile"}
+    assert results[41] == {"index": 41, "status": "error", "message": "RuntimeError"}
+    assert sum(groups) == 40 and max(groups) <= 8
+
+
+# --- /api/analyze/batch ---
+class FakeVision:
+    model_version = "fake-1"
+
+    def analyze_image(self, image_data, profile=None, georef=None):
+        jpeg = cv2.imencode(".jpg", np.zeros((8, 8, 3), np.uint8))[1].tobytes()
+        return {"objects": [{"id": 0, "pixel_area": 1000.0, "estimated_m2": 90.0}],
+                "annotated_image": ImageArtifact(jpeg=jpeg)}
+
+
+@pytest.fixture
+def batch_api(app, monkeypatch, tmp_path):
+    import main
+
+    async def aget(name):
+        assert name == "vision"
+        return FakeVision()
+
+    fetched, failing = [], set()
+
+    async def fetch_site(http_client, district, lat, lon, mosaic, zoom, upload=None):
+        fetched.append(district)
+        if district in failing:
+            raise ValueError(f"{district} tile server down")
+        return b"image", None, 5.1, [5.1] * 12, "nasa"
+
+    monkeypatch.setattr(main.engines, "aget", aget)
+    monkeypatch.setattr(main, "fetch_site", fetch_site)
+    monkeypatch.setattr(main, "result_store", ResultStore(path=str(tmp_path / "results.sqlite3")))
+    return fetched, failing
+
+
+def run_batch(client, sites=SITES):
+    response = client.post("/api/analyze/batch", content=json.dumps(sites), headers={"content-type": "application/json"})
+    assert response.status_code == 200, response.text
+    header, *lines = [json.loads(line) for line in response.text.splitlines()]
+    return header, lines
+
+
+def test_batch_resumes_from_its_journal(batch_api):
+    import main
+
+    fetched, failing = batch_api
+    failing.add("Kandy")
+    with TestClient(main.app) as client:
+        header, first = run_batch(client)
+        assert header["resumed"] == 0 and header["count"] == 3
+        status = {line["index"]: line["status"] for line in first}
+        assert status == {0: "success", 1: "error", 2: "success"}
+        assert not os.path.exists(os.path.join("data", "batches", f"{header['batch_id']}.ndjson.lock"))
+
+        # Same sites again: the two finished ones are replayed as they were, only Kandy runs
+        failing.clear()
+        fetched.clear()
+        header, second = run_batch(client)
+        assert header["resumed"] == 2
+        assert second[:2] == sorted([line for line in first if line["status"] == "success"], key=lambda r: r["index"])
+        assert second[2]["index"] == 1 and second[2]["status"] == "success"
+        assert second[2]["financial_report"]["tariff_rate"] == 20.9
+        assert fetched == ["Kandy"]
+
+        fetched.clear()
+        header, third = run_batch(client)
+        assert header["resumed"] == 3 and fetched == []
+        assert [line["index"] for line in third] == [0, 1, 2]
+
+
+def test_batch_already_running_is_rejected(batch_api):
+    import main
+
+    sites = parse_site_list(json.dumps(SITES[:1]).encode(), "application/json", PHASES)
+    batch_id = batch_key(sites, {"profile": main.DEFAULT_PROFILE, "zoom": main.DEFAULT_ZOOM, "mosaic": main.MOSAIC_GRID})
+    running = BatchJournal(batch_id)
+    assert running.lock()  # Another worker is on it
+    with TestClient(main.app) as client:
+        response = client.post("/api/analyze/batch", json=SITES[:1])
+        assert response.status_code == 409
+        running.unlock()
+        header, lines = run_batch(client, SITES[:1])
+    assert header["batch_id"] == batch_id and lines[0]["status"] == "success"
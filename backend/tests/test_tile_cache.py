@@ -0,0 +1,139 @@
+import asyncio
+import os
+
+import pytest
+
+from services.tile_cache import TileCache
+
+
+def blob_files(root):
+    return sorted(os.path.join(path, name) for path, _, files in os.walk(os.path.join(root, "blobs")) for name in files)
+
+
+def test_get_put_and_identical_tiles_stored_once(tmp_path):
+    cache = TileCache(root=str(tmp_path), max_bytes=10_000)
+    assert cache.get(19, 1, 2) is None
+    cache.put(19, 1, 2, b"a" * 100)
+    cache.put(19, 1, 3, b"a" * 100)  # Same bytes (e.g. "no imagery" placeholder)
+    assert cache.get(19, 1, 2) == b"a" * 100
+    assert cache.stats() == {"tiles": 2, "blobs": 1, "bytes": 100, "hits": 1, "misses": 1}
+    assert len(blob_files(str(tmp_path))) == 1
+
+
+def test_replacing_a_tile_frees_its_old_blob(tmp_path):
+    cache = TileCache(root=str(tmp_path), max_bytes=10_000)
+    cache.put(19, 1, 2, b"old" * 10)
+    cache.put(19, 1, 2, b"new" * 20)
+    assert cache.get(19, 1, 2) == b"new" * 20
+    assert cache.stats()["bytes"] == 60
+    assert len(blob_files(str(tmp_path))) == 1
+
+
+def test_least_recently_used_tiles_are_evicted(tmp_path):
+    cache = TileCache(root=str(tmp_path), max_bytes=300)
+    for x in range(3):
+        cache.put(19, x, 0, bytes([x]) * 100)
+    cache._db().execute("UPDATE tiles SET used = used - 3600 WHERE key = '19/0/0'")  # Oldest
+    cache._db().execute("UPDATE tiles SET used = used - 60 WHERE key != '19/0/0'")
+    assert cache.get(19, 0, 0) is not None  # Hit refreshes it: 19/1/0 is now the oldest
+    cache.put(19, 3, 0, b"\x03" * 100)
+    assert cache.get(19, 1, 0) is None
+    assert cache.get(19, 0, 0) is not None and cache.get(19, 3, 0) is not None
+    assert cache.stats()["bytes"] == 300
+    assert len(blob_files(str(tmp_path))) == 3
+
+
+def test_index_shared_by_separate_instances(tmp_path):
+    # serve.py workers each have their own TileCache on the same directory
+    first, second = TileCache(root=str(tmp_path), max_bytes=200), TileCache(root=str(tmp_path), max_bytes=200)
+    first.put(19, 0, 0, b"a" * 100)
+    second.put(19, 1, 0, b"b" * 100)
+    first.put(19, 2, 0, b"c" * 100)
+    assert second.get(19, 2, 0) == b"c" * 100
+    assert second.stats()["bytes"] == 200 and second.stats()["tiles"] == 2
+
+
+def test_missing_blob_is_a_miss(tmp_path):
+    cache = TileCache(root=str(tmp_path), max_bytes=10_000)
+    cache.put(19, 1, 2, b"x" * 50)
+    os.remove(blob_files(str(tmp_path))[0])
+    assert cache.get(19, 1, 2) is None
+    assert cache.stats()["tiles"] == 0 and cache.stats()["bytes"] == 0
+
+
+
+# --- Coalesced downloads (services/image_fetcher.py) ---
+@pytest.fixture
+def fetcher(tmp_path, monkeypatch):
+    """image_fetcher with an empty cache and a stub download that waits for `release`."""
+    from services import image_fetcher
+
+    state = {"downloads": 0, "error": None}
+
+    async def download(zoom, xtile, ytile, client):
+        state["downloads"] += 1
+        await state["release"].wait()
+        if state["error"]:
+            raise state["error"]
+        return b"tile %d/%d/%d" % (zoom, xtile, ytile)
+
+    monkeypatch.setattr(image_fetcher, "tile_cache", TileCache(root=str(tmp_path), max_bytes=10_000))
+    monkeypatch.setattr(image_fetcher, "_download_tile_async", download)
+    return image_fetcher, state
+
+
+async def settle():
+    for _ in range(20):  # Let every caller reach the shared download (cache lookups run on threads)
+        await asyncio.sleep(0.01)
+
+
+def test_concurrent_fetches_share_one_download(fetcher):
+    image_fetcher, state = fetcher
+
+    async def scenario():
+        state["release"] = asyncio.Event()
+        calls = [asyncio.ensure_future(image_fetcher.fetch_tile_async(19, 1, 2, client=object())) for _ in range(10)]
+        await settle()
+        state["release"].set()
+        return await asyncio.gather(*calls)
+
+    assert asyncio.run(scenario()) == [b"tile 19/1/2"] * 10
+    assert state["downloads"] == 1
+    assert image_fetcher._inflight_async == {}
+    assert image_fetcher.tile_cache.get(19, 1, 2) == b"tile 19/1/2"
+
+
+def test_cancelled_leader_does_not_fail_the_others(fetcher):
+    image_fetcher, state = fetcher
+
+    async def scenario():
+        state["release"] = asyncio.Event()
+        leader = asyncio.ensure_future(image_fetcher.fetch_tile_async(19, 1, 2, client=object()))
+        await settle()
+        waiter = asyncio.ensure_future(image_fetcher.fetch_tile_async(19, 1, 2, client=object()))
+        await settle()
+        leader.cancel()  # Client disconnected
+        await asyncio.sleep(0)
+        state["release"].set()
+        return leader, await waiter
+
+    leader, data = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert data == b"tile 19/1/2" and state["downloads"] == 1
+    assert image_fetcher.tile_cache.get(19, 1, 2) == b"tile 19/1/2"  # Still stored
+
+
+def test_download_errors_reach_every_waiter(fetcher):
+    image_fetcher, state = fetcher
+    state["error"] = RuntimeError("disk on fire")
+
+    async def scenario():
+        state["release"] = asyncio.Event()
+        calls = [asyncio.ensure_future(image_fetcher.fetch_tile_async(19, 1, 2, client=object())) for _ in range(3)]
+        await settle()
+        state["release"].set()
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(r) for r in results] == [RuntimeError] * 3
+    assert state["downloads"] == 1 and image_fetcher._inflight_async == {}
@@ -127,7 +127,7 @@ function App() {
                 <InsightsResultsSection result={result} />
                 <VisualAnalysisPanel 
                   originalImage={originalImage} 
-                  annotatedImage={result.roof_analysis.annotated_image} 
+                  annotatedImage={result.roof_analysis.annotated_image_url} 
                   detectionCount={result.roof_analysis.detection_count}
                 />
                 <ReportExportSection
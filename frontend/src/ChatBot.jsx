@@ -32,14 +32,55 @@ const ChatBot = () => {
     setInput("");
     setLoading(true);
 
+    // Tokens are appended to this bubble as they arrive (Server-Sent Events)
+    let reply = "";
+    const showReply = (content) => setMessages([...newHistory, { role: 'bot', content }]);
+
     try {
-      const response = await axios.post('http://127.0.0.1:8000/api/chat', {
-        message: input,
-        history: newHistory
+      const response = await fetch('http://127.0.0.1:8000/api/chat/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message: input, history: newHistory })
       });
-      setMessages([...newHistory, { role: 'bot', content: response.data.reply }]);
+      if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        // Events are separated by a blank line; the last piece may be incomplete
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        for (const event of events) {
+          const data = event.split("\n").find((line) => line.startsWith("data: "));
+          if (!data) continue; // ": stream open" keep-alive comment
+          const payload = JSON.parse(data.slice(6));
+          if (payload.token) {
+            reply += payload.token;
+            setLoading(false); // First token: swap "Thinking..." for the answer
+            showReply(reply);
+          } else if (payload.error) {
+            reply += (reply ? "\n" : "") + payload.error;
+            showReply(reply);
+          }
+        }
+      }
+      if (!reply) showReply("Connection error. Please try again.");
     } catch (error) {
-      setMessages([...newHistory, { role: 'bot', content: "Connection error. Please try again." }]);
+      if (reply) return; // Stream broke mid-answer: keep what arrived
+      // Fall back to the one-shot endpoint (e.g. a proxy that blocks streaming)
+      try {
+        const response = await axios.post('http://127.0.0.1:8000/api/chat', {
+          message: input,
+          history: newHistory
+        });
+        showReply(response.data.reply);
+      } catch (fallbackError) {
+        showReply(reply || "Connection error. Please try again.");
+      }
     } finally {
       setLoading(false);
     }
@@ -34,7 +34,7 @@ const VisualAnalysisPanel = ({ originalImage, annotatedImage, detectionCount })
           </h3>
           <div className="img-wrapper">
             {annotatedImage ? (
-              <img src={`data:image/jpeg;base64,${annotatedImage}`} alt="AI Analyzed Rooftop" />
+              <img src={annotatedImage} alt="AI Analyzed Rooftop" />
             ) : (
               <div className="no-image">Running Analysis...</div>
             )}